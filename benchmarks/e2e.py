@@ -0,0 +1,139 @@
+"""End-to-end benchmark of the coordinator and N workers against a local stub site.
+
+The stub site and each WorkerClient run in their own processes; the
+coordinator runs in this process so its CPU time and memory can be
+measured. Reports URLs/sec, p50/p99 task latency (enqueue to result),
+coordinator CPU seconds and peak RSS.
+
+    python -m benchmarks.e2e --workers 4 --tasks 2000 --latency 0.02
+    python -m benchmarks.e2e --rate 200   # open loop: enqueue 200 URLs/sec
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import threading
+import time
+from benchmarks.stub_server import StubSite
+from src.coordinator_server import CoordinatorServer
+from src.worker.metrics import resource_usage
+
+
+def run_stub(options, ready):
+    site = StubSite(page_size=options['page_size'], latency=options['latency'],
+                    jitter=options['jitter'], error_rate=options['error_rate'])
+    ready.put(site.base_url)
+    site.server.serve_forever()
+
+
+def run_worker(port, max_concurrency):
+    from src.worker_client import WorkerClient
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        worker = WorkerClient('127.0.0.1', port, 'benchmark', timeout=10,
+                              max_concurrency=max_concurrency, poll_wait=1,
+                              heartbeat_interval=1)
+        worker.start()
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def enqueue(coordinator, urls, rate):
+    if not rate:
+        coordinator.add_tasks(urls)
+        return
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    for i, url in enumerate(urls):
+        delay = start + i * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        coordinator.add_task(url)
+
+
+def run(args):
+    ready = multiprocessing.Queue()
+    stub = multiprocessing.Process(target=run_stub, daemon=True, args=({
+        'page_size': args.page_size, 'latency': args.latency,
+        'jitter': args.jitter, 'error_rate': args.error_rate}, ready))
+    stub.start()
+    base_url = ready.get(timeout=10)
+    urls = [f"{base_url}/page/{i}" for i in range(args.tasks)]
+
+    workers = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        coordinator = CoordinatorServer(host='127.0.0.1', port=args.port)
+        coordinator.start()
+        try:
+            for _ in range(args.workers):
+                worker = multiprocessing.Process(target=run_worker, daemon=True,
+                                                 args=(args.port, args.concurrency))
+                worker.start()
+                workers.append(worker)
+
+            deadline = time.monotonic() + 10
+            while len(coordinator.worker_registry) < args.workers and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+            cpu_start = time.process_time()
+            started = time.perf_counter()
+            feeder = threading.Thread(target=enqueue, args=(coordinator, urls, args.rate), daemon=True)
+            feeder.start()
+
+            peak_rss = 0.0
+            deadline = time.monotonic() + args.max_seconds
+            while len(coordinator.completed_tasks) < args.tasks and time.monotonic() < deadline:
+                peak_rss = max(peak_rss, resource_usage()['rss_mb'] or 0.0)
+                time.sleep(0.05)
+
+            elapsed = time.perf_counter() - started
+            cpu = time.process_time() - cpu_start
+            finished = list(coordinator.completed_tasks.values())
+        finally:
+            coordinator.stop()
+            for worker in workers:
+                worker.terminate()
+            stub.terminate()
+
+    latencies = [(t.completed_at - t.created_at).total_seconds() for t in finished]
+    failed = sum(1 for t in finished if t.status == 'failed')
+    return {
+        'completed': len(finished),
+        'failed': failed,
+        'elapsed': elapsed,
+        'urls_per_sec': len(finished) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'coordinator_cpu_s': cpu,
+        'coordinator_peak_rss_mb': peak_rss
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8, help="max_concurrency per worker")
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="enqueue rate in URLs/sec, 0 for all at once")
+    parser.add_argument("--page-size", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=6300)
+    parser.add_argument("--max-seconds", type=float, default=300)
+    args = parser.parse_args()
+
+    report = run(args)
+    print(f"completed      {report['completed']} ({report['failed']} failed) in {report['elapsed']:.2f}s")
+    print(f"throughput     {report['urls_per_sec']:.1f} URLs/sec")
+    print(f"task latency   p50 {report['p50_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms")
+    print(f"coordinator    {report['coordinator_cpu_s']:.2f} CPU s, peak RSS {report['coordinator_peak_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
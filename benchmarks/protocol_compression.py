@@ -0,0 +1,69 @@
+"""Bytes on the wire and CPU cost of frame compression.
+
+Builds submit_result messages whose results grow from the current three
+counts to large extractions and encodes/decodes each with every codec.
+
+    python -m benchmarks.protocol_compression
+"""
+import argparse
+import socket
+import time
+from src.utils.network import encode_frame, read_frame, supported_codecs
+
+
+def make_result(fields):
+    """A submit_result message with `fields` extracted items"""
+    return {
+        "action": "submit_result",
+        "worker_id": "3f3b6ed9-fb6a-43b0-923d-c681ee932ca2",
+        "task_id": "7f5117a1-3440-476c-a055-8902ff7d3f8e",
+        "result": {
+            "title": "Welcome | The YatraTrip",
+            "links": [f"https://example.com/section/{i}/article-{i * 7}" for i in range(fields)],
+            "images": [f"https://cdn.example.com/img/{i}.jpg" for i in range(fields // 4)],
+            "text": " ".join(f"word{i % 300}" for i in range(fields * 5))
+        },
+        "error": None
+    }
+
+
+def measure(message, codec, rounds):
+    left, right = socket.socketpair()
+    try:
+        frame = encode_frame(message, codec, threshold=0)
+        start = time.process_time()
+        for _ in range(rounds):
+            frame = encode_frame(message, codec, threshold=0)
+        encode_us = (time.process_time() - start) / rounds * 1e6
+
+        start = time.process_time()
+        for _ in range(rounds):
+            left.sendall(frame)
+            read_frame(right, codec=codec)
+        decode_us = (time.process_time() - start) / rounds * 1e6
+        return len(frame), encode_us, decode_us
+    finally:
+        left.close()
+        right.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10, 100, 1000])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    codecs = [None] + supported_codecs()
+    print(f"{'fields':>6} {'codec':>6} {'bytes':>9} {'ratio':>6} {'encode us':>10} {'decode us':>10}")
+    for fields in args.sizes:
+        message = make_result(fields)
+        raw_size = None
+        for codec in codecs:
+            size, encode_us, decode_us = measure(message, codec, args.rounds)
+            raw_size = raw_size or size
+            print(f"{fields:>6} {codec or 'none':>6} {size:>9} {size / raw_size:>6.2f} "
+                  f"{encode_us:>10.1f} {decode_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
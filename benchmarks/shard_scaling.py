@@ -0,0 +1,121 @@
+"""Dispatch throughput of 1..N coordinator shards on one machine.
+
+Each shard runs in its own process. URLs for many synthetic domains are
+ingested through ShardRouter, then fake workers (no fetching) lease and
+submit tasks against their shard as fast as they can. Throughput should
+grow close to linearly with the shard count as long as there are enough
+CPU cores for the shards and workers.
+
+    python -m benchmarks.shard_scaling --shards 1 2 4 --tasks 20000
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import time
+from src.coordinator.sharding import ShardRouter
+from src.utils.network import MessageClient
+
+
+def run_shard(shards, index, ready):
+    from src.coordinator_server import CoordinatorServer
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        coordinator = CoordinatorServer(host=shards[index]['host'], port=shards[index]['port'],
+                                        shards=shards, shard_index=index)
+        coordinator.start()
+        ready.set()
+        while True:
+            time.sleep(1)
+
+
+def run_fake_worker(shard, worker_id, batch, results):
+    client = MessageClient(host=shard['host'], port=shard['port'])
+    client.connect()
+    client.send_message({"action": "register", "worker_id": worker_id})
+
+    done = 0
+    while True:
+        response = client.send_message({
+            "action": "get_task",
+            "worker_id": worker_id,
+            "max_tasks": batch
+        })
+        if not response.get("has_task"):
+            break
+        for task in response["tasks"]:
+            client.send_message({
+                "action": "submit_result",
+                "worker_id": worker_id,
+                "task_id": task['id'],
+                "result": {"title": "synthetic", "links": 0, "images": 0},
+                "error": None
+            })
+            done += 1
+    client.disconnect()
+    results.put(done)
+
+
+def measure(num_shards, num_tasks, workers_per_shard, batch, base_port):
+    shards = [{"host": "127.0.0.1", "port": base_port + i} for i in range(num_shards)]
+    processes = []
+    for index in range(num_shards):
+        ready = multiprocessing.Event()
+        process = multiprocessing.Process(target=run_shard, args=(shards, index, ready), daemon=True)
+        process.start()
+        ready.wait(10)
+        processes.append(process)
+
+    try:
+        router = ShardRouter(shards)
+        urls = [f"http://site{i % 5000}.example/page/{i}" for i in range(num_tasks)]
+        for start in range(0, len(urls), 1000):
+            router.add_tasks(urls[start:start + 1000])
+        router.close()
+
+        results = multiprocessing.Queue()
+        workers = []
+        for index, shard in enumerate(shards):
+            for n in range(workers_per_shard):
+                worker = multiprocessing.Process(
+                    target=run_fake_worker,
+                    args=(shard, f"bench-{index}-{n}", batch, results))
+                workers.append(worker)
+
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        completed = sum(results.get() for _ in workers)
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+        return completed, elapsed
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument("--workers-per-shard", type=int, default=2)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--base-port", type=int, default=6100)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs available")
+    print(f"{'shards':>6} {'tasks':>8} {'seconds':>8} {'tasks/s':>10} {'speedup':>8}")
+    baseline = None
+    for num_shards in args.shards:
+        completed, elapsed = measure(num_shards, args.tasks, args.workers_per_shard,
+                                     args.batch, args.base_port)
+        rate = completed / elapsed
+        baseline = baseline or rate
+        print(f"{num_shards:>6} {completed:>8} {elapsed:>8.2f} {rate:>10.0f} {rate / baseline:>7.2f}x")
+        args.base_port += num_shards
+
+
+if __name__ == "__main__":
+    main()
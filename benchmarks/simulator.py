@@ -0,0 +1,270 @@
+"""Capacity test of one CoordinatorServer driven by simulated workers.
+
+Thousands of fake workers run as asyncio tasks in one or more child
+processes and speak the real protocol: length-prefixed pickled frames
+tagged with a request_id, register, heartbeat, long-polling get_task and
+submit_result. Instead of fetching, a task sleeps for a synthetic fetch
+time and may fail. Both are derived from the seed and the URL, so every
+run sees the same workload. The coordinator runs in this process so its
+CPU time and memory can be measured. Reports dispatch throughput,
+request round trips, task latency and coordinator resource use.
+
+    python -m benchmarks.simulator --workers 2000 --tasks 50000 --fetch-time 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import random
+import threading
+import time
+import zlib
+from src.coordinator_server import CoordinatorServer
+from src.utils.network import encode_frame, COMPRESSED_FLAG
+from src.worker.metrics import resource_usage
+
+
+def task_outcome(url, options):
+    """(fetch seconds, failed) for a URL; the same for every run with the same seed"""
+    rng = random.Random(zlib.crc32(url.encode('utf-8')) ^ options['seed'])
+    delay = options['fetch_time'] + rng.random() * options['jitter']
+    return delay, rng.random() < options['failure_rate']
+
+
+def task_urls(options):
+    return [f"http://site{i % options['hosts']}.sim/page/{i}" for i in range(options['tasks'])]
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class SimulatedConnection:
+    """One connection to the coordinator; responses are matched to requests by request_id"""
+    def __init__(self, reader, writer, timings):
+        self.reader = reader
+        self.writer = writer
+        self.timings = timings  # action -> list of round trip seconds
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.reader_task = asyncio.ensure_future(self._read_responses())
+
+    @classmethod
+    async def open(cls, host, port, timings):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, timings)
+
+    async def _read_responses(self):
+        try:
+            while True:
+                header = await self.reader.readexactly(4)
+                # Compression is never offered, so frames are plain pickles
+                length = int.from_bytes(header, byteorder='big') & ~COMPRESSED_FLAG
+                message = pickle.loads(await self.reader.readexactly(length))
+                future = self.pending.pop(message.pop('request_id', None), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Connection to coordinator lost"))
+        self.pending.clear()
+
+    async def request(self, message):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        start = time.perf_counter()
+        self.writer.write(encode_frame(dict(message, request_id=request_id)))
+        response = await future
+        self.timings.setdefault(message['action'], []).append(time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self.reader_task.cancel()
+        self.writer.close()
+
+
+async def fake_worker(worker_id, options, timings, stop):
+    """Lease, 'fetch' and submit like WorkerClient, until stop is set"""
+    connection = await SimulatedConnection.open(options['host'], options['port'], timings)
+    concurrency = options['concurrency']
+    free = concurrency
+    slot_freed = asyncio.Event()
+    running = set()
+
+    async def run(task):
+        nonlocal free
+        delay, failed = task_outcome(task['url'], options)
+        await asyncio.sleep(delay)
+        await connection.request({
+            "action": "submit_result",
+            "worker_id": worker_id,
+            "task_id": task['id'],
+            "result": None if failed else {"title": "simulated", "links": 0, "images": 0},
+            "error": "HTTP error 500" if failed else None
+        })
+        free += 1
+        slot_freed.set()
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(options['heartbeat_interval'])
+            await connection.request({"action": "heartbeat", "worker_id": worker_id,
+                                      "concurrency_limit": concurrency,
+                                      "in_flight": concurrency - free, "free_slots": free})
+
+    try:
+        await connection.request({"action": "register", "worker_id": worker_id})
+        heartbeats = asyncio.ensure_future(heartbeat())
+        while not stop.is_set():
+            if not free:
+                slot_freed.clear()
+                await slot_freed.wait()
+            response = await connection.request({"action": "get_task", "worker_id": worker_id,
+                                                 "max_tasks": free, "wait": options['poll_wait']})
+            for task in response.get("tasks") or []:
+                free -= 1
+                future = asyncio.ensure_future(run(task))
+                running.add(future)
+                future.add_done_callback(running.discard)
+        heartbeats.cancel()
+        if running:
+            await asyncio.wait(running)
+    finally:
+        connection.close()
+
+
+async def run_fleet_async(options, worker_ids, stop):
+    timings = {}
+    outcomes = await asyncio.gather(*(fake_worker(worker_id, options, timings, stop)
+                                      for worker_id in worker_ids), return_exceptions=True)
+    errors = [repr(outcome) for outcome in outcomes if isinstance(outcome, BaseException)]
+    return timings, errors
+
+
+def run_fleet(options, worker_ids, stop, results):
+    """Child process entry point running a share of the fake workers"""
+    results.put(asyncio.run(run_fleet_async(options, worker_ids, stop)))
+
+
+def run(options):
+    """Run one simulation; options as produced by the command line, returns the report"""
+    options = dict(options)
+    urls = task_urls(options)
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    fleets = []
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        coordinator = CoordinatorServer(host=options['host'], port=options['port'])
+        coordinator.start()
+        options['port'] = coordinator.socket.getsockname()[1]
+        try:
+            baseline_rss = resource_usage()['rss_mb'] or 0.0
+            connect_start = time.perf_counter()
+            worker_ids = [f"sim-{i}" for i in range(options['workers'])]
+            for index in range(options['processes']):
+                fleet = multiprocessing.Process(target=run_fleet, daemon=True, args=(
+                    options, worker_ids[index::options['processes']], stop, results))
+                fleet.start()
+                fleets.append(fleet)
+
+            deadline = time.monotonic() + options['max_seconds']
+            while len(coordinator.worker_registry) < options['workers'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            connect_time = time.perf_counter() - connect_start
+
+            cpu_start = time.process_time()
+            started = time.perf_counter()
+            coordinator.add_tasks(urls)
+            peak_rss = baseline_rss
+            while len(coordinator.completed_tasks) < len(urls) and time.monotonic() < deadline:
+                peak_rss = max(peak_rss, resource_usage()['rss_mb'] or 0.0)
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - started
+            cpu = time.process_time() - cpu_start
+            threads = threading.active_count()
+            finished = list(coordinator.completed_tasks.values())
+
+            stop.set()
+            timings, errors = {}, []
+            for _ in fleets:
+                fleet_timings, fleet_errors = results.get(timeout=options['poll_wait'] + 30)
+                for action, values in fleet_timings.items():
+                    timings.setdefault(action, []).extend(values)
+                errors.extend(fleet_errors)
+        finally:
+            stop.set()
+            coordinator.stop()
+            for fleet in fleets:
+                fleet.join(5)
+                if fleet.is_alive():
+                    fleet.terminate()
+
+    latencies = [(t.completed_at - t.created_at).total_seconds() for t in finished]
+    lease_rtts = timings.get('get_task', [])
+    submit_rtts = timings.get('submit_result', [])
+    return {
+        'workers': len(coordinator.worker_registry),
+        'connect_s': connect_time,
+        'completed': len(finished),
+        'failed': sum(1 for t in finished if t.status == 'failed'),
+        'elapsed': elapsed,
+        'tasks_per_sec': len(finished) / elapsed,
+        'lease_p50_ms': percentile(lease_rtts, 0.50) * 1000,
+        'lease_p99_ms': percentile(lease_rtts, 0.99) * 1000,
+        'submit_p50_ms': percentile(submit_rtts, 0.50) * 1000,
+        'submit_p99_ms': percentile(submit_rtts, 0.99) * 1000,
+        'task_p50_ms': percentile(latencies, 0.50) * 1000,
+        'task_p99_ms': percentile(latencies, 0.99) * 1000,
+        'coordinator_cpu_s': cpu,
+        'coordinator_threads': threads,
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss,
+        'errors': errors
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=1, help="child processes sharing the fake workers")
+    parser.add_argument("--concurrency", type=int, default=4, help="tasks in flight per fake worker")
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument("--hosts", type=int, default=100, help="distinct hosts in the synthetic URLs")
+    parser.add_argument("--fetch-time", type=float, default=0.05, help="synthetic fetch seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="up to this many extra seconds per fetch")
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--poll-wait", type=float, default=1)
+    parser.add_argument("--heartbeat-interval", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--max-seconds", type=float, default=300)
+    return vars(parser.parse_args(argv))
+
+
+def main():
+    report = run(parse_args())
+    print(f"workers        {report['workers']} connected in {report['connect_s']:.2f}s")
+    print(f"completed      {report['completed']} ({report['failed']} failed) in {report['elapsed']:.2f}s")
+    print(f"throughput     {report['tasks_per_sec']:.1f} tasks/sec")
+    print(f"get_task       p50 {report['lease_p50_ms']:.1f} ms, p99 {report['lease_p99_ms']:.1f} ms")
+    print(f"submit_result  p50 {report['submit_p50_ms']:.1f} ms, p99 {report['submit_p99_ms']:.1f} ms")
+    print(f"task latency   p50 {report['task_p50_ms']:.1f} ms, p99 {report['task_p99_ms']:.1f} ms")
+    print(f"coordinator    {report['coordinator_cpu_s']:.2f} CPU s, {report['coordinator_threads']} threads, "
+          f"RSS {report['baseline_rss_mb']:.1f} -> {report['peak_rss_mb']:.1f} MB")
+    if report['errors']:
+        print(f"worker errors  {len(report['errors'])}, first: {report['errors'][0]}")
+
+
+if __name__ == "__main__":
+    main()
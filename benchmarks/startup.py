@@ -0,0 +1,84 @@
+"""Cold-start benchmark of the worker entry point.
+
+Measures, in fresh interpreters, how long `import src.worker_client`
+takes, then starts `python -m src.worker_client` against a coordinator
+in this process and reports the time until it registers, leases its
+first task and returns its first result. requests and BeautifulSoup are
+loaded in the background after the worker connects, so on a single core
+the first result still pays for importing them. Exits non-zero when the
+import exceeds its budget.
+
+    python -m benchmarks.startup --repeat 5
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.stub_server import StubSite
+from src.coordinator_server import CoordinatorServer
+
+# Importing the worker module should not pull in the fetch and parse libraries
+IMPORT_BUDGET = 0.25
+MEASURE_IMPORT = ("import time; start = time.perf_counter(); import src.worker_client; "
+                  "print(time.perf_counter() - start)")
+
+
+def import_time():
+    """Seconds to import the worker module in a fresh interpreter"""
+    output = subprocess.run([sys.executable, '-c', MEASURE_IMPORT], check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.split()[-1])
+
+
+def time_to_first_result(port):
+    """Seconds until a new worker process registers, leases its first task and returns its result"""
+    site = StubSite(latency=0)
+    site.start()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        coordinator = CoordinatorServer(host='127.0.0.1', port=port)
+        coordinator.start()
+        coordinator.add_task(site.urls(1)[0])
+        env = dict(os.environ, SCRAPER_COORDINATOR_HOST='127.0.0.1', SCRAPER_COORDINATOR_PORT=str(port),
+                   SCRAPER_SHARDS='[]', SCRAPER_DNS_CACHE_TTL='0')
+        started = time.perf_counter()
+        worker = subprocess.Popen([sys.executable, '-m', 'src.worker_client'], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        registered = leased = None
+        try:
+            deadline = time.monotonic() + 30
+            while not coordinator.completed_tasks and time.monotonic() < deadline:
+                if registered is None and coordinator.worker_registry:
+                    registered = time.perf_counter() - started
+                if leased is None and coordinator.queue.active_count():
+                    leased = time.perf_counter() - started
+                time.sleep(0.002)
+            finished = time.perf_counter() - started
+        finally:
+            worker.kill()
+            worker.wait()
+            coordinator.stop()
+            site.stop()
+    return registered, leased or finished, finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=6400)
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.repeat)]
+    runs = [time_to_first_result(args.port + i) for i in range(args.repeat)]
+    median_import = statistics.median(imports)
+    print(f"import         median {median_import * 1000:.1f} ms (budget {IMPORT_BUDGET * 1000:.0f} ms)")
+    for index, label in enumerate(('registered', 'first lease', 'first result')):
+        print(f"{label:<14} median {statistics.median(run[index] for run in runs) * 1000:.1f} ms after spawn")
+    if median_import > IMPORT_BUDGET:
+        sys.exit("Worker import is over budget")
+
+
+if __name__ == "__main__":
+    main()
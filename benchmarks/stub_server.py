@@ -0,0 +1,115 @@
+"""Local HTTP server serving synthetic pages for offline benchmarks and tests.
+
+Every path returns a deterministic HTML page of roughly `page_size`
+bytes with `links` anchors and `images` images. Responses are delayed by
+`latency` seconds (plus up to `jitter`) and a seeded `error_rate`
+fraction of paths answer 500.
+
+    python -m benchmarks.stub_server --port 8000 --latency 0.05
+"""
+import argparse
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubSite:
+    def __init__(self, host='127.0.0.1', port=0, page_size=20000, links=50, images=10,
+                 latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.page_size = page_size
+        self.links = links
+        self.images = images
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.seed = seed
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                site.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self, count):
+        return [f"{self.base_url}/page/{i}" for i in range(count)]
+
+    def _rng(self, path):
+        # Per-path generator so a URL always behaves the same way
+        return random.Random(zlib.crc32(path.encode('utf-8')) ^ self.seed)
+
+    def render(self, path):
+        rng = self._rng(path)
+        parts = [f"<html><head><title>Synthetic {path}</title></head><body>"]
+        parts += [f'<a href="/page/{rng.randrange(1000000)}">link {i}</a>' for i in range(self.links)]
+        parts += [f'<img src="/img/{i}.png">' for i in range(self.images)]
+        size = sum(len(part) for part in parts)
+        while size < self.page_size:
+            filler = f"<p>{'lorem ipsum dolor sit amet ' * 8}</p>"
+            parts.append(filler)
+            size += len(filler)
+        parts.append("</body></html>")
+        return "".join(parts).encode('utf-8')
+
+    def handle(self, request):
+        with self.lock:
+            self.requests += 1
+        rng = self._rng(request.path)
+        delay = self.latency + (rng.random() * self.jitter if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        if rng.random() < self.error_rate:
+            status, body = 500, b"<html><title>Server Error</title></html>"
+        else:
+            status, body = 200, self.render(request.path)
+        request.send_response(status)
+        request.send_header('Content-Type', 'text/html; charset=utf-8')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--page-size", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    site = StubSite(port=args.port, page_size=args.page_size, latency=args.latency,
+                    jitter=args.jitter, error_rate=args.error_rate)
+    print(f"Serving synthetic pages on {site.base_url}")
+    site.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import time
+from urllib.parse import urlsplit
+
+
+def url_host(url):
+    return (urlsplit(url).hostname or '').lower()
+
+
+class CircuitBreakers:
+    """Per-host circuit breakers that keep dead sites from tying up workers.
+
+    After `failure_threshold` consecutive failures a host's circuit opens.
+    While it is open, tasks for the host are parked instead of being
+    dispatched: the coordinator defers them in the queue backend and the
+    breaker keeps only their ids. Once `reset_timeout` seconds pass, one
+    parked task is released as a probe. If the probe succeeds the circuit
+    closes and all parked tasks go back to the queue. If it fails the
+    circuit opens again and the wait doubles, up to `max_reset_timeout`.
+    Only hosts that have failed recently have an entry.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30, max_reset_timeout=600):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.circuits = {}  # host -> circuit state
+
+    @classmethod
+    def from_config(cls, settings):
+        settings = settings or {}
+        return cls(failure_threshold=settings.get("failure_threshold", 5),
+                   reset_timeout=settings.get("reset_timeout", 30),
+                   max_reset_timeout=settings.get("max_reset_timeout", 600))
+
+    @property
+    def parked_count(self):
+        return sum(len(circuit['parked']) for circuit in self.circuits.values())
+
+    def state(self, host):
+        circuit = self.circuits.get(host)
+        return circuit['state'] if circuit else 'closed'
+
+    def allow(self, host, task_id, now=None):
+        """Whether a task for host may be dispatched now"""
+        circuit = self.circuits.get(host)
+        if circuit is None or circuit['state'] == 'closed':
+            return True
+        now = time.time() if now is None else now
+        if circuit['state'] == 'open':
+            if now < circuit['retry_at']:
+                return False
+            self._start_probe(circuit, task_id, now)
+            return True
+        # Half open: only the probe goes through, unless it has gone missing
+        if task_id == circuit['probe_task']:
+            return True
+        if now - circuit['probe_at'] > circuit['timeout']:
+            self._start_probe(circuit, task_id, now)
+            return True
+        return False
+
+    def _start_probe(self, circuit, task_id, now):
+        circuit['state'] = 'half_open'
+        circuit['probe_task'] = task_id
+        circuit['probe_at'] = now
+
+    def park(self, host, task_ids):
+        """Remember tasks deferred while the host's circuit is open"""
+        # Ordered and without repeats: a task can be parked again after its deferral ran out
+        self.circuits[host]['parked'].update(dict.fromkeys(task_ids))
+
+    def record(self, host, failed, now=None):
+        """Record a result for host; returns ids of parked tasks to requeue when the circuit closes"""
+        circuit = self.circuits.get(host)
+        if not failed:
+            if circuit is None:
+                return []
+            del self.circuits[host]
+            if circuit['state'] != 'closed':
+                print(f"Circuit for {host} closed, requeueing {len(circuit['parked'])} tasks")
+            return list(circuit['parked'])
+
+        now = time.time() if now is None else now
+        if circuit is None:
+            circuit = self.circuits[host] = {'state': 'closed', 'failures': 0, 'parked': {},
+                                             'timeout': self.reset_timeout, 'retry_at': 0,
+                                             'probe_task': None, 'probe_at': 0}
+        circuit['failures'] += 1
+        if circuit['state'] == 'half_open':
+            circuit['timeout'] = min(self.max_reset_timeout, circuit['timeout'] * 2)
+            self._open(host, circuit, now)
+        elif circuit['state'] == 'closed' and circuit['failures'] >= self.failure_threshold:
+            self._open(host, circuit, now)
+        return []
+
+    def _open(self, host, circuit, now):
+        circuit['state'] = 'open'
+        circuit['retry_at'] = now + circuit['timeout']
+        circuit['probe_task'] = None
+        print(f"Circuit for {host} opened for {circuit['timeout']}s after {circuit['failures']} failures")
+
+    def due_probes(self, now=None):
+        """Id of one parked task from each open circuit whose wait is over"""
+        now = time.time() if now is None else now
+        probes = []
+        for circuit in self.circuits.values():
+            if circuit['state'] == 'open' and circuit['parked'] and now >= circuit['retry_at']:
+                task_id = next(iter(circuit['parked']))
+                del circuit['parked'][task_id]
+                self._start_probe(circuit, task_id, now)
+                probes.append(task_id)
+        return probes
+
+    def unpark_all(self):
+        """Ids of every parked task, e.g. to requeue them before shutting down"""
+        tasks = [task_id for circuit in self.circuits.values() for task_id in circuit['parked']]
+        for circuit in self.circuits.values():
+            circuit['parked'] = {}
+        return tasks
@@ -0,0 +1,78 @@
+from urllib.parse import urlsplit
+from src.utils.urls import normalize_url
+
+
+def _host(url):
+    return (urlsplit(url).hostname or '').lower()
+
+
+def _domain(host):
+    """Last two labels of a host, a cheap stand-in for the registered domain"""
+    return '.'.join(host.split('.')[-2:])
+
+
+class CrawlPolicy:
+    """Decides which discovered links become new tasks.
+
+    scope is "same_host" (stay on the parent page's host), "same_domain"
+    (any subdomain of the parent's domain), "any", or a list of allowed
+    domains. max_pages caps how many discovered URLs are ever enqueued so
+    the frontier cannot grow without bound.
+    """
+    def __init__(self, enabled=False, max_depth=2, scope="same_host", max_pages=10000,
+                 max_links_per_page=200):
+        self.enabled = enabled
+        self.max_depth = max_depth
+        self.scope = scope
+        self.max_pages = max_pages
+        self.max_links_per_page = max_links_per_page
+        self.enqueued = 0
+        self.seen = set()
+
+    @classmethod
+    def from_config(cls, settings):
+        settings = settings or {}
+        return cls(enabled=settings.get("enabled", False),
+                   max_depth=settings.get("max_depth", 2),
+                   scope=settings.get("scope", "same_host"),
+                   max_pages=settings.get("max_pages", 10000),
+                   max_links_per_page=settings.get("max_links_per_page", 200))
+
+    def should_expand(self, task):
+        """Whether the worker should return outbound links for this task"""
+        return self.enabled and task.depth < self.max_depth and self.enqueued < self.max_pages
+
+    def in_scope(self, parent_url, url):
+        host = _host(url)
+        if self.scope == "any":
+            return True
+        if self.scope == "same_host":
+            return host == _host(parent_url)
+        if self.scope == "same_domain":
+            return _domain(host) == _domain(_host(parent_url))
+        return any(host == allowed or host.endswith('.' + allowed) for allowed in self.scope)
+
+    def select_links(self, parent, links):
+        """Filter a page's links by depth, scope and remaining budget"""
+        if not self.should_expand(parent):
+            return []
+        selected = {}
+        for link in links[:self.max_links_per_page]:
+            url = normalize_url(link)
+            if url and url not in self.seen and self.in_scope(parent.url, url):
+                selected[url] = None
+        budget = self.max_pages - self.enqueued
+        return list(selected)[:max(0, budget)]
+
+    def mark_seen(self, url):
+        """Record a URL; returns False if it was already crawled or queued"""
+        if not self.enabled:
+            return True  # Nothing to dedupe against, so don't grow the set
+        url = normalize_url(url) or url
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        return True
+
+    def count_enqueued(self, count):
+        self.enqueued += count
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from src.utils.fingerprint import SIMHASH_BITS, hamming_distance
+
+BANDS = 4
+BAND_BITS = SIMHASH_BITS // BANDS
+
+
+def _bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(band, value >> (band * BAND_BITS) & mask) for band in range(BANDS)]
+
+
+class FingerprintIndex:
+    """Results of recently parsed pages, keyed by content fingerprint.
+
+    Exact lookups use the body hash. Near-duplicate lookups use simhashes
+    split into four 16-bit bands: two hashes within three bits of each
+    other must agree on at least one band, so only pages sharing a band
+    are compared instead of the whole index. The oldest entries are
+    evicted past max_size.
+    """
+    def __init__(self, max_size=1000000, max_distance=3):
+        self.max_size = max_size
+        self.max_distance = min(max_distance, BANDS - 1)
+        self.entries = OrderedDict()  # fingerprint -> (task_id, result, simhash)
+        self.bands = {}  # (band, value) -> set of fingerprints
+        self.hits = 0
+        self.lookups = 0
+
+    def add(self, fingerprint, task_id, result, simhash=None):
+        if fingerprint in self.entries:
+            return
+        self.entries[fingerprint] = (task_id, result, simhash)
+        if simhash is not None:
+            for key in _bands(simhash):
+                self.bands.setdefault(key, set()).add(fingerprint)
+        if len(self.entries) > self.max_size:
+            self._evict()
+
+    def _evict(self):
+        fingerprint, (_, _, simhash) = self.entries.popitem(last=False)
+        if simhash is not None:
+            for key in _bands(simhash):
+                members = self.bands.get(key)
+                if members is not None:
+                    members.discard(fingerprint)
+                    if not members:
+                        del self.bands[key]
+
+    def lookup(self, fingerprint, simhash=None):
+        """(task_id, result) of a matching page, or None"""
+        self.lookups += 1
+        entry = self.entries.get(fingerprint)
+        if entry is None and simhash is not None:
+            entry = self._nearest(simhash)
+        if entry is None:
+            return None
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def _nearest(self, simhash):
+        candidates = set()
+        for key in _bands(simhash):
+            candidates.update(self.bands.get(key, ()))
+        for fingerprint in candidates:
+            entry = self.entries[fingerprint]
+            if hamming_distance(entry[2], simhash) <= self.max_distance:
+                return entry
+        return None
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,214 @@
+import csv
+import json
+import os
+import threading
+
+# Task fields exported ahead of the result columns
+TASK_COLUMNS = ('id', 'url', 'job_id', 'depth', 'status', 'completed_at', 'assigned_worker', 'error')
+
+
+def flatten(result, prefix=''):
+    """Flatten nested dicts into dotted columns; lists become JSON strings"""
+    row = {}
+    for key, value in (result or {}).items():
+        column = f'{prefix}{key}'
+        if isinstance(value, dict):
+            row.update(flatten(value, column + '.'))
+        elif isinstance(value, (list, tuple)):
+            row[column] = json.dumps(value)
+        else:
+            row[column] = value
+    return row
+
+
+def task_row(task):
+    row = {column: getattr(task, column) for column in TASK_COLUMNS}
+    row['completed_at'] = str(task.completed_at) if task.completed_at else None
+    row.update(flatten(task.result, 'result.'))
+    return row
+
+
+def part_path(path, part):
+    """results.csv, then results.1.csv, results.2.csv... for later parts"""
+    root, ext = os.path.splitext(path)
+    return path if part == 0 else f"{root}.{part}{ext}"
+
+
+class ResultExporter:
+    """Writes finished tasks to CSV or Parquet, `chunk_size` rows at a time.
+
+    Only one chunk is held in memory. The columns are the task fields plus
+    the flattened result keys seen so far; rows missing a column get an
+    empty value. When a chunk brings result keys the file has no column
+    for, the export continues in a new part file (results.1.csv, ...)
+    whose columns include them, so nothing is left out. With `append` a
+    CSV export carries on at the end of the last part an earlier run left,
+    and a Parquet export starts a new part. Parquet needs pyarrow and
+    writes each chunk as a row group; a value that does not fit its
+    column's type starts a new part where that column holds strings.
+    """
+    def __init__(self, path, format=None, chunk_size=1000, append=False):
+        self.path = path
+        self.format = format or ('parquet' if path.endswith('.parquet') else 'csv')
+        if self.format not in ('csv', 'parquet'):
+            raise ValueError(f"Unknown export format: {self.format}")
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.columns = None
+        self.columns_set = set()
+        self.string_columns = set()
+        self.schema = None
+        self.part = 0
+        self.exported = 0
+        self.file = None
+        self.writer = None
+        self.lock = threading.Lock()
+        if self.format == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError("Parquet export needs the 'pyarrow' package installed")
+            self.pa = pyarrow
+        if append:
+            self._find_last_part()
+
+    def _find_last_part(self):
+        """Skip past the parts of earlier runs so they are never truncated"""
+        while os.path.exists(part_path(self.path, self.part + 1)):
+            self.part += 1
+        path = part_path(self.path, self.part)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return
+        if self.format == 'parquet':
+            self.part += 1
+            return
+        with open(path, newline='') as f:
+            header = next(csv.reader(f), None)
+        if header:
+            self.columns = header
+            self.columns_set = set(header)
+        else:
+            self.part += 1
+
+    def write(self, task):
+        with self.lock:
+            self.rows.append(task_row(task))
+            if len(self.rows) >= self.chunk_size:
+                self._flush()
+
+    def write_all(self, tasks):
+        for task in tasks:
+            self.write(task)
+        return self
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.rows:
+            return
+        try:
+            self._write_rows()
+        finally:
+            # A chunk that failed is dropped, so it cannot fail every later write
+            self.rows = []
+
+    def _write_rows(self):
+        keys = {key for row in self.rows for key in row}
+        if self.columns is None:
+            self._open(keys)
+        elif not keys <= self.columns_set:
+            new = sorted(keys - self.columns_set)
+            self._close_file()
+            self.part += 1
+            self._open(keys | self.columns_set)
+            print(f"New result columns {new}; export continues in {part_path(self.path, self.part)}")
+        elif self.writer is None:
+            # A CSV an earlier run wrote; append under its header
+            self.file = open(part_path(self.path, self.part), 'a', newline='')
+            self.writer = csv.DictWriter(self.file, fieldnames=self.columns, extrasaction='ignore')
+        if self.format == 'csv':
+            self.writer.writerows(self.rows)
+            self.file.flush()
+        else:
+            try:
+                table = self.pa.Table.from_pydict(self._column_values(), schema=self.schema)
+            except (TypeError, ValueError, OverflowError):
+                table = self._widen()
+            self.writer.write_table(table)
+        self.exported += len(self.rows)
+
+    def _widen(self):
+        """Start a new Parquet part that stores the columns this chunk does not fit as strings"""
+        mismatched = []
+        for index, field in enumerate(self.schema):
+            try:
+                self.pa.array([row.get(field.name) for row in self.rows], type=field.type)
+            except (TypeError, ValueError, OverflowError):
+                mismatched.append(field.name)
+                self.schema = self.schema.set(index, self.pa.field(field.name, self.pa.string()))
+        self._close_file()
+        self.part += 1
+        self._open(self.columns_set)
+        print(f"Result columns {mismatched} changed type; export continues in {part_path(self.path, self.part)}")
+        return self.pa.Table.from_pydict(self._column_values(), schema=self.schema)
+
+    def _open(self, keys):
+        """Start the current part file with the task fields and the given result keys"""
+        self.columns = list(TASK_COLUMNS) + sorted(set(keys) - set(TASK_COLUMNS))
+        self.columns_set = set(self.columns)
+        path = part_path(self.path, self.part)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.format == 'csv':
+            self.file = open(path, 'w', newline='')
+            self.writer = csv.DictWriter(self.file, fieldnames=self.columns, extrasaction='ignore')
+            self.writer.writeheader()
+        else:
+            import pyarrow.parquet
+            # Column types come from the previous part, else from this chunk;
+            # columns that are empty or mixed there (such as error) are strings
+            previous = self.schema
+            self.string_columns = set()
+            fields = []
+            for column in self.columns:
+                if previous is not None and column in previous.names:
+                    field = previous.field(column)
+                else:
+                    try:
+                        kind = self.pa.array([row.get(column) for row in self.rows]).type
+                    except (TypeError, ValueError, OverflowError):
+                        kind = self.pa.string()
+                    if self.pa.types.is_null(kind):
+                        kind = self.pa.string()
+                    field = self.pa.field(column, kind)
+                if self.pa.types.is_string(field.type):
+                    self.string_columns.add(column)
+                fields.append(field)
+            self.schema = self.pa.schema(fields)
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def _column_values(self):
+        columns = {}
+        for column in self.columns:
+            values = [row.get(column) for row in self.rows]
+            if column in self.string_columns:
+                values = [None if value is None else str(value) for value in values]
+            columns[column] = values
+        return columns
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+        elif self.writer is not None:
+            self.writer.close()
+        self.file = self.writer = None
+
+    def close(self):
+        """Write the last partial chunk and close the file; returns the rows exported"""
+        with self.lock:
+            self._flush()
+            self._close_file()
+        return self.exported
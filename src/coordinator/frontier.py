@@ -0,0 +1,217 @@
+import heapq
+import json
+import os
+import sqlite3
+import time
+from src.coordinator.queue_backend import LeaseTable, QueueBackend
+from src.models.task import Task
+
+
+class TieredQueueBackend(QueueBackend):
+    """Frontier with a bounded in-memory window and a SQLite spill file.
+
+    The heap holds the best pending tasks in dispatch order. Every task
+    on disk ranks below every task in memory, so dispatch order is the
+    same as one big priority queue. When the heap grows past `hot_size`
+    its lower half is spilled to disk in one batch. When it drains below
+    a quarter of that, the best tasks on disk are loaded back. Memory
+    stays bounded by `hot_size` no matter how many URLs are queued, and
+    tasks on disk survive restarts. Deferred tasks are kept on disk only.
+    """
+    def __init__(self, path=os.path.join('data', 'frontier.db'), hot_size=100000, lease_timeout=300):
+        self.path = path
+        self.hot_size = max(4, hot_size)
+        self.lease_timeout = lease_timeout
+        self.heap = []
+        self.leases = LeaseTable()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Callers serialize access (the coordinator holds its lock)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            " seq INTEGER PRIMARY KEY, priority INTEGER NOT NULL, task TEXT NOT NULL)")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS frontier_order ON frontier (priority DESC, seq)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS deferred ("
+            " task_id TEXT PRIMARY KEY, until REAL NOT NULL, task TEXT NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS deferred_until ON deferred (until)")
+        self.db.commit()
+
+        count, max_seq = self.db.execute("SELECT COUNT(*), MAX(seq) FROM frontier").fetchone()
+        self.cold_count = count
+        self.deferred = self.db.execute("SELECT COUNT(*) FROM deferred").fetchone()[0]
+        self.next_seq = (max_seq or 0) + 1
+        self.cold_top = self._read_cold_top()
+
+    def _read_cold_top(self):
+        """Dispatch key of the best task on disk, or None when the disk tier is empty"""
+        row = self.db.execute(
+            "SELECT priority, seq FROM frontier ORDER BY priority DESC, seq LIMIT 1").fetchone()
+        return (-row[0], row[1]) if row else None
+
+    def push(self, tasks):
+        spilled = []
+        for task in tasks:
+            task.status = 'pending'
+            task.assigned_worker = None
+            key = (-task.priority, self.next_seq)
+            self.next_seq += 1
+            if self.cold_top is None or key < self.cold_top:
+                heapq.heappush(self.heap, (key[0], key[1], task))
+            else:
+                spilled.append((key[1], task.priority, json.dumps(task.to_dict())))
+
+        if spilled:
+            self._write_cold(spilled)
+        if len(self.heap) > self.hot_size:
+            self._spill()
+
+    def _write_cold(self, rows):
+        with self.db:
+            self.db.executemany("INSERT INTO frontier (seq, priority, task) VALUES (?, ?, ?)", rows)
+        self.cold_count += len(rows)
+        best = min((-priority, seq) for seq, priority, _ in rows)
+        if self.cold_top is None or best < self.cold_top:
+            self.cold_top = best
+
+    def _spill(self):
+        """Move the lower-ranked half of the heap to disk"""
+        entries = sorted(self.heap)
+        keep = self.hot_size // 2
+        self.heap = entries[:keep]  # a sorted list is a valid heap
+        rows = [(seq, -neg_priority, json.dumps(task.to_dict()))
+                for neg_priority, seq, task in entries[keep:]]
+        self._write_cold(rows)
+
+    def _refill(self):
+        """Load the best tasks from disk once the heap runs low"""
+        if not self.cold_count or len(self.heap) >= self.hot_size // 4:
+            return
+        limit = self.hot_size // 2 - len(self.heap)
+        rows = self.db.execute(
+            "SELECT seq, priority, task FROM frontier ORDER BY priority DESC, seq LIMIT ?",
+            (limit,)).fetchall()
+        with self.db:
+            self.db.executemany("DELETE FROM frontier WHERE seq = ?", [(row[0],) for row in rows])
+        self.cold_count -= len(rows)
+        for seq, priority, data in rows:
+            heapq.heappush(self.heap, (-priority, seq, Task.from_dict(json.loads(data))))
+        self.cold_top = self._read_cold_top()
+
+    def lease(self, worker_id, count):
+        deadline = time.time() + self.lease_timeout
+        leased = []
+        while len(leased) < count:
+            self._refill()
+            if not self.heap:
+                break
+            task = heapq.heappop(self.heap)[2]
+            task.assigned_worker = worker_id
+            task.update_status('in_progress')
+            self.leases[task.id] = (task, deadline)
+            leased.append(task)
+        return leased
+
+    def complete(self, task_id):
+        entry = self.leases.pop(task_id, None)
+        return entry[0] if entry else None
+
+    def requeue_worker(self, worker_id):
+        returned = [self.leases.pop(task_id)[0] for task_id in self.leases.for_worker(worker_id)]
+        self.push(returned)
+        return len(returned)
+
+    def release(self, task_ids):
+        returned = [self.leases.pop(task_id)[0] for task_id in task_ids if task_id in self.leases]
+        self.push(returned)
+        return len(returned)
+
+    def expire_leases(self, now=None):
+        now = time.time() if now is None else now
+        expired = [task for task, deadline in self.leases.values() if deadline <= now]
+        for task in expired:
+            del self.leases[task.id]
+        self.push(expired)
+        return len(expired)
+
+    def defer(self, task_ids, until):
+        rows = []
+        for task_id in task_ids:
+            entry = self.leases.pop(task_id, None)
+            if entry is None:
+                continue
+            task = entry[0]
+            task.status = 'pending'
+            task.assigned_worker = None
+            rows.append((task.id, until, json.dumps(task.to_dict())))
+        if rows:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO deferred (task_id, until, task) VALUES (?, ?, ?)", rows)
+            self.deferred += len(rows)
+        return len(rows)
+
+    def undefer(self, task_ids):
+        tasks = []
+        for task_id in task_ids:
+            row = self.db.execute("SELECT task FROM deferred WHERE task_id = ?", (task_id,)).fetchone()
+            if row:
+                tasks.append(Task.from_dict(json.loads(row[0])))
+        if tasks:
+            with self.db:
+                self.db.executemany("DELETE FROM deferred WHERE task_id = ?", [(task.id,) for task in tasks])
+            self.deferred -= len(tasks)
+            self.push(tasks)
+        return len(tasks)
+
+    def undefer_due(self, now=None):
+        now = time.time() if now is None else now
+        if not self.deferred:
+            return 0
+        due = self.db.execute("SELECT task_id FROM deferred WHERE until <= ?", (now,)).fetchall()
+        return self.undefer([row[0] for row in due])
+
+    def deferred_count(self):
+        return self.deferred
+
+    def pending_count(self):
+        return len(self.heap) + self.cold_count
+
+    def active_count(self):
+        return len(self.leases)
+
+    def pending_tasks(self, limit=None):
+        hot = sorted(self.heap) if limit is None else heapq.nsmallest(limit, self.heap)
+        tasks = [entry[2] for entry in hot]
+        remaining = -1 if limit is None else limit - len(tasks)
+        if remaining:
+            rows = self.db.execute(
+                "SELECT task FROM frontier ORDER BY priority DESC, seq LIMIT ?", (remaining,)).fetchall()
+            tasks.extend(Task.from_dict(json.loads(row[0])) for row in rows)
+        return tasks
+
+    def active_tasks(self):
+        return [task for task, _ in self.leases.values()]
+
+    def worker_leases(self, worker_id):
+        return set(self.leases.for_worker(worker_id))
+
+    def close(self):
+        """Spill the in-memory window and leases to disk so nothing is lost on restart"""
+        leased = [task for task, _ in self.leases.values()]
+        self.leases = LeaseTable()
+        for task in leased:
+            task.status = 'pending'
+            task.assigned_worker = None
+        rows = [(seq, -neg_priority, json.dumps(task.to_dict())) for neg_priority, seq, task in self.heap]
+        start = self.next_seq
+        rows += [(start + i, task.priority, json.dumps(task.to_dict())) for i, task in enumerate(leased)]
+        self.next_seq += len(leased)
+        self.heap = []
+        if rows:
+            self._write_cold(rows)
+        self.db.close()
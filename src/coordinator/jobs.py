@@ -0,0 +1,100 @@
+import time
+import uuid
+
+
+class JobTracker:
+    """Per-job task counters, updated as tasks move so progress is O(1).
+
+    Cancelling a job is also O(1): the job id is tombstoned and its tasks
+    stay in the queue until they come up for dispatch, where they are
+    dropped instead of leased. Tasks already leased still finish. Until
+    then they are counted in queued_cancelled(), which pending figures
+    leave out.
+    """
+    def __init__(self):
+        self.jobs = {}  # job_id -> counters
+        self.cancelled = set()
+        self.queued = {}  # cancelled job_id -> tasks still in the queue
+
+    def create(self, job_id=None, name=None):
+        job_id = job_id or str(uuid.uuid4())
+        if job_id not in self.jobs:
+            self.jobs[job_id] = {
+                'id': job_id,
+                'name': name,
+                'created_at': time.time(),
+                'total': 0,
+                'completed': 0,
+                'failed': 0,
+                'cancelled': 0
+            }
+        return job_id
+
+    def added(self, job_id, count):
+        if job_id is not None:
+            self.jobs[self.create(job_id)]['total'] += count
+
+    def finished(self, job_id, failed=False):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job['failed' if failed else 'completed'] += 1
+
+    def dropped(self, job_id):
+        """Count a task of a cancelled job that was discarded at dispatch"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job['cancelled'] += 1
+        if self.queued.get(job_id):
+            self.queued[job_id] -= 1
+            if not self.queued[job_id]:
+                del self.queued[job_id]
+
+    def cancel(self, job_id, leased=0):
+        """Tombstone a job; `leased` of its unfinished tasks are with workers, the rest queued"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        if job_id not in self.cancelled:
+            self.cancelled.add(job_id)
+            queued = job['total'] - job['completed'] - job['failed'] - job['cancelled'] - leased
+            if queued > 0:
+                self.queued[job_id] = queued
+        return True
+
+    def queued_cancelled(self):
+        """Tasks of cancelled jobs still in the queue, waiting to be dropped"""
+        return sum(self.queued.values())
+
+    def is_cancelled(self, job_id):
+        return job_id is not None and job_id in self.cancelled
+
+    def progress(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        remaining = job['total'] - job['completed'] - job['failed'] - job['cancelled']
+        if job_id in self.cancelled:
+            state = 'cancelling' if remaining else 'cancelled'
+        else:
+            state = 'running' if remaining else 'done'
+        return dict(job, remaining=remaining, state=state)
+
+    def __len__(self):
+        return len(self.jobs)
+
+
+def combine_progress(parts):
+    """Progress of a job whose tasks are spread over shards, from each shard's share"""
+    parts = [part for part in parts if part]
+    if not parts:
+        return None
+    combined = dict(next((part for part in parts if part.get('name')), parts[0]))
+    for key in ('total', 'completed', 'failed', 'cancelled', 'remaining'):
+        combined[key] = sum(part[key] for part in parts)
+    combined['created_at'] = min(part['created_at'] for part in parts)
+    remaining = combined['remaining']
+    if any(part['state'] in ('cancelling', 'cancelled') for part in parts):
+        combined['state'] = 'cancelling' if remaining else 'cancelled'
+    else:
+        combined['state'] = 'running' if remaining else 'done'
+    return combined
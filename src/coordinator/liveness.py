@@ -0,0 +1,37 @@
+import time
+from collections import OrderedDict
+
+
+class LivenessTracker:
+    """Tracks when each worker was last heard from.
+
+    Workers are kept in least-recently-seen order, so recording activity
+    is O(1) and a sweep only looks at the workers that actually expired,
+    no matter how many healthy workers are connected.
+    """
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.last_seen = OrderedDict()
+
+    def touch(self, worker_id, now=None):
+        """Record activity from a worker"""
+        self.last_seen[worker_id] = time.time() if now is None else now
+        self.last_seen.move_to_end(worker_id)
+
+    def remove(self, worker_id):
+        self.last_seen.pop(worker_id, None)
+
+    def expired(self, now=None):
+        """Remove and return the workers not seen within the timeout"""
+        cutoff = (time.time() if now is None else now) - self.timeout
+        dead = []
+        while self.last_seen:
+            worker_id, seen = next(iter(self.last_seen.items()))
+            if seen >= cutoff:
+                break
+            self.last_seen.popitem(last=False)
+            dead.append(worker_id)
+        return dead
+
+    def __len__(self):
+        return len(self.last_seen)
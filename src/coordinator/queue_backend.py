@@ -0,0 +1,426 @@
+import heapq
+import itertools
+import json
+import os
+import time
+from src.models.task import Task
+
+
+class QueueBackend:
+    """Pending task queue plus the leases handed out to workers.
+
+    Tasks come out highest priority first, FIFO within a priority. A lease
+    that is not completed within `lease_timeout` seconds is returned to the
+    queue by expire_leases(), so a crashed worker or coordinator cannot
+    strand work.
+    """
+    # True when other coordinators can add tasks behind our back, so
+    # long polls must re-check the queue instead of waiting for a notify
+    shared = False
+
+    def push(self, tasks):
+        raise NotImplementedError
+
+    def lease(self, worker_id, count):
+        """Take up to `count` tasks off the queue and lease them to a worker"""
+        raise NotImplementedError
+
+    def complete(self, task_id):
+        """End a lease, returning the task or None if it is not leased"""
+        raise NotImplementedError
+
+    def requeue_worker(self, worker_id):
+        """Return every task leased to a worker to the queue"""
+        raise NotImplementedError
+
+    def release(self, task_ids):
+        """Return specific leased tasks to the queue, e.g. from a draining worker"""
+        raise NotImplementedError
+
+    def expire_leases(self, now=None):
+        """Return overdue leases to the queue"""
+        raise NotImplementedError
+
+    def defer(self, task_ids, until):
+        """Set leased tasks aside until `until` (epoch seconds), e.g. those of a failing host.
+
+        Deferred tasks stay in the backend but are neither pending nor leased.
+        """
+        raise NotImplementedError
+
+    def undefer(self, task_ids):
+        """Return deferred tasks to the queue now; returns how many were deferred"""
+        raise NotImplementedError
+
+    def undefer_due(self, now=None):
+        """Return deferred tasks whose time has come to the queue"""
+        raise NotImplementedError
+
+    def deferred_count(self):
+        raise NotImplementedError
+
+    def pending_count(self):
+        raise NotImplementedError
+
+    def active_count(self):
+        raise NotImplementedError
+
+    def pending_tasks(self, limit=None):
+        """Pending tasks in dispatch order"""
+        raise NotImplementedError
+
+    def active_tasks(self):
+        raise NotImplementedError
+
+    def worker_leases(self, worker_id):
+        """Ids of the tasks leased to one worker"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release resources when the coordinator stops"""
+
+
+class LeaseTable(dict):
+    """Leases as task_id -> (task, deadline), also indexed by worker"""
+    def __init__(self):
+        super().__init__()
+        self.owners = {}  # task_id -> worker it was leased to
+        self.by_worker = {}  # worker_id -> {task_id: None}, in lease order
+
+    def __setitem__(self, task_id, entry):
+        if task_id in self:
+            self.pop(task_id)
+        super().__setitem__(task_id, entry)
+        worker_id = entry[0].assigned_worker
+        self.owners[task_id] = worker_id
+        self.by_worker.setdefault(worker_id, {})[task_id] = None
+
+    def __delitem__(self, task_id):
+        self.pop(task_id)
+
+    def pop(self, task_id, *default):
+        if task_id not in self:
+            if default:
+                return default[0]
+            raise KeyError(task_id)
+        worker_id = self.owners.pop(task_id)
+        held = self.by_worker[worker_id]
+        del held[task_id]
+        if not held:
+            del self.by_worker[worker_id]
+        return super().pop(task_id)
+
+    def for_worker(self, worker_id):
+        return list(self.by_worker.get(worker_id, ()))
+
+
+class MemoryQueueBackend(QueueBackend):
+    """In-process queue: a heap for pending tasks and a dict of leases"""
+    def __init__(self, lease_timeout=300):
+        self.lease_timeout = lease_timeout
+        self.heap = []
+        self.counter = itertools.count()
+        self.leases = LeaseTable()
+        self.deferred = {}  # task_id -> (until, task)
+        self.deferred_heap = []  # (until, task_id); entries no longer in deferred are skipped
+
+    def push(self, tasks):
+        for task in tasks:
+            task.status = 'pending'
+            task.assigned_worker = None
+            heapq.heappush(self.heap, (-task.priority, next(self.counter), task))
+
+    def lease(self, worker_id, count):
+        deadline = time.time() + self.lease_timeout
+        leased = []
+        while self.heap and len(leased) < count:
+            task = heapq.heappop(self.heap)[2]
+            task.assigned_worker = worker_id
+            task.update_status('in_progress')
+            self.leases[task.id] = (task, deadline)
+            leased.append(task)
+        return leased
+
+    def complete(self, task_id):
+        entry = self.leases.pop(task_id, None)
+        return entry[0] if entry else None
+
+    def requeue_worker(self, worker_id):
+        returned = [self.leases.pop(task_id)[0] for task_id in self.leases.for_worker(worker_id)]
+        self.push(returned)
+        return len(returned)
+
+    def release(self, task_ids):
+        returned = [self.leases.pop(task_id)[0] for task_id in task_ids if task_id in self.leases]
+        self.push(returned)
+        return len(returned)
+
+    def expire_leases(self, now=None):
+        now = time.time() if now is None else now
+        expired = [task for task, deadline in self.leases.values() if deadline <= now]
+        for task in expired:
+            del self.leases[task.id]
+        self.push(expired)
+        return len(expired)
+
+    def defer(self, task_ids, until):
+        moved = 0
+        for task_id in task_ids:
+            entry = self.leases.pop(task_id, None)
+            if entry is None:
+                continue
+            task = entry[0]
+            task.status = 'pending'
+            task.assigned_worker = None
+            self.deferred[task_id] = (until, task)
+            heapq.heappush(self.deferred_heap, (until, task_id))
+            moved += 1
+        return moved
+
+    def undefer(self, task_ids):
+        returned = [self.deferred.pop(task_id)[1] for task_id in task_ids if task_id in self.deferred]
+        self.push(returned)
+        return len(returned)
+
+    def undefer_due(self, now=None):
+        now = time.time() if now is None else now
+        due = []
+        while self.deferred_heap and self.deferred_heap[0][0] <= now:
+            until, task_id = heapq.heappop(self.deferred_heap)
+            if self.deferred.get(task_id, (None,))[0] == until:
+                due.append(task_id)
+        return self.undefer(due)
+
+    def deferred_count(self):
+        return len(self.deferred)
+
+    def pending_count(self):
+        return len(self.heap)
+
+    def active_count(self):
+        return len(self.leases)
+
+    def pending_tasks(self, limit=None):
+        entries = sorted(self.heap) if limit is None else heapq.nsmallest(limit, self.heap)
+        return [entry[2] for entry in entries]
+
+    def active_tasks(self):
+        return [task for task, _ in self.leases.values()]
+
+    def worker_leases(self, worker_id):
+        return set(self.leases.for_worker(worker_id))
+
+
+class RedisQueueBackend(QueueBackend):
+    """Queue shared through Redis so several coordinators can serve it.
+
+    Keys (all under `prefix`):
+      pending        sorted set of task ids, score orders by priority then age
+      tasks          hash of task id -> JSON task
+      leases         sorted set of leased task ids scored by lease deadline
+      owners         hash of leased task id -> worker id
+      worker:<id>    set of task ids leased to a worker
+      deferred       sorted set of task ids set aside, scored by when they are due
+      seq            counter used to keep FIFO order within a priority
+    """
+    shared = True
+    # Scores are -priority * PRIORITY_SCALE + sequence number
+    PRIORITY_SCALE = 10 ** 10
+
+    def __init__(self, client, prefix='scraper', lease_timeout=300):
+        self.redis = client
+        self.prefix = prefix
+        self.lease_timeout = lease_timeout
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis queue backend needs the 'redis' package installed")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def _score(self, task, seq):
+        return -task.priority * self.PRIORITY_SCALE + seq
+
+    def push(self, tasks):
+        if not tasks:
+            return
+        # Reserve a block of sequence numbers in one round trip
+        last = self.redis.incrby(self.key('seq'), len(tasks))
+        first = last - len(tasks) + 1
+        pipe = self.redis.pipeline(transaction=False)
+        for offset, task in enumerate(tasks):
+            task.status = 'pending'
+            task.assigned_worker = None
+            pipe.hset(self.key('tasks'), task.id, json.dumps(task.to_dict()))
+        pipe.zadd(self.key('pending'), {
+            task.id: self._score(task, first + offset) for offset, task in enumerate(tasks)
+        })
+        pipe.execute()
+
+    def _load(self, task_ids):
+        if not task_ids:
+            return []
+        raw = self.redis.hmget(self.key('tasks'), task_ids)
+        return [Task.from_dict(json.loads(data)) for data in raw if data is not None]
+
+    def lease(self, worker_id, count):
+        deadline = time.time() + self.lease_timeout
+
+        def claim(pipe):
+            # Moving tasks from pending to leases in one MULTI means a crash
+            # leaves each task in one of the two, never in neither. WATCH
+            # makes two coordinators retry instead of leasing the same task.
+            task_ids = [self._decode(t) for t in pipe.zrange(self.key('pending'), 0, count - 1)]
+            if task_ids:
+                pipe.multi()
+                pipe.zrem(self.key('pending'), *task_ids)
+                pipe.zadd(self.key('leases'), {task_id: deadline for task_id in task_ids})
+                pipe.hset(self.key('owners'), mapping={task_id: worker_id for task_id in task_ids})
+                pipe.sadd(self.key(f'worker:{worker_id}'), *task_ids)
+            return task_ids
+
+        task_ids = self.redis.transaction(claim, self.key('pending'), value_from_callable=True)
+        if not task_ids:
+            return []
+        # The stored copies only record who holds them; if this is lost, the
+        # lease still expires and requeues the task
+        tasks = self._load(task_ids)
+        pipe = self.redis.pipeline()
+        for task in tasks:
+            task.assigned_worker = worker_id
+            task.update_status('in_progress')
+            pipe.hset(self.key('tasks'), task.id, json.dumps(task.to_dict()))
+        pipe.execute()
+        return tasks
+
+    def complete(self, task_id):
+        # Removing the lease first settles any race with expire_leases()
+        if not self.redis.zrem(self.key('leases'), task_id):
+            return None
+        pipe = self.redis.pipeline()
+        pipe.hget(self.key('tasks'), task_id)
+        pipe.hget(self.key('owners'), task_id)
+        pipe.hdel(self.key('tasks'), task_id)
+        pipe.hdel(self.key('owners'), task_id)
+        data, owner = pipe.execute()[:2]
+        if owner is not None:
+            self.redis.srem(self.key(f'worker:{self._decode(owner)}'), task_id)
+        return Task.from_dict(json.loads(data)) if data is not None else None
+
+    def _unlease(self, task_ids):
+        """End leases, returning the ids this caller removed; only it may move those tasks"""
+        if not task_ids:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.zrem(self.key('leases'), task_id)
+        removed = [task_id for task_id, gone in zip(task_ids, pipe.execute()) if gone]
+        if not removed:
+            return []
+
+        owners = self.redis.hmget(self.key('owners'), removed)
+        pipe = self.redis.pipeline()
+        for task_id, owner in zip(removed, owners):
+            pipe.hdel(self.key('owners'), task_id)
+            if owner is not None:
+                pipe.srem(self.key(f'worker:{self._decode(owner)}'), task_id)
+        pipe.execute()
+        return removed
+
+    def _requeue(self, task_ids):
+        """Move leased tasks back to pending"""
+        requeued = self._unlease(task_ids)
+        self.push(self._load(requeued))
+        return len(requeued)
+
+    def requeue_worker(self, worker_id):
+        task_ids = [self._decode(t) for t in self.redis.smembers(self.key(f'worker:{worker_id}'))]
+        return self._requeue(task_ids)
+
+    def release(self, task_ids):
+        return self._requeue(list(task_ids))
+
+    def expire_leases(self, now=None):
+        now = time.time() if now is None else now
+        overdue = self.redis.zrangebyscore(self.key('leases'), '-inf', now)
+        return self._requeue([self._decode(t) for t in overdue])
+
+    def defer(self, task_ids, until):
+        moved = self._unlease(list(task_ids))
+        if moved:
+            self.redis.zadd(self.key('deferred'), {task_id: until for task_id in moved})
+        return len(moved)
+
+    def undefer(self, task_ids):
+        task_ids = list(task_ids)
+        if not task_ids:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.zrem(self.key('deferred'), task_id)
+        # As with leases, only the coordinator that removes an entry requeues it
+        returned = [task_id for task_id, removed in zip(task_ids, pipe.execute()) if removed]
+        self.push(self._load(returned))
+        return len(returned)
+
+    def undefer_due(self, now=None):
+        now = time.time() if now is None else now
+        due = self.redis.zrangebyscore(self.key('deferred'), '-inf', now)
+        return self.undefer([self._decode(t) for t in due])
+
+    def deferred_count(self):
+        return self.redis.zcard(self.key('deferred'))
+
+    def pending_count(self):
+        return self.redis.zcard(self.key('pending'))
+
+    def active_count(self):
+        return self.redis.zcard(self.key('leases'))
+
+    def pending_tasks(self, limit=None):
+        end = -1 if limit is None else limit - 1
+        task_ids = [self._decode(t) for t in self.redis.zrange(self.key('pending'), 0, end)]
+        return self._load(task_ids)
+
+    def active_tasks(self):
+        task_ids = [self._decode(t) for t in self.redis.zrange(self.key('leases'), 0, -1)]
+        return self._load(task_ids)
+
+    def worker_leases(self, worker_id):
+        return {self._decode(t) for t in self.redis.smembers(self.key(f'worker:{worker_id}'))}
+
+    @staticmethod
+    def _decode(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def create_queue_backend(config, shard_index=None):
+    """Build the queue backend selected by the "queue_backend" setting.
+
+    Sharded coordinators pass their index, so shards on one host or one
+    Redis keep separate queues, like their state files.
+    """
+    kind = config.get("queue_backend", "memory")
+    lease_timeout = config.get("lease_timeout", 300)
+    if kind == "memory":
+        return MemoryQueueBackend(lease_timeout=lease_timeout)
+    if kind == "tiered":
+        from src.coordinator.frontier import TieredQueueBackend
+        path = config.get("frontier_path", "data/frontier.db")
+        if shard_index is not None:
+            root, ext = os.path.splitext(path)
+            path = f"{root}-shard{shard_index}{ext}"
+        return TieredQueueBackend(path=path, hot_size=config.get("frontier_hot_size", 100000),
+                                  lease_timeout=lease_timeout)
+    if kind == "redis":
+        prefix = config.get("redis_prefix", "scraper")
+        if shard_index is not None:
+            prefix = f"{prefix}:shard{shard_index}"
+        return RedisQueueBackend.from_url(config.get("redis_url", "redis://localhost:6379/0"),
+                                          prefix=prefix, lease_timeout=lease_timeout)
+    raise ValueError(f"Unknown queue backend: {kind}")
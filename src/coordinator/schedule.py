@@ -0,0 +1,164 @@
+import heapq
+import itertools
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# (name, lowest, highest) of the five cron fields
+CRON_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 6))
+
+
+def parse_cron(expression):
+    """Parse a five-field cron expression into sets of allowed values.
+
+    Supports '*', lists ('1,15'), ranges ('9-17') and steps ('*/5',
+    '0-30/10'). Weekday 0 (or 7) is Sunday.
+    """
+    parts = expression.split()
+    if len(parts) != len(CRON_FIELDS):
+        raise ValueError(f"Cron expression needs {len(CRON_FIELDS)} fields: {expression!r}")
+
+    fields = {}
+    for part, (name, low, high) in zip(parts, CRON_FIELDS):
+        values = set()
+        for item in part.split(','):
+            spec, _, step = item.partition('/')
+            if spec == '*':
+                start, end = low, high
+            elif '-' in spec:
+                start, end = (int(v) for v in spec.split('-', 1))
+            else:
+                start = end = int(spec)
+            if name == 'weekday':
+                end = min(end, 7)
+            if start < low or end > (7 if name == 'weekday' else high) or start > end:
+                raise ValueError(f"Cron {name} out of range: {item!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        if name == 'weekday' and 7 in values:
+            values = (values - {7}) | {0}
+        fields[name] = values
+    # Like cron, a restricted day and weekday match when either one does
+    fields['any_day'] = parts[2] != '*' and parts[4] != '*'
+    return fields
+
+
+def next_cron_time(fields, after):
+    """First whole minute strictly after the timestamp `after` matching the fields"""
+    moment = datetime.fromtimestamp(after).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    # Jump a field at a time instead of testing every minute
+    for _ in range(100000):
+        if moment.month not in fields['month']:
+            moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            continue
+        day_ok = moment.day in fields['day']
+        weekday_ok = (moment.weekday() + 1) % 7 in fields['weekday']
+        if not (day_ok or weekday_ok if fields['any_day'] else day_ok and weekday_ok):
+            moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            continue
+        if moment.hour not in fields['hour']:
+            moment = moment.replace(minute=0) + timedelta(hours=1)
+            continue
+        if moment.minute not in fields['minute']:
+            moment += timedelta(minutes=1)
+            continue
+        return moment.timestamp()
+    raise ValueError("Cron expression never matches")
+
+
+class Schedule:
+    """Recurring URL definitions released into the queue when due.
+
+    Definitions are indexed by their next run time in a heap, so a tick
+    only touches the ones that are due rather than scanning them all.
+    Removal is lazy: the heap entry is skipped when it comes up. Runs
+    missed while the coordinator was down are not replayed; the next run
+    is the first one after now.
+    """
+    def __init__(self):
+        self.entries = {}  # schedule_id -> definition
+        self.heap = []  # (next_run, seq, schedule_id)
+        self.counter = itertools.count()
+
+    def add(self, url, interval=None, cron=None, priority=1, start=None, schedule_id=None):
+        """Run url every `interval` seconds or on a cron expression; returns the schedule id"""
+        if not isinstance(url, str) or not url.strip():
+            raise ValueError("A schedule needs a URL")
+        if (interval is None) == (cron is None):
+            raise ValueError("Give exactly one of interval or cron")
+        if interval is not None and interval <= 0:
+            raise ValueError("Interval must be positive")
+        entry = {
+            'id': schedule_id or str(uuid.uuid4()),
+            'url': url,
+            'priority': priority,
+            'interval': interval,
+            'cron': cron,
+            'fields': parse_cron(cron) if cron else None
+        }
+        entry['seq'] = next(self.counter)
+        now = time.time()
+        if start is not None:
+            entry['next_run'] = start
+        elif interval is not None:
+            entry['next_run'] = now
+        else:
+            entry['next_run'] = next_cron_time(entry['fields'], now)
+        self.entries[entry['id']] = entry
+        heapq.heappush(self.heap, (entry['next_run'], entry['seq'], entry['id']))
+        return entry['id']
+
+    def remove(self, schedule_id):
+        return self.entries.pop(schedule_id, None) is not None
+
+    def _advance(self, entry, now):
+        if entry['interval'] is not None:
+            missed = (now - entry['next_run']) // entry['interval'] + 1
+            return entry['next_run'] + max(1, missed) * entry['interval']
+        return next_cron_time(entry['fields'], now)
+
+    def due(self, now=None):
+        """Pop the definitions due at `now`, reschedule them, and return them"""
+        now = time.time() if now is None else now
+        released = []
+        while self.heap and self.heap[0][0] <= now:
+            _, seq, schedule_id = heapq.heappop(self.heap)
+            entry = self.entries.get(schedule_id)
+            if entry is None or entry['seq'] != seq:
+                continue  # Removed, or replaced by a newer definition
+            released.append(entry)
+            entry['next_run'] = self._advance(entry, now)
+            entry['seq'] = next(self.counter)
+            heapq.heappush(self.heap, (entry['next_run'], entry['seq'], schedule_id))
+        return released
+
+    def next_due(self):
+        """Time of the earliest run, or None when nothing is scheduled"""
+        while self.heap and self.entries.get(self.heap[0][2], {}).get('seq') != self.heap[0][1]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def save(self, path):
+        """Write definitions as JSON lines, via a temp file"""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps({key: value for key, value in entry.items()
+                                    if key not in ('fields', 'seq')}) + '\n')
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                self.add(entry['url'], interval=entry['interval'], cron=entry['cron'],
+                         priority=entry['priority'], start=entry['next_run'], schedule_id=entry['id'])
+        return len(self.entries)
@@ -56,7 +56,9 @@ class Scheduler:
                 
                 # Assign to worker
                 print(f"Assigning task {task.id} to worker")
-                worker.assign_task(task)
+                if not worker.assign_task(task):
+                    # Worker filled up in the meantime, retry later
+                    self.tasks.insert(0, task)
             
             # Short sleep to avoid CPU spinning
             time.sleep(0.1)
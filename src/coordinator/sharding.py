@@ -0,0 +1,172 @@
+import bisect
+import hashlib
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+from src.utils.network import MessageClient
+
+
+def shard_key(url):
+    """Partition key for a URL: its hostname, so a domain lives on one shard"""
+    host = urlparse(url).hostname
+    return host.lower() if host else url
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class ConsistentHashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Adding or removing a node only moves the keys in its own arcs, so
+    growing from N to N+1 shards reassigns about 1/(N+1) of the domains.
+    """
+    def __init__(self, nodes=None, replicas=100):
+        self.replicas = replicas
+        self.ring = []
+        self.owners = {}
+        for node in nodes or []:
+            self.add_node(node)
+
+    def add_node(self, node):
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            bisect.insort(self.ring, point)
+            self.owners[point] = node
+
+    def remove_node(self, node):
+        points = [p for p, owner in self.owners.items() if owner == node]
+        for point in points:
+            del self.owners[point]
+            self.ring.pop(bisect.bisect_left(self.ring, point))
+
+    def get_node(self, key):
+        if not self.ring:
+            raise LookupError("Hash ring is empty")
+        index = bisect.bisect(self.ring, _hash(key)) % len(self.ring)
+        return self.owners[self.ring[index]]
+
+
+def shard_name(shard):
+    return f"{shard['host']}:{shard['port']}"
+
+
+class ShardRouter:
+    """Routes URLs and workers to coordinator shards.
+
+    `shards` is the list of {"host", "port"} entries from the "shards"
+    setting; every coordinator and client builds the same ring from it.
+    Requests to a shard are sent once and wait at most `timeout` seconds,
+    so a shard that is down fails the call instead of blocking the
+    coordinator thread that made it.
+    """
+    def __init__(self, shards, replicas=100, timeout=10, max_retries=2):
+        self.shards = {shard_name(shard): shard for shard in shards}
+        self.ring = ConsistentHashRing(self.shards, replicas=replicas)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def shard_for_url(self, url):
+        return self.shards[self.ring.get_node(shard_key(url))]
+
+    def shard_for_worker(self, worker_id):
+        """Home shard of a worker, spreading workers evenly across shards"""
+        return self.shards[self.ring.get_node(f"worker:{worker_id}")]
+
+    def owns(self, shard, url):
+        return self.ring.get_node(shard_key(url)) == shard_name(shard)
+
+    def _client(self, name):
+        """Connected client for a shard, replacing one whose connection dropped"""
+        with self.lock:
+            client = self.clients.get(name)
+            if client is not None and client.connected:
+                return client
+        # Connect outside the lock so a shard that is down does not hold up
+        # forwarding to the others
+        shard = self.shards[name]
+        client = MessageClient(host=shard['host'], port=shard['port'], timeout=self.timeout,
+                               reconnect=False, max_retries=self.max_retries)
+        if not client.connect():
+            raise ConnectionError(f"Cannot reach shard {name}")
+        with self.lock:
+            current = self.clients.get(name)
+            if current is not None and current.connected:
+                # Another thread connected first; keep its client
+                client, current = current, client
+            else:
+                self.clients[name] = client
+        if current is not None:
+            current.disconnect()
+        return client
+
+    def add_tasks(self, urls, priority=1, depth=0, job_id=None):
+        """Send URLs to their owning shards, one batched message per shard.
+
+        Returns the new task ids and the URLs whose shard could not be
+        reached or refused them, for the caller to queue itself.
+        """
+        by_shard = {}
+        for url in urls:
+            by_shard.setdefault(self.ring.get_node(shard_key(url)), []).append(url)
+
+        task_ids = []
+        unreachable = []
+        for name, shard_urls in by_shard.items():
+            try:
+                response = self._client(name).send_message({
+                    "action": "add_tasks",
+                    "urls": shard_urls,
+                    "priority": priority,
+                    "depth": depth,
+                    "job_id": job_id
+                })
+            except (OSError, FutureTimeoutError) as e:
+                print(f"Shard {name} unreachable, {len(shard_urls)} URLs not forwarded: {e or type(e).__name__}")
+                unreachable.extend(shard_urls)
+                continue
+            if response.get("status") != "ok":
+                print(f"Shard {name} refused {len(shard_urls)} URLs: {response.get('message')}")
+                unreachable.extend(shard_urls)
+                continue
+            task_ids.extend(response.get("task_ids", []))
+        return task_ids, unreachable
+
+    def broadcast(self, message, exclude=None):
+        """Send a message to every shard except `exclude`; returns the responses by shard name.
+
+        A shard that cannot be reached gets an error response instead.
+        """
+        skip = shard_name(exclude) if exclude else None
+        futures = {}
+        responses = {}
+        for name in self.shards:
+            if name == skip:
+                continue
+            try:
+                futures[name] = self._client(name).request(message)
+            except OSError as e:
+                responses[name] = {"status": "error", "message": str(e)}
+        for name, future in futures.items():
+            try:
+                responses[name] = future.result(timeout=self.timeout)
+            except (OSError, FutureTimeoutError) as e:
+                responses[name] = {"status": "error", "message": str(e) or type(e).__name__}
+        for name, response in responses.items():
+            if response.get("status") != "ok":
+                print(f"Shard {name} did not take {message.get('action')}: {response.get('message')}")
+        return responses
+
+    def add_task(self, url, priority=1):
+        """Forward one URL; returns its task id, or None if its shard is unreachable"""
+        task_ids, _ = self.add_tasks([url], priority)
+        return task_ids[0] if task_ids else None
+
+    def close(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.disconnect()
+            self.clients = {}
@@ -1,26 +1,216 @@
+import argparse
 import json
 import time
 import os
 from datetime import datetime
+import threading
 from threading import Thread
-from src.utils.network import MessageServer
+from src.utils.network import MessageServer, DEFAULT_MAX_FRAME_SIZE, DEFAULT_COMPRESSION_THRESHOLD
 from src.models.task import Task
+from src.coordinator.liveness import LivenessTracker
+from src.coordinator.sharding import ShardRouter
+from src.coordinator.queue_backend import MemoryQueueBackend, create_queue_backend
+from src.coordinator.crawl import CrawlPolicy
+from src.coordinator.dedup import FingerprintIndex
+from src.coordinator.schedule import Schedule
+from src.coordinator.jobs import JobTracker, combine_progress
+from src.coordinator.circuit import CircuitBreakers, url_host
+from src.coordinator.export import ResultExporter
+from src.utils.config import load_config, validate, ConfigWatcher, WORKER_TUNABLES, COORDINATOR_TUNABLES
+from src.utils.profiling import profiler
+
+# Load figures a worker reports with each heartbeat
+HEARTBEAT_FIELDS = ('concurrency_limit', 'in_flight', 'free_slots', 'throughput', 'load_avg', 'rss_mb',
+                    'dns_hit_rate')
+# Tasks one lease call may set aside before it lets other requests have the lock
+MAX_SKIPPED_PER_LEASE = 200
 
 class CoordinatorServer(MessageServer):
-    def __init__(self, host='localhost', port=5000):
-        super().__init__(host=host, port=port)
-        self.tasks = []
-        self.pending_tasks = []
+    def __init__(self, host='localhost', port=5000, worker_timeout=30, shards=None, shard_index=0,
+                 queue=None, max_frame_size=DEFAULT_MAX_FRAME_SIZE,
+                 compression_threshold=DEFAULT_COMPRESSION_THRESHOLD, crawl=None, fingerprints=None,
+                 breakers=None, exporter=None):
+        super().__init__(host=host, port=port, max_frame_size=max_frame_size,
+                         compression_threshold=compression_threshold)
+        # Pending tasks and worker leases live in a pluggable backend
+        self.queue = queue or MemoryQueueBackend()
         self.completed_tasks = {}
         self.worker_registry = {}
+        # Client threads run concurrently; guards the task lists and registry
+        self.lock = threading.RLock()
+        # Signalled when tasks are added so long-polling get_task calls wake up
+        self.task_available = threading.Condition(self.lock)
+        self.max_poll_wait = 30
+        # Sum of free_slots over all registered workers, kept incrementally
+        self.total_free_slots = 0
+        # Any message from a worker counts as a sign of life
+        self.liveness = LivenessTracker(timeout=worker_timeout)
+        # In sharded mode this instance owns one consistent-hash partition of domains
+        self.shards = shards or []
+        self.shard = self.shards[shard_index] if self.shards else None
+        self.router = ShardRouter(self.shards) if self.shards else None
+        self.state_path = f'data/state-shard{shard_index}.json' if self.shards else 'data/state.json'
+        # Progress counters and cancellation for batches of tasks
+        self.jobs = JobTracker()
+        # Recurring URLs, released into the queue as they come due
+        self.schedule = Schedule()
+        self.schedule_path = self.state_path.replace('state', 'schedule', 1)
+        self.schedule_changed = False  # Definitions added or removed since the last save
+        # Only the first pending tasks are written for the dashboard; the
+        # queue itself can hold far more than is reasonable to serialize
+        self.state_pending_limit = 1000
+        # Which links returned by workers are followed; off unless configured
+        self.crawl = crawl or CrawlPolicy()
+        # Parsed results by page fingerprint, so workers can skip duplicate
+        # pages; None unless workers are set to ask (dedup.remote_lookup)
+        self.fingerprints = fingerprints
+        self.duplicates = 0
+        # Tasks for hosts that keep failing are parked instead of dispatched
+        self.breakers = breakers or CircuitBreakers()
+        # Optionally streams finished tasks to a CSV or Parquet file as they arrive
+        self.exporter = exporter
+        # Tunables pushed to workers in heartbeat replies; the version tells
+        # which workers have not seen the latest values yet
+        self.settings = {}
+        self.settings_version = 0
+        # Set while stopping gracefully: no new leases, results still accepted
+        self.draining = False
+    
+    @property
+    def pending_tasks(self):
+        """Snapshot of the pending tasks in dispatch order"""
+        with self.lock:
+            return self.queue.pending_tasks()
+    
+    def pending_count(self):
+        """Queued tasks that will be dispatched, leaving out those of cancelled jobs"""
+        with self.lock:
+            return max(0, self.queue.pending_count() - self.jobs.queued_cancelled())
+    
+    @property
+    def tasks(self):
+        """Snapshot of the tasks currently leased to workers"""
+        with self.lock:
+            return self.queue.active_tasks()
     
     def add_task(self, url, priority=1):
         """Add a new task to the queue"""
+        if self.router and not self.router.owns(self.shard, url):
+            task_id = self.router.add_task(url, priority)
+            if task_id:
+                return task_id
+            # Its shard is down; crawl it here rather than lose it
+        
         task = Task(url, priority=priority)
-        self.pending_tasks.append(task)
+        with self.lock:
+            self.crawl.mark_seen(url)
+            self.queue.push([task])
+            self.task_available.notify()
         print(f"Added task {task.id} for URL {url}")
         return task.id
     
+    def add_tasks(self, urls, priority=1, depth=0, job_id=None):
+        """Add many tasks at once, forwarding URLs owned by other shards.
+
+        Discovered links (depth > 0) are dropped if the URL was already
+        queued, so each page is crawled once per coordinator.
+        """
+        task_ids = []
+        if self.router:
+            foreign = [url for url in urls if not self.router.owns(self.shard, url)]
+            if foreign:
+                forwarded, unreachable = self.router.add_tasks(foreign, priority, depth, job_id)
+                task_ids.extend(forwarded)
+                # URLs a shard is down for or refused are crawled here rather than lost
+                urls = [url for url in urls if self.router.owns(self.shard, url)] + unreachable
+        
+        with self.lock:
+            if self.jobs.is_cancelled(job_id):
+                return task_ids
+            fresh = [url for url in urls if self.crawl.mark_seen(url)]
+            if depth:
+                urls = fresh
+                self.crawl.count_enqueued(len(urls))
+            tasks = [Task(url, priority=priority, depth=depth, job_id=job_id) for url in urls]
+            self.jobs.added(job_id, len(tasks))
+            self.queue.push(tasks)
+            self.task_available.notify(len(tasks))
+        if tasks:
+            print(f"Added {len(tasks)} tasks")
+        return task_ids + [task.id for task in tasks]
+    
+    def submit_job(self, urls, priority=1, name=None):
+        """Add a batch of URLs as one job; returns the job id and task ids"""
+        with self.lock:
+            job_id = self.jobs.create(name=name)
+        return job_id, self.add_tasks(urls, priority, job_id=job_id)
+    
+    def cancel_job(self, job_id):
+        """Stop dispatching a job's tasks; pending ones are dropped as they come up"""
+        with self.lock:
+            leased = sum(1 for task in self.queue.active_tasks() if task.job_id == job_id)
+            cancelled = self.jobs.cancel(job_id, leased)
+        if cancelled and self.router:
+            self.router.broadcast({"action": "cancel_job", "job_id": job_id, "forwarded": True},
+                                  exclude=self.shard)
+        return cancelled
+    
+    def job_progress(self, job_id, local=False):
+        """Progress of a job, summed over the shards its URLs were forwarded to"""
+        with self.lock:
+            progress = self.jobs.progress(job_id)
+        if local or not self.router:
+            return progress
+        responses = self.router.broadcast({"action": "job_status", "job_id": job_id, "forwarded": True},
+                                          exclude=self.shard)
+        return combine_progress([progress] + [response.get('job') for response in responses.values()])
+    
+    def schedule_task(self, url, interval=None, cron=None, priority=1):
+        """Add a URL that is queued every `interval` seconds or on a cron schedule"""
+        with self.lock:
+            schedule_id = self.schedule.add(url, interval=interval, cron=cron, priority=priority)
+            self.schedule_changed = True
+        print(f"Scheduled {url} ({f'every {interval}s' if interval else cron}) as {schedule_id}")
+        return schedule_id
+    
+    def unschedule(self, schedule_id):
+        with self.lock:
+            removed = self.schedule.remove(schedule_id)
+            self.schedule_changed = self.schedule_changed or removed
+            return removed
+
+    def save_schedule(self):
+        """Write the schedule if definitions changed, so a crash does not lose them"""
+        with self.lock:
+            if self.schedule_changed:
+                self.schedule.save(self.schedule_path)
+                self.schedule_changed = False
+    
+    def release_due_tasks(self, now=None):
+        """Queue every scheduled URL that is due; returns how many were queued"""
+        with self.lock:
+            due = self.schedule.due(now)
+        by_priority = {}
+        for entry in due:
+            by_priority.setdefault(entry['priority'], []).append(entry['url'])
+        for priority, urls in by_priority.items():
+            self.add_tasks(urls, priority)
+        return len(due)
+    
+    def release_probes(self, now=None):
+        """Requeue one parked task for each open circuit whose wait is over.
+
+        Also requeues deferred tasks that are due, e.g. tasks parked before
+        a crash, whose circuits this coordinator does not know.
+        """
+        with self.lock:
+            released = self.queue.undefer(self.breakers.due_probes(now))
+            due = self.queue.undefer_due(now)
+            if released or due:
+                self.task_available.notify_all()
+        return released
+    
+    @profiler.profiled('coordinator.process_message')
     def process_message(self, message, client):
         """Handle messages from workers"""
         if 'action' not in message:
@@ -30,76 +220,437 @@ class CoordinatorServer(MessageServer):
         worker_id = message.get('worker_id')
         
         if action == 'register':
-            return self.register_worker(worker_id, client)
-        elif action == 'heartbeat':
-            return self.update_heartbeat(worker_id)
+            return self.register_worker(worker_id, client, message.get('held_tasks'),
+                                        message.get('settings_version'))
+        
+        if worker_id:
+            self.touch_worker(worker_id)
+        
+        if action == 'heartbeat':
+            return self.update_heartbeat(worker_id, message)
         elif action == 'get_task':
-            return self.assign_task()
+            return self.assign_task(worker_id, message.get('max_tasks', 1), message.get('wait', 0))
         elif action == 'submit_result':
             return self.submit_task_result(message)
+        elif action == 'submit_results':
+            return self.submit_task_results(message.get('results', []))
+        elif action == 'drain':
+            return self.drain_worker(worker_id)
+        elif action == 'return_tasks':
+            return self.return_tasks(worker_id, message.get('task_ids', []))
+        elif action == 'unregister':
+            return self.unregister_worker(worker_id)
+        elif action == 'schedule':
+            try:
+                schedule_id = self.schedule_task(message.get('url'), message.get('interval'),
+                                                 message.get('cron'), message.get('priority', 1))
+            except ValueError as e:
+                return {"status": "error", "message": str(e)}
+            return {"status": "ok", "schedule_id": schedule_id}
+        elif action == 'unschedule':
+            if self.unschedule(message.get('schedule_id')):
+                return {"status": "ok"}
+            return {"status": "error", "message": "Schedule not found"}
+        elif action == 'lookup_fingerprint':
+            return self.lookup_fingerprint(message.get('fingerprint'), message.get('simhash'))
+        elif action == 'add_tasks':
+            task_ids = self.add_tasks(message.get('urls', []), message.get('priority', 1),
+                                      message.get('depth', 0), message.get('job_id'))
+            return {"status": "ok", "task_ids": task_ids}
+        elif action == 'submit_job':
+            job_id, task_ids = self.submit_job(message.get('urls', []), message.get('priority', 1),
+                                               message.get('name'))
+            return {"status": "ok", "job_id": job_id, "task_ids": task_ids}
+        elif action == 'job_status':
+            progress = self.job_progress(message.get('job_id'), local=message.get('forwarded', False))
+            if message.get('forwarded'):
+                # This shard's share, possibly none
+                return {"status": "ok", "job": progress}
+            if progress is None:
+                return {"status": "error", "message": "Job not found"}
+            return {"status": "ok", "job": progress}
+        elif action == 'cancel_job':
+            if message.get('forwarded'):
+                # Tombstone it here too, even if none of its tasks have arrived yet
+                with self.lock:
+                    self.jobs.cancel(self.jobs.create(message.get('job_id')))
+                return {"status": "ok"}
+            if self.cancel_job(message.get('job_id')):
+                return {"status": "ok"}
+            return {"status": "error", "message": "Job not found"}
+        elif action == 'directory':
+            return {"status": "ok", "shards": self.shards or [{"host": self.host, "port": self.port}]}
         
         return {"status": "error", "message": "Unknown action"}
     
-    def register_worker(self, worker_id, client):
-        """Register a new worker"""
+    def is_blocking(self, message):
+        """Long polls run on their own thread so the worker's other requests are not held up"""
+        return message.get('action') == 'get_task' and message.get('wait', 0) > 0
+    
+    def register_worker(self, worker_id, client, held_tasks=None, settings_version=None):
+        """Register a new worker, or a known one resuming after a reconnect.
+
+        A resuming worker lists the tasks it is still working on. Any that
+        are no longer leased to it (they expired or were requeued while it
+        was away) are reported back as lost; their results will be refused.
+        Tasks leased to it that it does not list, e.g. from a lease whose
+        reply never reached it, are requeued.
+        """
         if worker_id:
-            self.worker_registry[worker_id] = {
-                'client': client,
-                'status': 'available',
-                'last_heartbeat': time.time()
-            }
+            with self.lock:
+                old = self.worker_registry.get(worker_id)
+                if old:
+                    self.total_free_slots -= old.get('free_slots', 0)
+                self.worker_registry[worker_id] = {
+                    'client': client,
+                    'status': 'available',
+                    'last_heartbeat': time.time(),
+                    'free_slots': 0
+                }
+                self.liveness.touch(worker_id)
+                lost = []
+                released = 0
+                if held_tasks is not None:
+                    leased = self.queue.worker_leases(worker_id)
+                    lost = [task_id for task_id in held_tasks if task_id not in leased]
+                    orphaned = leased.difference(held_tasks)
+                    if orphaned:
+                        released = self.queue.release(list(orphaned))
+                        self.task_available.notify(released)
+            settings = self.worker_settings(settings_version)
+            if released:
+                print(f"Requeued {released} tasks leased to worker {worker_id} that it does not hold")
+            if held_tasks:
+                print(f"Worker {worker_id} resumed with {len(held_tasks)} tasks, {len(lost)} no longer leased")
+                return dict({"status": "ok", "lost_tasks": lost}, **settings)
             print(f"Registered worker {worker_id}")
-            return {"status": "ok"}
+            return dict({"status": "ok"}, **settings)
         return {"status": "error", "message": "Invalid worker ID"}
     
-    def update_heartbeat(self, worker_id):
-        """Update worker heartbeat"""
-        if worker_id in self.worker_registry:
-            self.worker_registry[worker_id]['last_heartbeat'] = time.time()
-            return {"status": "ok"}
-        return {"status": "error", "message": "Worker not found"}
+    def update_heartbeat(self, worker_id, message=None):
+        """Update worker heartbeat and the load it reports"""
+        with self.lock:
+            info = self.worker_registry.get(worker_id)
+            if info is None:
+                return {"status": "error", "message": "Worker not found"}
+            
+            self.touch_worker(worker_id)
+            if message:
+                for field in HEARTBEAT_FIELDS:
+                    if field in message:
+                        if field == 'free_slots':
+                            self.total_free_slots += message[field] - info.get(field, 0)
+                        info[field] = message[field]
+                if 'free_slots' in message and not info.get('draining'):
+                    info['status'] = 'available' if info['free_slots'] > 0 else 'busy'
+            if info.get('draining'):
+                return {"status": "ok", "drain": True}
+            return dict({"status": "ok"}, **self.worker_settings((message or {}).get('settings_version')))
+    
+    def touch_worker(self, worker_id):
+        """Record activity from a registered worker"""
+        with self.lock:
+            info = self.worker_registry.get(worker_id)
+            if info is None:
+                return
+            now = time.time()
+            info['last_heartbeat'] = now
+            if info['status'] == 'offline':
+                info['status'] = 'available'
+            self.liveness.touch(worker_id, now)
+    
+    def drain_worker(self, worker_id):
+        """Ask a worker to stop leasing; it learns on its next poll or heartbeat"""
+        with self.lock:
+            info = self.worker_registry.get(worker_id)
+            if info is None:
+                return {"status": "error", "message": "Worker not found"}
+            info['draining'] = True
+            info['status'] = 'draining'
+            # Wake its long poll so the worker hears about it right away
+            self.task_available.notify_all()
+        print(f"Draining worker {worker_id}")
+        return {"status": "ok", "drain": True}
     
-    def assign_task(self):
-        """Assign tasks to available workers"""
-        if not self.pending_tasks:
-            return {"status": "ok", "has_task": False}
+    def return_tasks(self, worker_id, task_ids):
+        """Requeue leased tasks a draining worker will not finish"""
+        with self.lock:
+            returned = self.queue.release(task_ids)
+            if returned:
+                self.task_available.notify(returned)
+        print(f"Worker {worker_id} returned {returned} tasks")
+        return {"status": "ok", "requeued": returned}
+    
+    def unregister_worker(self, worker_id):
+        """Remove a worker that is shutting down, requeueing anything it still holds"""
+        with self.lock:
+            info = self.worker_registry.pop(worker_id, None)
+            if info is None:
+                return {"status": "error", "message": "Worker not found"}
+            self.total_free_slots -= info.get('free_slots', 0)
+            self.liveness.remove(worker_id)
+            requeued = self.requeue_worker_tasks(worker_id)
+        print(f"Worker {worker_id} left, requeued {requeued} tasks")
+        return {"status": "ok"}
+    
+    def check_workers(self):
+        """Mark workers that stopped talking as offline and requeue their tasks"""
+        with self.lock:
+            dead = self.liveness.expired()
+            for worker_id in dead:
+                info = self.worker_registry.get(worker_id)
+                if info is None:
+                    continue
+                info['status'] = 'offline'
+                self.total_free_slots -= info.get('free_slots', 0)
+                info['free_slots'] = 0
+                requeued = self.requeue_worker_tasks(worker_id)
+                print(f"Worker {worker_id} timed out, requeued {requeued} tasks")
+        return dead
+    
+    def requeue_worker_tasks(self, worker_id):
+        """Move the tasks leased to a worker back to the pending queue"""
+        with self.lock:
+            returned = self.queue.requeue_worker(worker_id)
+            if returned:
+                self.task_available.notify(returned)
+            return returned
+    
+    def expire_leases(self):
+        """Requeue leases that outlived the backend's lease timeout"""
+        with self.lock:
+            expired = self.queue.expire_leases()
+            if expired:
+                print(f"Requeued {expired} tasks with expired leases")
+                self.task_available.notify(expired)
+            return expired
+    
+    def lease_size(self, worker_id, requested):
+        """Decide how many tasks to hand a worker asking for `requested`.
+
+        When there is enough work for everyone each worker gets what it
+        asks for. Otherwise pending tasks are shared in proportion to free
+        slots, so underloaded workers receive more of the scarce work.
+        """
+        requested = max(1, requested)
+        pending = self.pending_count()
+        if pending >= self.total_free_slots:
+            return requested
         
-        self.pending_tasks.sort(key=lambda t: t.priority, reverse=True)
-        task = self.pending_tasks.pop(0)
-        self.tasks.append(task)
+        info = self.worker_registry.get(worker_id, {})
+        free = max(requested, info.get('free_slots', 0))
+        total_free = max(self.total_free_slots, free)
+        share = -(-pending * free // total_free)  # ceiling division
+        return max(1, min(requested, share))
+    
+    def _lease_live(self, worker_id, count):
+        """Lease tasks, dropping those of cancelled jobs and parking those of failing hosts.
+
+        Parked tasks are deferred in the queue backend, so they survive a
+        crash and never pile up in memory; the deferral runs out after
+        max_reset_timeout in case no circuit remembers them. At most
+        MAX_SKIPPED_PER_LEASE tasks are dropped or parked per call, so a
+        large cancelled job or a dead host at the head of the queue is
+        worked through a slice at a time.
+        """
+        live = []
+        skipped = 0
+        while not live and skipped < MAX_SKIPPED_PER_LEASE:
+            leased = self.queue.lease(worker_id, count)
+            if not leased:
+                break
+            parked = {}
+            for task in leased:
+                host = url_host(task.url)
+                if self.jobs.is_cancelled(task.job_id):
+                    self.queue.complete(task.id)
+                    self.jobs.dropped(task.job_id)
+                    skipped += 1
+                elif not self.breakers.allow(host, task.id):
+                    parked.setdefault(host, []).append(task.id)
+                    skipped += 1
+                else:
+                    live.append(task)
+            until = time.time() + self.breakers.max_reset_timeout
+            for host, task_ids in parked.items():
+                self.queue.defer(task_ids, until)
+                self.breakers.park(host, task_ids)
+        return live
+    
+    def assign_task(self, worker_id=None, max_tasks=1, wait=0):
+        """Lease up to max_tasks of the highest-priority tasks to a worker.
+
+        With `wait` > 0 the call long-polls: it blocks for up to that many
+        seconds until a task is added instead of returning empty at once.
+        """
+        deadline = time.monotonic() + min(wait, self.max_poll_wait)
+        with self.lock:
+            while True:
+                if self.worker_registry.get(worker_id, {}).get('draining'):
+                    return {"status": "ok", "has_task": False, "tasks": [], "drain": True}
+                if self.queue.pending_count() and not self.draining:
+                    leased = self._lease_live(worker_id, self.lease_size(worker_id, max_tasks))
+                    if leased:
+                        break
+                    if self.queue.pending_count():
+                        # A slice of the queue was dropped or parked; let
+                        # other requests have the lock, then look further
+                        self.task_available.wait(0.001)
+                        continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.running:
+                    return {"status": "ok", "has_task": False, "tasks": []}
+                # Other coordinators can fill a shared queue without notifying us
+                self.task_available.wait(min(remaining, 0.5) if self.queue.shared else remaining)
+                if not self.running:
+                    return {"status": "ok", "has_task": False, "tasks": []}
+            
+            # Count the lease against the worker until its next heartbeat
+            info = self.worker_registry.get(worker_id)
+            if info is not None:
+                taken = min(len(leased), info.get('free_slots', 0))
+                info['free_slots'] = info.get('free_slots', 0) - taken
+                self.total_free_slots -= taken
         
-        return {"status": "ok", "has_task": True, "task": task.to_dict()}
+        tasks = [dict(task.to_dict(), extract_links=self.crawl.should_expand(task)) for task in leased]
+        return {"status": "ok", "has_task": True, "task": tasks[0], "tasks": tasks}
+    
+    def stop(self, drain_timeout=0):
+        """Stop the server, releasing workers blocked in get_task.
+
+        With drain_timeout > 0 no new tasks are leased and results for
+        leased tasks are still accepted for up to that many seconds, so a
+        restart does not throw away work that is nearly done.
+        """
+        self.draining = True
+        deadline = time.monotonic() + drain_timeout
+        while self.queue.active_count() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.running = False
+        with self.lock:
+            self.task_available.notify_all()
+            # A restarted coordinator knows no circuits; let it retry these at once
+            self.queue.undefer(self.breakers.unpark_all())
+            self.queue.close()
+        if self.exporter is not None:
+            print(f"Exported {self.exporter.close()} results to {self.exporter.path}")
+        super().stop()
+    
+    def lookup_fingerprint(self, fingerprint, simhash=None):
+        """Find the result of an already parsed page with the same content"""
+        with self.lock:
+            match = None
+            if fingerprint and self.fingerprints is not None:
+                match = self.fingerprints.lookup(fingerprint, simhash)
+        if match is None:
+            return {"status": "ok", "found": False}
+        task_id, result = match
+        return {"status": "ok", "found": True, "task_id": task_id, "result": result}
     
     def submit_task_result(self, message):
         """Process task results from workers"""
         task_id = message.get('task_id')
         result = message.get('result')
         error = message.get('error')
+        # Outbound links are turned into tasks, not kept with the result
+        outlinks = result.pop('outlinks', None) if isinstance(result, dict) else None
+        links = []
+        # Errors like a 404 say nothing about the host; workers flag the ones that do
+        host_failure = message.get('host_failure', bool(error))
+        
+        with self.lock:
+            task = self.queue.complete(task_id)
+            # Buffered workers may deliver a result again after a timeout or a replay
+            duplicate = task is None and task_id in self.completed_tasks
+            if task:
+                task.update_status('failed' if error else 'completed')
+                task.error = error if error else None
+                task.result = result if not error else None
+                
+                self.completed_tasks[task.id] = task
+                self.jobs.finished(task.job_id, failed=bool(error))
+                reopened = self.queue.undefer(self.breakers.record(url_host(task.url), host_failure))
+                if reopened:
+                    self.task_available.notify_all()
+                if not error and message.get('duplicate_of'):
+                    task.result = dict(result, duplicate_of=message['duplicate_of'])
+                    self.duplicates += 1
+                elif not error and message.get('fingerprint') and self.fingerprints is not None:
+                    self.fingerprints.add(message['fingerprint'], task.id, result, message.get('simhash'))
+                if outlinks:
+                    links = self.crawl.select_links(task, outlinks)
         
-        task = next((t for t in self.tasks if t.id == task_id), None)
+        if links:
+            # Outside the lock: links owned by other shards are sent over the network
+            try:
+                self.add_tasks(links, task.priority, task.depth + 1, task.job_id)
+            except Exception as e:
+                # The result is already recorded; losing its links must not refuse it
+                print(f"Error adding links from task {task_id}: {str(e)}")
+        if task and self.exporter is not None:
+            try:
+                self.exporter.write(task)
+            except Exception as e:
+                # The result is kept either way; a broken export must not refuse it
+                print(f"Error exporting results: {str(e)}")
         if task:
-            task.update_status('failed' if error else 'completed')
-            task.error = error if error else None
-            task.result = result if not error else None
-            
-            self.completed_tasks[task.id] = task
-            self.tasks.remove(task)
-            
             print(f"Task {task_id} {'failed' if error else 'completed'}")
             return {"status": "ok"}
+        if duplicate:
+            return {"status": "ok", "duplicate": True}
         
         return {"status": "error", "message": "Task not found"}
     
-    @staticmethod
-    def load_config():
-        """Load configuration from settings.json file."""
-        try:
-            with open('config/settings.json', 'r') as config_file:
-                return json.load(config_file)
-        except Exception as e:
-            print(f"Error loading configuration: {e}")
-            return {"coordinator_host": "localhost", "coordinator_port": 5000}
+    def submit_task_results(self, messages):
+        """Process a batch of results, each like a single submit_result"""
+        rejected = [message.get('task_id') for message in messages
+                    if self.submit_task_result(message).get('status') != 'ok']
+        if rejected:
+            print(f"Refused results for {len(rejected)} tasks that are no longer leased")
+        return {"status": "ok", "accepted": len(messages) - len(rejected), "rejected": rejected}
+    
+    def export_results(self, path, chunk_size=1000):
+        """Write every finished task to path (CSV, or Parquet for .parquet); returns the row count"""
+        with self.lock:
+            tasks = list(self.completed_tasks.values())
+        return ResultExporter(path, chunk_size=chunk_size).write_all(tasks).close()
+    
+    def update_settings(self, tunables):
+        """Apply changed tunables, here and on every worker; returns the names that changed"""
+        unknown = set(tunables) - set(WORKER_TUNABLES + COORDINATOR_TUNABLES)
+        if unknown:
+            raise ValueError(f"Not tunable at runtime: {', '.join(sorted(unknown))}")
+        with self.lock:
+            changed = {}
+            for key, value in tunables.items():
+                if isinstance(value, dict) and isinstance(self.settings.get(key), dict):
+                    value = dict(self.settings[key], **value)
+                value = validate(key, value)
+                if self.settings.get(key) != value:
+                    changed[key] = value
+            if not changed:
+                return []
+            if 'worker_timeout' in changed:
+                self.liveness.timeout = changed['worker_timeout']
+            for section, target in (('crawl', self.crawl), ('circuit_breaker', self.breakers)):
+                previous = self.settings.get(section) or {}
+                for key, value in changed.get(section, {}).items():
+                    if previous.get(key) != value and hasattr(target, key):
+                        setattr(target, key, value)
+            self.settings.update(changed)
+            if changed.keys() & set(WORKER_TUNABLES):
+                self.settings_version += 1
+        print(f"Settings changed: {', '.join(f'{key}={value}' for key, value in changed.items())}")
+        return list(changed)
+    
+    def worker_settings(self, known_version):
+        """Reply fields carrying the worker tunables to a worker on an older version"""
+        if known_version is None or known_version == self.settings_version:
+            return {}
+        return {"settings": {key: self.settings[key] for key in WORKER_TUNABLES if key in self.settings},
+                "settings_version": self.settings_version}
     
+    @profiler.profiled('coordinator.save_state')
     def save_state(self):
         """Save current state to a file for the dashboard"""
         os.makedirs('data', exist_ok=True)
@@ -107,34 +658,49 @@ class CoordinatorServer(MessageServer):
         def serialize_tasks(task_list):
             return [task.to_dict() for task in task_list]
         
-        workers = {
-            worker_id: {
-                'status': info.get('status', 'unknown'),
-                'last_heartbeat': datetime.fromtimestamp(info.get('last_heartbeat', 0)).strftime("%Y-%m-%d %H:%M:%S")
+        # Snapshot under the lock; client threads mutate these concurrently
+        with self.lock:
+            workers = {
+                worker_id: {
+                    'status': info.get('status', 'unknown'),
+                    'concurrency_limit': info.get('concurrency_limit'),
+                    'in_flight': info.get('in_flight'),
+                    'throughput': info.get('throughput'),
+                    'dns_hit_rate': info.get('dns_hit_rate'),
+                    'last_heartbeat': datetime.fromtimestamp(info.get('last_heartbeat', 0)).strftime("%Y-%m-%d %H:%M:%S")
+                }
+                for worker_id, info in self.worker_registry.items()
+            }
+        
+            stats = {
+                'pending': self.pending_count(),
+                'active': self.queue.active_count(),
+                'completed': len([t for t in self.completed_tasks.values() if t.status == 'completed']),
+                'failed': len([t for t in self.completed_tasks.values() if t.status == 'failed']),
+                'duplicates': self.duplicates,
+                'parked': self.queue.deferred_count(),
+                'open_circuits': sum(1 for circuit in self.breakers.circuits.values()
+                                     if circuit['state'] != 'closed')
+            }
+        
+            state = {
+                'workers': workers,
+                'tasks': {
+                    'pending': serialize_tasks(self.queue.pending_tasks(limit=self.state_pending_limit)),
+                    'active': serialize_tasks(self.tasks),
+                    'completed': serialize_tasks([t for t in self.completed_tasks.values() if t.status == 'completed']),
+                    'failed': serialize_tasks([t for t in self.completed_tasks.values() if t.status == 'failed'])
+                },
+                'jobs': {job_id: self.jobs.progress(job_id) for job_id in self.jobs.jobs},
+                'stats': stats
             }
-            for worker_id, info in self.worker_registry.items()
-        }
-        
-        stats = {
-            'pending': len(self.pending_tasks),
-            'active': len(self.tasks),
-            'completed': len([t for t in self.completed_tasks.values() if t.status == 'completed']),
-            'failed': len([t for t in self.completed_tasks.values() if t.status == 'failed'])
-        }
-        
-        state = {
-            'workers': workers,
-            'tasks': {
-                'pending': serialize_tasks(self.pending_tasks),
-                'active': serialize_tasks(self.tasks),
-                'completed': serialize_tasks([t for t in self.completed_tasks.values() if t.status == 'completed']),
-                'failed': serialize_tasks([t for t in self.completed_tasks.values() if t.status == 'failed'])
-            },
-            'stats': stats
-        }
-        
-        with open('data/state.json', 'w') as f:
+        
+        # Write to a temp file and rename so readers never see a partial file
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
             json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+        self.save_schedule()
 
 
 # Define handle_commands as a standalone function (not part of the class)
@@ -155,21 +721,111 @@ def handle_commands(coordinator):
                 task_id = coordinator.add_task(url, priority)
                 print(f"Added task {task_id} for URL {url} with priority {priority}")
             
+            elif command.startswith("every "):
+                parts = command.split()
+                if len(parts) < 3:
+                    print("Usage: every [seconds] [url] <priority>")
+                    continue
+                priority = int(parts[3]) if len(parts) > 3 else 5
+                coordinator.schedule_task(parts[2], interval=float(parts[1]), priority=priority)
+            
+            elif command.startswith("cron "):
+                parts = command.split()
+                if len(parts) < 7:
+                    print("Usage: cron [minute hour day month weekday] [url] <priority>")
+                    continue
+                priority = int(parts[7]) if len(parts) > 7 else 5
+                coordinator.schedule_task(parts[6], cron=" ".join(parts[1:6]), priority=priority)
+            
+            elif command.startswith("unschedule "):
+                found = coordinator.unschedule(command.split(" ", 1)[1].strip())
+                print("Schedule removed" if found else "Schedule not found")
+            
+            elif command == "schedules":
+                next_due = coordinator.schedule.next_due()
+                print(f"{len(coordinator.schedule)} scheduled URLs" +
+                      (f", next due in {max(0, next_due - time.time()):.0f}s" if next_due else ""))
+            
+            elif command.startswith("job "):
+                progress = coordinator.job_progress(command.split(" ", 1)[1].strip())
+                if progress is None:
+                    print("Job not found")
+                else:
+                    print(f"Job {progress['id']}: {progress['state']}, {progress['completed']}/{progress['total']} "
+                          f"completed, {progress['failed']} failed, {progress['cancelled']} cancelled, "
+                          f"{progress['remaining']} remaining")
+            
+            elif command.startswith("cancel "):
+                found = coordinator.cancel_job(command.split(" ", 1)[1].strip())
+                print("Job cancelled" if found else "Job not found")
+            
+            elif command.startswith("drain "):
+                response = coordinator.drain_worker(command.split(" ", 1)[1].strip())
+                print(response.get("message", "Worker will finish its tasks and leave"))
+            
+            elif command.startswith("export "):
+                path = command.split()[1]
+                print(f"Exported {coordinator.export_results(path)} results to {path}")
+            
+            elif command.startswith("set "):
+                parts = command.split(" ", 2)
+                if len(parts) < 3:
+                    print("Usage: set [setting] [json value]")
+                    continue
+                try:
+                    value = json.loads(parts[2])
+                except ValueError:
+                    value = parts[2]
+                try:
+                    print("Updated" if coordinator.update_settings({parts[1]: value}) else "Unchanged")
+                except ValueError as e:
+                    print(e)
+            
             elif command == "status":
-                print(f"Status: {len(coordinator.pending_tasks)} pending, "
-                    f"{len(coordinator.tasks)} active, "
+                print(f"Status: {coordinator.pending_count()} pending, "
+                    f"{coordinator.queue.active_count()} active, "
                     f"{len(coordinator.completed_tasks)} completed")
                 
             elif command == "workers":
                 for worker_id, info in coordinator.worker_registry.items():
                     last_seen = time.time() - info.get('last_heartbeat', 0)
-                    print(f"Worker {worker_id}: Status={info.get('status')}, Last seen={last_seen:.1f}s ago")
+                    print(f"Worker {worker_id}: Status={info.get('status')}, "
+                          f"Concurrency={info.get('concurrency_limit')}, In flight={info.get('in_flight')}, "
+                          f"Throughput={info.get('throughput') or 0:.2f}/s, Last seen={last_seen:.1f}s ago")
                 
+            elif command.startswith("profile"):
+                parts = command.split()
+                sub = parts[1] if len(parts) > 1 else "status"
+                if sub == "on":
+                    profiler.enabled = True
+                    print(f"Profiling enabled, dumping to {profiler.output_dir} every {profiler.dump_interval}s")
+                elif sub == "off":
+                    profiler.enabled = False
+                    print("Profiling disabled")
+                elif sub == "dump":
+                    paths = profiler.dump()
+                    print("\n".join(paths) if paths else "No profile data collected")
+                elif sub == "show" and len(parts) > 2:
+                    print(profiler.summary(parts[2]))
+                else:
+                    print(f"Profiling {'on' if profiler.enabled else 'off'}; "
+                          f"hooks with data: {', '.join(profiler.names()) or 'none'}")
+            
             elif command == "help":
                 print("Available commands:")
                 print("  add [url] <priority> - Add a new task with optional priority (1-10)")
                 print("  status - Show current status")
                 print("  workers - List connected workers")
+                print("  every [seconds] [url] <priority> - Scrape a URL on a fixed interval")
+                print("  cron [minute hour day month weekday] [url] <priority> - Scrape a URL on a cron schedule")
+                print("  unschedule [id] - Remove a recurring URL")
+                print("  schedules - Show how many URLs are scheduled")
+                print("  job [job_id] - Show the progress of a job")
+                print("  cancel [job_id] - Cancel the pending tasks of a job")
+                print("  drain [worker_id] - Stop a worker after its current tasks")
+                print("  export [path] - Write finished results to a .csv or .parquet file")
+                print("  set [setting] [value] - Change a tunable such as max_concurrency on all workers")
+                print("  profile on|off|dump|show <hook> - Control hot path profiling")
                 print("  help - Show this help")
             
             else:
@@ -181,10 +837,38 @@ def handle_commands(coordinator):
 
 # Update main function to reduce status printing frequency
 def main():
-    config = CoordinatorServer.load_config()
-    host = config.get("coordinator_host", "localhost")
-    port = config.get("coordinator_port", 5000)
-    coordinator = CoordinatorServer(host=host, port=port)
+    parser = argparse.ArgumentParser(description="Web scraper coordinator")
+    parser.add_argument("--shard", type=int, default=0,
+                        help="Index into the 'shards' setting when running sharded")
+    args = parser.parse_args()
+    
+    config = load_config()
+    watcher = ConfigWatcher()
+    profiler.configure(config["profiling"])
+    shards = config["shards"]
+    if shards:
+        host = shards[args.shard]["host"]
+        port = shards[args.shard]["port"]
+    else:
+        host = config["coordinator_host"]
+        port = config["coordinator_port"]
+    dedup = config["dedup"]
+    export = config["export"]
+    coordinator = CoordinatorServer(host=host, port=port,
+                                    worker_timeout=config["worker_timeout"],
+                                    shards=shards, shard_index=args.shard,
+                                    queue=create_queue_backend(config, args.shard if shards else None),
+                                    max_frame_size=config["max_frame_size"],
+                                    compression_threshold=config["compression_threshold"],
+                                    crawl=CrawlPolicy.from_config(config["crawl"]),
+                                    fingerprints=FingerprintIndex(max_size=dedup["index_size"],
+                                                                  max_distance=dedup["max_distance"])
+                                    if dedup["enabled"] and dedup["remote_lookup"] else None,
+                                    breakers=CircuitBreakers.from_config(config["circuit_breaker"]),
+                                    exporter=ResultExporter(export["path"], chunk_size=export["chunk_size"],
+                                                            append=True) if export["path"] else None)
+    # Workers read the same file at startup; only later changes are pushed to them
+    coordinator.settings = config.tunables()
     
     test_urls = [
         "https://example.com",
@@ -194,9 +878,14 @@ def main():
     ]
     
     for url in test_urls:
-        coordinator.add_task(url)
+        # Other shards may not be up yet; each shard seeds only its own URLs
+        if not coordinator.router or coordinator.router.owns(coordinator.shard, url):
+            coordinator.add_task(url)
     
     print(f"Added {len(test_urls)} URLs to the task queue")
+    loaded = coordinator.schedule.load(coordinator.schedule_path)
+    if loaded:
+        print(f"Loaded {loaded} recurring URLs")
     print(f"Starting coordinator server on {host}:{port}")
     
     coordinator.start()
@@ -212,16 +901,25 @@ def main():
             
             # Save state every second but only print status every status_interval
             if current_time - last_status_time >= status_interval:
-                if coordinator.tasks or coordinator.pending_tasks:
-                    print(f"\nStatus update: {len(coordinator.pending_tasks)} pending, "
-                          f"{len(coordinator.tasks)} active, "
+                if coordinator.queue.active_count() or coordinator.pending_count():
+                    print(f"\nStatus update: {coordinator.pending_count()} pending, "
+                          f"{coordinator.queue.active_count()} active, "
                           f"{len(coordinator.completed_tasks)} completed")
                 last_status_time = current_time
-                
+            
+            reloaded = watcher.poll()
+            if reloaded:
+                coordinator.update_settings(reloaded.tunables())
+            coordinator.release_due_tasks()
+            coordinator.release_probes()
+            coordinator.check_workers()
+            coordinator.expire_leases()
             coordinator.save_state()
+            profiler.maybe_dump()
     except KeyboardInterrupt:
         print("Shutting down coordinator...")
-        coordinator.stop()
+        coordinator.stop(drain_timeout=config["drain_timeout"])
+        coordinator.schedule.save(coordinator.schedule_path)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
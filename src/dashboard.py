@@ -1,7 +1,10 @@
 import json
 import time
 import os
-from flask import Flask, render_template_string, jsonify
+import threading
+from collections import deque
+from functools import wraps
+from flask import Flask, Response, render_template_string, jsonify
 from datetime import datetime
 
 app = Flask(__name__)
@@ -126,12 +129,9 @@ DASHBOARD_HTML = '''
 </html>
 '''
 
-def get_state_data():
-    """Get the current state for the dashboard"""
-    data_path = os.path.join('data', 'state.json')
-    
-    # Default empty state
-    state = {
+def empty_state():
+    """Return the state shown before the coordinator has written anything"""
+    return {
         "workers": {},
         "tasks": {
             "pending": [],
@@ -141,33 +141,135 @@ def get_state_data():
         },
         "stats": {
             "pending": 0,
-            "active": 0, 
+            "active": 0,
             "completed": 0,
             "failed": 0
         }
     }
-    
-    # Try to read the state file if it exists
-    try:
-        if os.path.exists(data_path):
-            with open(data_path, 'r') as f:
-                state = json.load(f)
-    except Exception as e:
-        print(f"Error loading state data: {e}")
-        
-    return state
+
+
+class StateCache:
+    """Thread-safe cache of the parsed state file.
+
+    The file is only re-read when its mtime or size changes, so concurrent
+    dashboard clients and API pollers share one parse per state change.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.key = None
+        self.state = None
+        self.json_body = None
+        self.parses = 0
+        self.hits = 0
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        """Reload the state if the file changed; caller must hold the lock"""
+        key = self._stat_key()
+        if self.state is not None and key == self.key:
+            self.hits += 1
+            return
+
+        if key is None:
+            state = empty_state()
+        else:
+            try:
+                with open(self.path, 'r') as f:
+                    state = json.load(f)
+                self.parses += 1
+            except Exception as e:
+                # Keep serving the last good state; the key is left untouched
+                # so the next request retries the read.
+                print(f"Error loading state data: {e}")
+                if self.state is None:
+                    self.state = empty_state()
+                    self.json_body = json.dumps(self.state)
+                return
+
+        self.key = key
+        self.state = state
+        self.json_body = json.dumps(state)
+
+    def get(self):
+        """Get the current parsed state"""
+        with self.lock:
+            self._refresh()
+            return self.state
+
+    def get_json(self):
+        """Get the current state already serialized as JSON"""
+        with self.lock:
+            self._refresh()
+            return self.json_body
+
+
+class EndpointTimer:
+    """Records response times per endpoint"""
+    def __init__(self, samples=1000):
+        self.lock = threading.Lock()
+        self.samples = samples
+        self.endpoints = {}
+
+    def record(self, name, elapsed):
+        with self.lock:
+            entry = self.endpoints.get(name)
+            if entry is None:
+                entry = {'count': 0, 'total': 0.0, 'max': 0.0,
+                         'recent': deque(maxlen=self.samples)}
+                self.endpoints[name] = entry
+            entry['count'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['recent'].append(elapsed)
+
+    def summary(self):
+        """Return count, mean, p50, p99 and max in milliseconds per endpoint"""
+        with self.lock:
+            result = {}
+            for name, entry in self.endpoints.items():
+                recent = sorted(entry['recent'])
+                result[name] = {
+                    'count': entry['count'],
+                    'mean_ms': entry['total'] / entry['count'] * 1000,
+                    'p50_ms': recent[len(recent) // 2] * 1000,
+                    'p99_ms': recent[min(len(recent) - 1, int(len(recent) * 0.99))] * 1000,
+                    'max_ms': entry['max'] * 1000
+                }
+            return result
+
+    def timed(self, func):
+        """Decorator recording the wall time of a view function"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(func.__name__, time.perf_counter() - start)
+        return wrapper
+
+
+state_cache = StateCache(os.path.join('data', 'state.json'))
+timer = EndpointTimer()
+
+
+def get_state_data():
+    """Get the current state for the dashboard"""
+    return state_cache.get()
 
 @app.route('/')
+@timer.timed
 def dashboard():
     """Main dashboard view"""
     state = get_state_data()
     
-    # Print debug info
-    print("Dashboard accessed")
-    print(f"State file exists: {os.path.exists('data/state.json')}")
-    if os.path.exists('data/state.json'):
-        print(f"State file size: {os.path.getsize('data/state.json')} bytes")
-    
     return render_template_string(DASHBOARD_HTML, 
         timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         workers=state.get("workers", {}),
@@ -179,9 +281,18 @@ def dashboard():
     )
 
 @app.route('/api/state')
+@timer.timed
 def api_state():
     """API endpoint to get current state"""
-    return jsonify(get_state_data())
+    return Response(state_cache.get_json(), mimetype='application/json')
+
+@app.route('/api/timings')
+def api_timings():
+    """API endpoint with per-endpoint response times and cache counters"""
+    return jsonify({
+        'endpoints': timer.summary(),
+        'state_cache': {'parses': state_cache.parses, 'hits': state_cache.hits}
+    })
 
 if __name__ == '__main__':
     # Create data directory if it doesn't exist
@@ -190,21 +301,7 @@ if __name__ == '__main__':
     # Create empty state file if it doesn't exist
     if not os.path.exists('data/state.json'):
         with open('data/state.json', 'w') as f:
-            json.dump({
-                "workers": {},
-                "tasks": {
-                    "pending": [],
-                    "active": [],
-                    "completed": [],
-                    "failed": []
-                },
-                "stats": {
-                    "pending": 0,
-                    "active": 0, 
-                    "completed": 0,
-                    "failed": 0
-                }
-            }, f)
+            json.dump(empty_state(), f)
     
     print("Starting dashboard on http://localhost:8080")
     
@@ -1,22 +1,8 @@
 # filepath: /Users/chiragvijayvergiya/Desktop/chirag/dc-p/parallel-web-scraper/src/main.py
-import json
 import time
 from src.coordinator.scheduler import Scheduler
 from src.worker.scraper import Scraper
-
-def load_config():
-    """Load configuration from settings.json file."""
-    try:
-        with open('config/settings.json', 'r') as config_file:
-            return json.load(config_file)
-    except Exception as e:
-        print(f"Error loading configuration: {e}")
-        # Provide default values if config file cannot be loaded
-        return {
-            "timeout": 30,
-            "user_agent": "Mozilla/5.0",
-            "max_workers": 3
-        }
+from src.utils.config import load_config
 
 def main():
     # Load configuration
@@ -24,7 +10,7 @@ def main():
     
     # Create worker pool
     workers = []
-    for i in range(config.get("max_workers", 3)):
+    for i in range(config["max_workers"]):
         worker = Scraper(
             user_agent=config["user_agent"],
             timeout=config["timeout"]
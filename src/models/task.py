@@ -2,11 +2,13 @@ import uuid
 from datetime import datetime
 
 class Task:
-    def __init__(self, url, parser=None, priority=1):
+    def __init__(self, url, parser=None, priority=1, depth=0, job_id=None):
         self.id = str(uuid.uuid4())
         self.url = url
         self.parser = parser  # Function to extract specific data
         self.priority = priority
+        self.depth = depth  # Links followed from a seed URL to reach this one
+        self.job_id = job_id  # Batch this task was submitted with, if any
         self.status = 'pending'  # pending, in_progress, completed, failed
         self.created_at = datetime.now()
         self.completed_at = None
@@ -30,10 +32,26 @@ class Task:
             'id': self.id,
             'url': self.url,
             'priority': self.priority,
+            'depth': self.depth,
+            'job_id': self.job_id,
             'status': self.status,
             'created_at': str(self.created_at),
             'completed_at': str(self.completed_at) if self.completed_at else None,
             'result': self.result,
             'error': self.error,
             'assigned_worker': self.assigned_worker
-        }
\ No newline at end of file
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a task from the output of to_dict"""
+        task = cls(data['url'], priority=data.get('priority', 1), depth=data.get('depth', 0),
+                   job_id=data.get('job_id'))
+        task.id = data['id']
+        task.status = data.get('status', 'pending')
+        task.created_at = datetime.fromisoformat(data['created_at']) if data.get('created_at') else task.created_at
+        task.completed_at = datetime.fromisoformat(data['completed_at']) if data.get('completed_at') else None
+        task.result = data.get('result')
+        task.error = data.get('error')
+        task.assigned_worker = data.get('assigned_worker')
+        return task
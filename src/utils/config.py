@@ -0,0 +1,200 @@
+import copy
+import json
+import os
+
+# Root of this checkout; config/settings.json and relative paths in it are
+# found from here, whatever the working directory is
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CONFIG_PATH = os.path.join(ROOT, 'config', 'settings.json')
+ENV_PREFIX = 'SCRAPER_'
+
+# Every setting with its default; the type of a value is the type of its default.
+# Durations in seconds are floats, so 2.5 is as valid as 30
+DEFAULTS = {
+    "timeout": 30.0,
+    "user_agent": "Mozilla/5.0",
+    "max_workers": 3,
+    "coordinator_host": "localhost",
+    "coordinator_port": 5000,
+    "retry_attempts": 3,
+    "max_concurrency": 8,
+    "latency_target": 5.0,
+    "max_per_host": None,
+    "poll_wait": 20.0,
+    "heartbeat_interval": 5.0,
+    "worker_timeout": 30.0,
+    "drain_timeout": 30.0,
+    "request_timeout": 30.0,
+    "queue_backend": "memory",
+    "redis_url": "redis://localhost:6379/0",
+    "redis_prefix": "scraper",
+    "lease_timeout": 300.0,
+    "max_frame_size": 16 * 1024 * 1024,
+    "compression_threshold": 1024,
+    "dns_cache_ttl": 60.0,
+    "shards": [],
+    "profiling": {
+        "enabled": False,
+        "output_dir": "data/profiles",
+        "dump_interval": 60.0
+    },
+    "frontier_path": "data/frontier.db",
+    "frontier_hot_size": 100000,
+    "crawl": {
+        "enabled": False,
+        "max_depth": 2,
+        "scope": "same_host",
+        "max_pages": 10000,
+        "max_links_per_page": 200
+    },
+    "dedup": {
+        "enabled": True,
+        "cache_size": 10000,
+        "near_duplicates": False,
+        "remote_lookup": False,
+        "index_size": 1000000,
+        "max_distance": 3
+    },
+    "circuit_breaker": {
+        "failure_threshold": 5,
+        "reset_timeout": 30.0,
+        "max_reset_timeout": 600.0
+    },
+    "export": {
+        "path": None,
+        "chunk_size": 1000
+    },
+    "result_buffer": {
+        "enabled": True,
+        "max_size": 1000,
+        "batch_size": 50,
+        "spill_path": "data/result-spill.jsonl"
+    }
+}
+
+# Types of the settings whose default is None
+OPTIONAL_TYPES = {
+    "max_per_host": int,
+    "export.path": str
+}
+
+# Settings that can change while running. The coordinator pushes the worker
+# ones to its workers and applies the rest itself.
+WORKER_TUNABLES = ('timeout', 'max_concurrency', 'latency_target', 'max_per_host', 'poll_wait',
+                   'heartbeat_interval', 'request_timeout')
+COORDINATOR_TUNABLES = ('worker_timeout', 'crawl', 'circuit_breaker')
+
+
+class Config(dict):
+    """Settings as a plain dict, so they pickle and .get() works as usual"""
+
+    def tunables(self):
+        return {key: copy.deepcopy(self[key]) for key in WORKER_TUNABLES + COORDINATOR_TUNABLES}
+
+
+def _check(name, value, default):
+    """Validate value against the type of its default, converting int to float"""
+    expected = OPTIONAL_TYPES.get(name) if default is None else type(default)
+    if expected is None or value is None and default is None:
+        return value
+    if expected is float and type(value) is int:
+        return float(value)
+    if isinstance(default, dict) and isinstance(value, dict):
+        return _merge(default, value, name + '.')
+    if type(value) is not expected:
+        raise ValueError(f"Setting {name} should be {expected.__name__}, got {value!r}")
+    return value
+
+
+def validate(name, value):
+    """Check one top-level setting, e.g. a value typed into the coordinator console"""
+    if name not in DEFAULTS:
+        raise ValueError(f"Unknown setting {name}")
+    return _check(name, value, DEFAULTS[name])
+
+
+def _merge(defaults, values, prefix=''):
+    merged = copy.deepcopy(defaults)
+    for key, value in values.items():
+        if key not in defaults:
+            print(f"Unknown setting {prefix}{key}")
+            merged[key] = value
+        else:
+            merged[key] = _check(prefix + key, value, defaults[key])
+    return merged
+
+
+def _parse_env(raw):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw  # Bare strings need no quotes
+
+
+def env_overrides(environ=None):
+    """Settings from SCRAPER_* variables; SCRAPER_DEDUP__ENABLED=false sets dedup.enabled"""
+    environ = os.environ if environ is None else environ
+    overrides = {}
+    for name, raw in environ.items():
+        if not name.startswith(ENV_PREFIX) or name == ENV_PREFIX + 'CONFIG':
+            continue
+        path = name[len(ENV_PREFIX):].lower().split('__')
+        section = overrides
+        for key in path[:-1]:
+            section = section.setdefault(key, {})
+        section[path[-1]] = _parse_env(raw)
+    return overrides
+
+
+def load_config(path=None, environ=None):
+    """Defaults, overridden by the settings file, overridden by SCRAPER_* variables.
+
+    The file is config/settings.json of the checkout unless SCRAPER_CONFIG
+    names another one. A missing file means defaults; a malformed file or a
+    value of the wrong type raises instead of being silently ignored.
+    """
+    environ = os.environ if environ is None else environ
+    path = path or environ.get(ENV_PREFIX + 'CONFIG') or CONFIG_PATH
+    values = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            values = json.load(f)
+    else:
+        print(f"No settings file at {path}, using defaults")
+    config = _merge(DEFAULTS, values)
+    for key, value in env_overrides(environ).items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            value = dict(config[key], **value)
+        config[key] = _check(key, value, DEFAULTS[key]) if key in DEFAULTS else value
+    return Config(config)
+
+
+def resolve_path(path):
+    """A path from the settings, relative to the checkout unless absolute"""
+    return path if path is None or os.path.isabs(path) else os.path.join(ROOT, path)
+
+
+class ConfigWatcher:
+    """Reloads the settings file when its modification time changes"""
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(ENV_PREFIX + 'CONFIG') or CONFIG_PATH
+        self.mtime = self._mtime()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def poll(self):
+        """The new settings if the file changed since the last poll, else None"""
+        mtime = self._mtime()
+        if mtime == self.mtime:
+            return None
+        self.mtime = mtime
+        try:
+            return load_config(self.path)
+        except (OSError, ValueError) as e:
+            # Keep running on the old settings until the file is fixed
+            print(f"Not reloading settings: {e}")
+            return None
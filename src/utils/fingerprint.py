@@ -0,0 +1,51 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+SIMHASH_BITS = 64
+_TOKEN = re.compile(r'\w+')
+
+
+def fingerprint(body):
+    """Hash of a page body for exact duplicate detection"""
+    return hashlib.blake2b(body.encode('utf-8', 'replace'), digest_size=16).hexdigest()
+
+
+def simhash(body):
+    """64-bit simhash of a page's words; near-identical pages differ in few bits"""
+    weights = [0] * SIMHASH_BITS
+    for token in set(_TOKEN.findall(body.lower())):
+        value = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry"""
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                return default
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
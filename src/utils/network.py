@@ -1,17 +1,132 @@
 # filepath: /Users/chiragvijayvergiya/Desktop/chirag/dc-p/parallel-web-scraper/src/utils/network.py
 import socket
 import threading
+import itertools
 import pickle
+import random
 import time
+import zlib
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Frames are a 4-byte big-endian length followed by the pickled message.
+# The top bit of the length marks a payload compressed with the codec the
+# two ends agreed on at registration. A message may carry a request_id,
+# which the response echoes so responses can arrive in any order.
+COMPRESSED_FLAG = 0x80000000
+DEFAULT_MAX_FRAME_SIZE = 16 * 1024 * 1024
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+# Compressor per codec name; fast settings since frames are latency sensitive
+CODECS = {
+    'zlib': lambda data: zlib.compress(data, 1)
+}
+if lz4 is not None:
+    CODECS['lz4'] = lz4.frame.compress
+
+
+class FrameTooLargeError(ValueError):
+    """Raised when a peer announces a frame above the configured limit"""
+
+
+def supported_codecs():
+    """Compression codecs available here, most preferred first"""
+    return [name for name in ('lz4', 'zlib') if name in CODECS]
+
+
+def choose_codec(offered):
+    """Pick the first codec we support from a peer's offer"""
+    for name in offered or []:
+        if name in CODECS:
+            return name
+    return None
+
+
+def decompress(codec, data, max_size):
+    """Decompress a payload, refusing to inflate past max_size"""
+    if codec == 'zlib':
+        inflater = zlib.decompressobj()
+        result = inflater.decompress(data, max_size + 1)
+        if len(result) > max_size or inflater.unconsumed_tail:
+            raise FrameTooLargeError(f"Decompressed frame exceeds {max_size} bytes")
+        return result
+    if codec == 'lz4':
+        inflater = lz4.frame.LZ4FrameDecompressor()
+        result = inflater.decompress(data, max_length=max_size + 1)
+        if len(result) > max_size:
+            raise FrameTooLargeError(f"Decompressed frame exceeds {max_size} bytes")
+        if not inflater.eof:
+            raise ValueError("Truncated lz4 frame")
+        return result
+    raise ValueError("Received a compressed frame without a negotiated codec")
+
+
+def encode_frame(message, codec=None, threshold=DEFAULT_COMPRESSION_THRESHOLD):
+    """Serialize a message into a length-prefixed frame"""
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    flag = 0
+    if codec and len(data) >= threshold:
+        compressed = CODECS[codec](data)
+        # Only pay the decompression cost when it actually saves bytes
+        if len(compressed) < len(data):
+            data = compressed
+            flag = COMPRESSED_FLAG
+    return (len(data) | flag).to_bytes(4, byteorder='big') + data
+
+
+def recv_exact(sock, size):
+    """Read exactly `size` bytes into one preallocated buffer"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            raise RuntimeError("Socket connection broken")
+        received += count
+    return bytes(buffer)
+
+
+def read_frame(sock, max_frame_size=DEFAULT_MAX_FRAME_SIZE, codec=None):
+    """Read one frame and return the message, or None if the peer closed cleanly"""
+    header = sock.recv(4)
+    if not header:
+        return None
+    if len(header) < 4:
+        header += recv_exact(sock, 4 - len(header))
+
+    value = int.from_bytes(header, byteorder='big')
+    compressed = bool(value & COMPRESSED_FLAG)
+    length = value & ~COMPRESSED_FLAG
+    # Check before allocating so a bogus length cannot exhaust memory
+    if length > max_frame_size:
+        raise FrameTooLargeError(f"Frame of {length} bytes exceeds limit of {max_frame_size}")
+
+    data = recv_exact(sock, length)
+    if compressed:
+        data = decompress(codec, data, max_frame_size)
+    return pickle.loads(data)
+
 
 class MessageServer:
     """Simple server for task distribution"""
-    def __init__(self, host='localhost', port=5000):
+    def __init__(self, host='localhost', port=5000, max_frame_size=DEFAULT_MAX_FRAME_SIZE,
+                 compression_threshold=DEFAULT_COMPRESSION_THRESHOLD):
         self.host = host
         self.port = port
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.clients = []
         self.running = False
+        self.max_frame_size = max_frame_size
+        self.compression_threshold = compression_threshold
+        # Codec negotiated with each client socket, if any
+        self.client_codecs = {}
+        # Responses to one client may be sent from several threads
+        self.send_locks = {}
         
     # Update the start method in MessageServer
     def start(self):
@@ -19,7 +134,9 @@ class MessageServer:
             # Allow port reuse to avoid "address already in use" errors
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.socket.bind((self.host, self.port))
-            self.socket.listen(5)
+            # A fleet of workers connecting at once overflows a short accept
+            # queue, and refused clients back off for seconds before retrying
+            self.socket.listen(socket.SOMAXCONN)
             self.running = True
             print(f"Server started on {self.host}:{self.port}")
         
@@ -47,31 +164,31 @@ class MessageServer:
     def _handle_client(self, client, address):
         while self.running:
             try:
-                # Receive message length first
-                length_data = client.recv(4)
-                if not length_data:
+                message = read_frame(client, self.max_frame_size, self.client_codecs.get(client))
+                if message is None:
                     break
-                    
-                message_length = int.from_bytes(length_data, byteorder='big')
-                
-                # Receive message data
-                message_data = b""
-                while len(message_data) < message_length:
-                    chunk = client.recv(min(1024, message_length - len(message_data)))
-                    if not chunk:
-                        raise RuntimeError("Socket connection broken")
-                    message_data += chunk
                 
-                # Deserialize message
-                message = pickle.loads(message_data)
+                # A client offers codecs on its first message
+                offered = message.pop('compression', None) if isinstance(message, dict) else None
+                request_id = message.pop('request_id', None) if isinstance(message, dict) else None
                 
-                # Process message (override in subclass)
-                response = self.process_message(message, client)
-                
-                # Send response if any
-                if response:
-                    self.send_message(client, response)
+                # A tagged request that may block gets its own thread so the
+                # connection keeps serving the client's other requests
+                if request_id is not None and offered is None and self.is_blocking(message):
+                    threading.Thread(target=self._respond, args=(client, message, request_id),
+                                     daemon=True).start()
+                else:
+                    self._respond(client, message, request_id, offered)
                     
+            except FrameTooLargeError as e:
+                # The rest of the frame is still on the wire, so the stream
+                # cannot be resynchronized; report and drop the connection
+                print(f"Rejected frame from {address}: {e}")
+                try:
+                    self.send_message(client, {"status": "error", "message": str(e)})
+                except OSError:
+                    pass
+                break
             except Exception as e:
                 print(f"Error handling client {address}: {e}")
                 break
@@ -79,17 +196,44 @@ class MessageServer:
         # Remove client when done
         if client in self.clients:
             self.clients.remove(client)
+        self.client_codecs.pop(client, None)
+        self.send_locks.pop(client, None)
         client.close()
     
+    def _respond(self, client, message, request_id=None, offered=None):
+        # Process message (override in subclass)
+        response = self.process_message(message, client)
+        if request_id is not None:
+            response = dict(response or {}, request_id=request_id)
+        
+        with self.send_locks.setdefault(client, threading.RLock()):
+            if offered is not None:
+                # Answer uncompressed, then switch this connection over
+                codec = choose_codec(offered)
+                self.send_message(client, dict(response or {}, compression=codec))
+                if codec:
+                    self.client_codecs[client] = codec
+            # Send response if any
+            elif response:
+                try:
+                    self.send_message(client, response)
+                except OSError as e:
+                    if request_id is None:
+                        raise
+                    print(f"Error answering request {request_id}: {e}")
+    
     def process_message(self, message, client):
         """Override this method to process received messages"""
         return {"status": "received"}
     
+    def is_blocking(self, message):
+        """Override to mark requests that can wait a long time, e.g. long polls"""
+        return False
+    
     def send_message(self, client, message):
         """Send message to a specific client"""
-        data = pickle.dumps(message)
-        length = len(data).to_bytes(4, byteorder='big')
-        client.sendall(length + data)
+        with self.send_locks.setdefault(client, threading.RLock()):
+            client.sendall(encode_frame(message, self.client_codecs.get(client), self.compression_threshold))
         
     def broadcast(self, message):
         """Send message to all connected clients"""
@@ -104,56 +248,205 @@ class MessageServer:
         self.running = False
         for client in self.clients:
             client.close()
+        try:
+            # Wakes the thread blocked in accept(); close() alone leaves the
+            # port bound until the next connection arrives
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.socket.close()
         print("Server stopped")
 
 
 class MessageClient:
-    """Client to connect to the coordinator"""
-    def __init__(self, host='localhost', port=5000):
+    """Client to connect to the coordinator.
+
+    Each request is tagged with a request_id, so any number of threads can
+    have requests outstanding on one connection and responses are matched
+    up in whatever order they arrive: a long-polling get_task does not hold
+    up result submissions. request() returns a Future; send_message()
+    waits for it.
+
+    A broken connection, or a request unanswered within its timeout, closes
+    the connection. send_message() then reopens it with exponential backoff
+    and sends the request again, unless it was sent with retry=False
+    because resending it is not safe. `resume_message`, if set, is called
+    after every reconnect and the message it returns (e.g. a registration)
+    is sent before any other request; `on_resume`, if set, is called with
+    the reply.
+    """
+    def __init__(self, host='localhost', port=5000, max_frame_size=DEFAULT_MAX_FRAME_SIZE,
+                 compression=True, compression_threshold=DEFAULT_COMPRESSION_THRESHOLD,
+                 timeout=30, reconnect=True, backoff_base=0.5, backoff_max=30, max_retries=None):
         self.host = host
         self.port = port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket = None
         self.connected = False
+        self.max_frame_size = max_frame_size
+        self.compression_threshold = compression_threshold
+        # Codecs are offered with the first message (normally register) and
+        # frames above the threshold are compressed once the server agrees
+        self.offer_compression = compression
+        self.offer_id = None
+        self.negotiated = False
+        self.codec = None
+        # Seconds to wait for a response before treating the connection as dead
+        self.timeout = timeout
+        self.reconnect = reconnect
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retries = max_retries  # None retries until disconnect()
+        self.resume_message = None
+        self.on_resume = None
+        self.closing = threading.Event()
+        self.request_ids = itertools.count(1)
+        self.pending = {}  # request_id -> Future
+        # Bumped on every new connection so stale failures are ignored
+        self.generation = 0
+        # Guards the connection state and serializes writes to the socket
+        self.lock = threading.Lock()
+        self.connect_lock = threading.Lock()
         
     def connect(self):
         try:
-            self.socket.connect((self.host, self.port))
-            self.connected = True
+            self.closing.clear()
+            with self.connect_lock:
+                self._open()
             return True
         except Exception as e:
             print(f"Failed to connect to server: {e}")
             return False
+    
+    def _open(self, ready=True):
+        """Open a new connection; with ready=False only resume requests may use it"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        # Timeouts apply per request; the reader idles between responses
+        sock.settimeout(None)
+        with self.lock:
+            self.generation += 1
+            self.socket = sock
+            self.connected = ready
+            # A new connection starts uncompressed and negotiates again
+            self.offer_id = None
+            self.negotiated = False
+            self.codec = None
+            generation = self.generation
+        threading.Thread(target=self._read_responses, args=(sock, generation), daemon=True).start()
+    
+    def _read_responses(self, sock, generation):
+        """Resolve pending requests as their responses arrive"""
+        try:
+            while True:
+                response = read_frame(sock, self.max_frame_size, self.codec)
+                if response is None:
+                    raise ConnectionError("Connection closed by server")
+                request_id = response.pop('request_id', None)
+                if request_id is None:
+                    # Untagged errors are about the whole connection, e.g. an
+                    # oversized frame; the server closes it after answering
+                    with self.lock:
+                        pending, self.pending = self.pending, {}
+                    for future in pending.values():
+                        future.set_result(response)
+                    continue
+                if request_id == self.offer_id:
+                    # Must be set before the next (possibly compressed) frame is read
+                    codec = response.pop('compression', None)
+                    self.codec = codec if codec in CODECS else None
+                    self.negotiated = True
+                with self.lock:
+                    future = self.pending.pop(request_id, None)
+                if future is not None:
+                    future.set_result(response)
+        except Exception as e:
+            self._fail(generation, e)
+    
+    def _fail(self, generation, error):
+        """Close a connection and fail its outstanding requests"""
+        with self.lock:
+            if generation != self.generation or self.socket is None:
+                return
+            self.connected = False
+            pending, self.pending = self.pending, {}
+            sock = self.socket
+        sock.close()
+        if not isinstance(error, ConnectionError):
+            error = ConnectionError(str(error) or type(error).__name__)
+        for future in pending.values():
+            future.set_exception(error)
+    
+    def _reconnect(self, generation):
+        """Reopen the connection, backing off exponentially between attempts"""
+        with self.connect_lock:
+            if self.connected and self.generation != generation:
+                return  # Another thread already reconnected
+            attempt = 0
+            while True:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                # Jitter keeps a fleet of workers from reconnecting in lockstep
+                if self.closing.wait(delay * random.uniform(0.5, 1.0)):
+                    raise ConnectionError("Client disconnected")
+                try:
+                    # Other requests wait until the session is resumed, so the
+                    # coordinator never sees them before the registration
+                    self._open(ready=self.resume_message is None)
+                    if self.resume_message:
+                        response = self.request(self.resume_message(), resuming=True).result(timeout=self.timeout)
+                        with self.lock:
+                            self.connected = True
+                        if self.on_resume:
+                            self.on_resume(response)
+                    print(f"Reconnected to {self.host}:{self.port}")
+                    return
+                except (OSError, FutureTimeoutError) as e:
+                    self._fail(self.generation, e)
+                    attempt += 1
+                    if self.max_retries is not None and attempt > self.max_retries:
+                        raise ConnectionError(f"Could not reconnect to {self.host}:{self.port}: {e}")
+    
+    def request(self, message, resuming=False):
+        """Send a request without waiting; returns a Future for the response"""
+        future = Future()
+        with self.lock:
+            if not self.connected and not (resuming and self.socket is not None):
+                raise ConnectionError("Not connected to server")
+            request_id = next(self.request_ids)
+            message = dict(message, request_id=request_id)
+            if self.offer_compression and self.offer_id is None:
+                message['compression'] = supported_codecs()
+                self.offer_id = request_id
+            self.pending[request_id] = future
+            generation = self.generation
+            try:
+                self.socket.sendall(encode_frame(message, self.codec, self.compression_threshold))
+                return future
+            except OSError as e:
+                error = e
+        self._fail(generation, error)
+        return future
             
-    def send_message(self, message):
-        """Send message to server and get response"""
-        if not self.connected:
-            raise ConnectionError("Not connected to server")
-            
-        data = pickle.dumps(message)
-        length = len(data).to_bytes(4, byteorder='big')
-        
-        self.socket.sendall(length + data)
-        
-        # Receive response length
-        length_data = self.socket.recv(4)
-        if not length_data:
-            raise ConnectionError("Connection closed by server")
-            
-        message_length = int.from_bytes(length_data, byteorder='big')
-        
-        # Receive response data
-        message_data = b""
-        while len(message_data) < message_length:
-            chunk = self.socket.recv(min(1024, message_length - len(message_data)))
-            if not chunk:
-                raise RuntimeError("Socket connection broken")
-            message_data += chunk
-            
-        # Deserialize response
-        return pickle.loads(message_data)
+    def send_message(self, message, timeout=None, retry=True):
+        """Send message to server and wait for its response.
+
+        With retry=False the message is not sent again after a lost
+        connection; the error is raised and the next request reconnects.
+        """
+        while True:
+            if self.socket is None or self.closing.is_set():
+                raise ConnectionError("Not connected to server")
+            generation = self.generation
+            if not self.connected:
+                self._reconnect(generation)
+                continue
+            try:
+                return self.request(message).result(timeout=timeout or self.timeout)
+            except (OSError, FutureTimeoutError) as e:
+                # The connection may be dead; close it so every request on it retries
+                self._fail(generation, e)
+                if not retry or not self.reconnect or self.closing.is_set():
+                    raise
+                print(f"Connection to {self.host}:{self.port} lost ({e or type(e).__name__}), reconnecting")
         
     def disconnect(self):
-        if self.connected:
-            self.socket.close()
-            self.connected = False
\ No newline at end of file
+        self.closing.set()
+        self._fail(self.generation, ConnectionError("Client disconnected"))
@@ -0,0 +1,113 @@
+import cProfile
+import io
+import os
+import threading
+import time
+from functools import wraps
+
+# Python 3.12+ allows one active profiler per process, not per thread. A
+# profiled call that finds this taken, whether by another thread or by an
+# outer hook on its own thread, runs unprofiled.
+_active = threading.Lock()
+
+
+class Profiler:
+    """Opt-in cProfile capture for named hot paths.
+
+    Functions wrapped with `profiled(name)` cost one attribute check when
+    profiling is off. When it is on, each call is profiled and merged into
+    per-name statistics that are written as .prof files (readable with
+    pstats or snakeviz) every `dump_interval` seconds. Only one call is
+    profiled at a time; concurrent calls are sampled out.
+    """
+    def __init__(self, enabled=False, output_dir=os.path.join('data', 'profiles'), dump_interval=60):
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.dump_interval = dump_interval
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.calls = {}
+        self.last_dump = time.monotonic()
+
+    def configure(self, settings):
+        """Apply the "profiling" section of the settings"""
+        settings = settings or {}
+        self.output_dir = settings.get("output_dir", self.output_dir)
+        self.dump_interval = settings.get("dump_interval", self.dump_interval)
+        self.enabled = settings.get("enabled", self.enabled)
+
+    def profiled(self, name):
+        """Decorator profiling every call of a function while enabled"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or not _active.acquire(blocking=False):
+                    return func(*args, **kwargs)
+                try:
+                    return self._run(name, func, args, kwargs)
+                finally:
+                    _active.release()
+            return wrapper
+        return decorator
+
+    def _run(self, name, func, args, kwargs):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another tool, e.g. a debugger, holds the profiling hook
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            import pstats  # Only needed once profiling is on; keeps startup light
+            with self.lock:
+                if name in self.stats:
+                    self.stats[name].add(profile)
+                else:
+                    self.stats[name] = pstats.Stats(profile)
+                self.calls[name] = self.calls.get(name, 0) + 1
+
+    def dump(self):
+        """Write collected profiles to output_dir and start over; returns the paths"""
+        with self.lock:
+            stats, self.stats = self.stats, {}
+            self.calls = {}
+            self.last_dump = time.monotonic()
+        if not stats:
+            return []
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        paths = []
+        for name, collected in stats.items():
+            path = os.path.join(self.output_dir, f"{name}-{stamp}-{os.getpid()}.prof")
+            collected.dump_stats(path)
+            paths.append(path)
+        return paths
+
+    def maybe_dump(self):
+        """Dump if profiling is on and dump_interval has passed"""
+        if self.enabled and time.monotonic() - self.last_dump >= self.dump_interval:
+            return self.dump()
+        return []
+
+    def summary(self, name, limit=15):
+        """Top functions by cumulative time for one hook"""
+        with self.lock:
+            collected = self.stats.get(name)
+            if collected is None:
+                return f"No profile data for {name}"
+            out = io.StringIO()
+            collected.stream = out
+            collected.sort_stats('cumulative').print_stats(limit)
+            return f"{name}: {self.calls.get(name, 0)} calls\n{out.getvalue()}"
+
+    def names(self):
+        with self.lock:
+            return sorted(self.stats)
+
+
+# Shared by the coordinator and worker modules
+profiler = Profiler()
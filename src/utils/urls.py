@@ -0,0 +1,26 @@
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url, base=None):
+    """Canonical absolute form of a link, or None if it is not crawlable.
+
+    Resolves against `base`, keeps only http(s), lowercases scheme and
+    host, drops default ports and fragments, and uses '/' for an empty
+    path so trivially different spellings of a page dedupe together.
+    """
+    try:
+        if base:
+            url = urljoin(base, url.strip())
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.hostname:
+            return None
+        host = parts.hostname.lower()
+        port = parts.port
+    except ValueError:
+        return None
+
+    netloc = host if port in (None, DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
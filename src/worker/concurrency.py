@@ -0,0 +1,117 @@
+import threading
+import time
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that adapts using additive-increase/multiplicative-decrease.
+
+    The limit grows by roughly one slot per window of successful requests
+    while latency stays under the target, and is cut by `backoff` on
+    timeouts, overload responses or slow requests.
+    """
+    def __init__(self, initial=1, min_limit=1, max_limit=16, latency_target=5.0, backoff=0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        self.last_decrease = 0.0
+
+    @property
+    def current_limit(self):
+        return int(self.limit)
+
+    def has_capacity(self):
+        """Check if another request can be started right now"""
+        with self.cond:
+            return self.in_flight < int(self.limit)
+
+    def try_acquire(self):
+        """Take a slot if one is free, without waiting"""
+        with self.cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout=None):
+        """Wait up to `timeout` seconds for a free slot"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, overloaded=False):
+        """Free a slot and feed the outcome of the request into the limit.
+
+        `latency` is None when the slot was not used for a request (for
+        example when no task was available), which leaves the limit alone.
+        """
+        with self.cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+
+            if overloaded or (latency is not None and latency > self.latency_target):
+                self._decrease()
+            elif latency is not None and saturated:
+                # Only grow when the current limit is actually being used
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            self.cond.notify_all()
+
+    def _decrease(self):
+        # Requests already in flight when the limit was cut report the same
+        # congestion; only back off once per latency window.
+        now = time.monotonic()
+        if now - self.last_decrease < self.latency_target:
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    def configure(self, max_limit=None, latency_target=None):
+        """Change the bounds while running; a lower max takes effect as slots free up"""
+        with self.cond:
+            if max_limit is not None:
+                self.max_limit = max_limit
+                self.limit = max(self.min_limit, min(self.limit, max_limit))
+            if latency_target is not None:
+                self.latency_target = latency_target
+            self.cond.notify_all()
+
+    def snapshot(self):
+        """Return the current limit and usage for heartbeats"""
+        with self.cond:
+            limit = int(self.limit)
+            return {
+                'concurrency_limit': limit,
+                'in_flight': self.in_flight,
+                'free_slots': max(0, limit - self.in_flight)
+            }
+
+
+class HostLimiters:
+    """One AdaptiveLimiter per host so a slow site only throttles itself"""
+    def __init__(self, max_per_host=4, latency_target=5.0):
+        self.max_per_host = max_per_host
+        self.latency_target = latency_target
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def get(self, host):
+        with self.lock:
+            limiter = self.limiters.get(host)
+            if limiter is None:
+                limiter = AdaptiveLimiter(initial=1, max_limit=self.max_per_host,
+                                          latency_target=self.latency_target)
+                self.limiters[host] = limiter
+            return limiter
+
+    def configure(self, max_per_host, latency_target):
+        with self.lock:
+            self.max_per_host = max_per_host
+            self.latency_target = latency_target
+            for limiter in self.limiters.values():
+                limiter.configure(max_per_host, latency_target)
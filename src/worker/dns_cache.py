@@ -0,0 +1,102 @@
+import socket
+import threading
+import time
+
+
+class DNSCache:
+    """Process-wide cache in front of socket.getaddrinfo.
+
+    Successful lookups are kept for `ttl` seconds and failures for
+    `negative_ttl` seconds. Concurrent lookups of the same name wait for
+    the first one instead of all hitting the resolver. getaddrinfo does
+    not expose record TTLs, so `ttl` acts as an upper bound on staleness
+    and should stay short.
+    """
+    def __init__(self, ttl=60, negative_ttl=10, max_entries=10000, resolver=None, lookup_timeout=30):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.resolver = resolver or socket.getaddrinfo
+        self.lookup_timeout = lookup_timeout
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> (expires_at, addrinfo list or gaierror)
+        self.inflight = {}  # key -> Event set when the leading lookup finishes
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.installed = False
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """Drop-in replacement for socket.getaddrinfo"""
+        key = (host, port, family, type, proto, flags)
+        waited = False
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry and entry[0] > time.monotonic():
+                    # An answer after a wait was already counted as coalesced
+                    if not waited:
+                        self.hits += 1
+                    return self._unwrap(entry[1])
+                event = self.inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = self.inflight[key] = threading.Event()
+                    self.misses += 1
+                elif not waited:
+                    self.coalesced += 1
+
+            if leader:
+                return self._resolve(key, event)
+            # Another thread is resolving this name; use its answer
+            if not event.wait(self.lookup_timeout):
+                return self.resolver(host, port, family, type, proto, flags)
+            waited = True
+
+    def _resolve(self, key, event):
+        try:
+            result = self.resolver(*key)
+            self._store(key, result, self.ttl)
+            return result
+        except socket.gaierror as e:
+            self._store(key, e, self.negative_ttl)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            event.set()
+
+    def _store(self, key, value, ttl):
+        with self.lock:
+            if len(self.entries) >= self.max_entries and key not in self.entries:
+                # Dicts keep insertion order, so this drops the oldest entry
+                self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = (time.monotonic() + ttl, value)
+
+    @staticmethod
+    def _unwrap(value):
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def install(self):
+        """Route every getaddrinfo call in this process through the cache"""
+        if not self.installed:
+            socket.getaddrinfo = self.getaddrinfo
+            self.installed = True
+
+    def uninstall(self):
+        if self.installed and socket.getaddrinfo == self.getaddrinfo:
+            socket.getaddrinfo = self.resolver
+        self.installed = False
+
+    def stats(self):
+        """Counters for worker metrics"""
+        with self.lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'dns_hits': self.hits,
+                'dns_misses': self.misses,
+                'dns_coalesced': self.coalesced,
+                'dns_hit_rate': (self.hits + self.coalesced) / lookups if lookups else None
+            }
@@ -0,0 +1,41 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class ThroughputMeter:
+    """Counts completed tasks over a sliding time window"""
+    def __init__(self, window=60.0):
+        self.window = window
+        self.events = deque()
+        self.lock = threading.Lock()
+
+    def record(self):
+        with self.lock:
+            self.events.append(time.monotonic())
+
+    def rate(self):
+        """Completions per second over the window"""
+        cutoff = time.monotonic() - self.window
+        with self.lock:
+            while self.events and self.events[0] < cutoff:
+                self.events.popleft()
+            return len(self.events) / self.window
+
+
+def resource_usage():
+    """Return load average and resident memory of this process where available"""
+    usage = {'load_avg': None, 'rss_mb': None}
+    try:
+        usage['load_avg'] = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        pass
+    try:
+        # Linux only; second field of statm is resident pages
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        usage['rss_mb'] = pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    return usage
@@ -0,0 +1,271 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: spill files are not locked
+
+# Other spill files tried when the configured one is locked by another worker
+MAX_SPILL_FILES = 100
+
+
+def claim_spill_file(path):
+    """Lock the first of path, path.1, path.2... no other process holds.
+
+    Returns the path and the open lock file, which holds the lock until it
+    is closed. A worker restarted on the same host claims, and so replays,
+    a file its predecessor left behind.
+    """
+    root, ext = os.path.splitext(path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    for index in range(MAX_SPILL_FILES):
+        candidate = path if index == 0 else f"{root}.{index}{ext}"
+        lock = open(candidate + '.lock', 'a')
+        if fcntl is None:
+            return candidate, lock
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return candidate, lock
+        except OSError:
+            lock.close()
+    raise RuntimeError(f"All spill files next to {path} are in use")
+
+
+class ResultBuffer:
+    """Bounded queue of task results between fetch threads and the coordinator.
+
+    Fetch threads put results and carry on. A flusher thread sends them in
+    batches of up to `batch_size`. When a batch cannot be sent, it and
+    everything else held in memory is appended to `spill_path`. The same
+    happens to results arriving while the buffer already holds `max_size`.
+    Once anything is on disk, new results go to the file too, and the
+    flusher replays the file in order when the coordinator is back. A result
+    can reach the coordinator twice (a send that timed out, a replay cut
+    short), so the coordinator ignores results for tasks it already has.
+    task_ids() covers spilled results too, so a reconnecting worker still
+    claims their leases.
+    The spill file is locked for the life of the buffer; when another worker
+    holds `spill_path`, a numbered file next to it is used instead.
+    """
+    def __init__(self, send_batch, spill_path, max_size=1000, batch_size=50, retry_interval=1.0):
+        # Sends a list of results and returns the task ids the coordinator
+        # refused; raises if they were not delivered
+        self.send_batch = send_batch
+        self.spill_path, self.lock_file = claim_spill_file(spill_path)
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.sending = []  # Task ids in the batch being sent
+        self.spilled = 0  # Results in the spill file not yet replayed
+        self.spilled_ids = Counter()  # Their task ids
+        self.discarded = set()  # Spilled tasks the coordinator no longer leases to us
+        self.replay_offset = 0  # Bytes of the spill file already delivered
+        self.sent = 0
+        self.rejected = 0
+        self.closed = False
+        self.thread = None
+        if os.path.exists(self.spill_path):
+            with open(self.spill_path, 'rb+') as f:
+                data = f.read()
+                if data and not data.endswith(b'\n'):
+                    # Torn by a crash mid-write; keep the fragment on a line of its own
+                    f.write(b'\n')
+                    data += b'\n'
+            self.spilled = data.count(b'\n')
+            for line in data.splitlines():
+                try:
+                    self.spilled_ids[json.loads(line)['task_id']] += 1
+                except (ValueError, TypeError, KeyError):
+                    pass  # Quarantined when replayed
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, result):
+        with self.cond:
+            if self.spilled or len(self.items) >= self.max_size:
+                self._spill([result])
+            else:
+                self.items.append(result)
+            self.cond.notify_all()
+
+    def task_ids(self):
+        """Tasks whose results are held, in memory or in the spill file"""
+        with self.cond:
+            held = [result['task_id'] for result in self.items] + self.sending
+            return held + [task_id for task_id in self.spilled_ids if task_id not in self.discarded]
+
+    def discard(self, task_ids):
+        """Drop results held for these tasks; spilled ones are skipped on replay"""
+        task_ids = set(task_ids)
+        with self.cond:
+            kept = [result for result in self.items if result['task_id'] not in task_ids]
+            self.items = deque(kept)
+            self.discarded.update(task_ids.intersection(self.spilled_ids))
+
+    def pending(self):
+        with self.cond:
+            return len(self.items) + len(self.sending) + self.spilled
+
+    def _spill(self, results):
+        # Called with the lock held
+        directory = os.path.dirname(self.spill_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.spill_path, 'a') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+        self.spilled += len(results)
+        self.spilled_ids.update(result['task_id'] for result in results)
+
+    def _spill_before(self, results):
+        """Spill results that are older than those already in the spill file"""
+        # Called with the lock held
+        if not self.spilled:
+            self._spill(results)
+            return
+        with open(self.spill_path, 'rb') as f:
+            f.seek(self.replay_offset)
+            newer = f.read()
+        replacement = self.spill_path + '.tmp'
+        with open(replacement, 'wb') as f:
+            for result in results:
+                f.write((json.dumps(result) + '\n').encode('utf-8'))
+            f.write(newer)
+        os.replace(replacement, self.spill_path)
+        self.replay_offset = 0
+        self.spilled += len(results)
+        self.spilled_ids.update(result['task_id'] for result in results)
+
+    def _run(self):
+        while True:
+            try:
+                if not self._step():
+                    return
+                continue
+            except Exception as e:
+                # Whatever went wrong, keep delivering; the results are still held
+                print(f"Error in result flusher: {str(e)}")
+            with self.cond:
+                if self.closed:
+                    return
+                self.cond.wait(self.retry_interval)
+
+    def _step(self):
+        """Send one batch from memory or the spill file; False once closed and empty"""
+        with self.cond:
+            while not self.items and not self.spilled and not self.closed:
+                self.cond.wait()
+            if self.closed and not self.items and not self.spilled:
+                return False
+            batch = [self.items.popleft() for _ in range(min(self.batch_size, len(self.items)))]
+            self.sending = [result['task_id'] for result in batch]
+        if batch:
+            delivered = self._send(batch)
+            with self.cond:
+                self.sending = []
+                if not delivered:
+                    try:
+                        # Put everything on disk so a crash during the outage loses nothing
+                        self._spill_before(batch + list(self.items))
+                        self.items.clear()
+                    except OSError:
+                        self.items.extendleft(reversed(batch))
+                        raise
+                self.cond.notify_all()
+        else:
+            delivered = self._replay()
+        if not delivered:
+            with self.cond:
+                if self.closed:
+                    return False
+                self.cond.wait(self.retry_interval)
+        return True
+
+    def _send(self, batch):
+        try:
+            rejected = self.send_batch(batch) or []
+        except Exception as e:
+            print(f"Could not submit {len(batch)} results, keeping them on disk: {e}")
+            return False
+        if rejected:
+            # Resending would not help: the coordinator has requeued these tasks
+            print(f"Coordinator refused results for {len(rejected)} tasks: {', '.join(map(str, rejected))}")
+        self.sent += len(batch) - len(rejected)
+        self.rejected += len(rejected)
+        return True
+
+    def _replay(self):
+        """Send one batch from the spill file; False if it could not be delivered"""
+        with self.cond:
+            with open(self.spill_path, 'rb') as f:
+                f.seek(self.replay_offset)
+                lines = [f.readline() for _ in range(self.batch_size)]
+                end = f.tell()
+        lines = [line for line in lines if line.strip()]
+        results, torn = [], []
+        for line in lines:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                torn.append(line)
+        with self.cond:
+            batch = [result for result in results if result.get('task_id') not in self.discarded]
+        if batch and not self._send(batch):
+            return False
+        if torn:
+            self._quarantine(torn)
+        with self.cond:
+            self.replay_offset = end
+            self.spilled -= len(lines)
+            self.spilled_ids.subtract(result.get('task_id') for result in results)
+            self.spilled_ids += Counter()  # Drop ids no longer spilled
+            if self.spilled <= 0 or not lines:
+                # Everything written so far is delivered; start a fresh file
+                os.remove(self.spill_path)
+                self.spilled = 0
+                self.spilled_ids.clear()
+                self.discarded.clear()
+                self.replay_offset = 0
+                print("Replayed all spilled results")
+            self.cond.notify_all()
+        return True
+
+    def _quarantine(self, lines):
+        """Set aside lines that are not valid JSON, e.g. the last one before a crash"""
+        print(f"Skipping {len(lines)} unreadable lines of {self.spill_path}")
+        with open(self.spill_path + '.bad', 'ab') as f:
+            for line in lines:
+                f.write(line.rstrip(b'\n') + b'\n')
+
+    def flush(self, timeout):
+        """Wait up to timeout seconds for every result to be delivered; True if it was"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.items or self.sending or self.spilled:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            return True
+
+    def close(self):
+        """Stop the flusher; results still in memory are kept in the spill file"""
+        with self.cond:
+            self.closed = True
+            if self.items:
+                self._spill(list(self.items))
+                self.items.clear()
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(5)
+        self.lock_file.close()
@@ -3,17 +3,20 @@ import requests
 from bs4 import BeautifulSoup
 import threading
 import time
+from src.worker.concurrency import AdaptiveLimiter
 
 class Scraper:
-    def __init__(self, user_agent, timeout):
+    def __init__(self, user_agent, timeout, max_tasks=5, latency_target=5.0):
         self.user_agent = user_agent
         self.timeout = timeout
         self.tasks = []  # Track assigned tasks
-        self.max_tasks = 5  # Maximum concurrent tasks
+        self.max_tasks = max_tasks  # Upper bound for concurrent tasks
+        self.limiter = AdaptiveLimiter(initial=1, max_limit=max_tasks,
+                                       latency_target=latency_target)
         
     def is_available(self):
         """Check if worker can accept more tasks"""
-        return len(self.tasks) < self.max_tasks
+        return self.limiter.has_capacity()
         
     def check_status(self):
         """Check if worker is operational"""
@@ -21,6 +24,8 @@ class Scraper:
         
     def assign_task(self, task):
         """Assign a task to this worker"""
+        if not self.limiter.try_acquire():
+            return False
         self.tasks.append(task)
         
         # Process task in a separate thread
@@ -30,17 +35,27 @@ class Scraper:
         )
         thread.daemon = True
         thread.start()
+        return True
         
     def _process_task(self, task):
         """Process a single task"""
         print(f"Processing task {task.id} for URL: {task.url}")
+        latency = None
+        overloaded = False
         
         try:
             # Update task status
             task.update_status('in_progress')
             
             # Fetch the URL
-            html_content = self.scrape_url(task.url)
+            start = time.monotonic()
+            try:
+                html_content = self.scrape_url(task.url)
+            except (requests.Timeout, requests.ConnectionError):
+                overloaded = True
+                raise
+            finally:
+                latency = time.monotonic() - start
             
             # Process the content
             result = self.process_data(html_content)
@@ -60,6 +75,7 @@ class Scraper:
             # Remove task from active list
             if task in self.tasks:
                 self.tasks.remove(task)
+            self.limiter.release(latency, overloaded)
         
     def scrape_url(self, url):
         """Fetch content from a URL"""
@@ -73,7 +89,9 @@ class Scraper:
     def process_data(self, html_content):
         """Process the HTML content"""
         soup = BeautifulSoup(html_content, 'html.parser')
-        title = soup.title.string if soup.title else "No title found"
+        # .string is a NavigableString that references the whole parse tree;
+        # pickling it for submission walks the tree and can blow the stack
+        title = str(soup.title.string) if soup.title and soup.title.string else "No title found"
         
         # Extract more data as needed
         data = {
@@ -1,182 +1,552 @@
-import json
+import signal
 import time
 import uuid
-import requests
-from bs4 import BeautifulSoup
-from src.utils.network import MessageClient
+import threading
+from urllib.parse import urlparse
+from src.utils.network import MessageClient, DEFAULT_MAX_FRAME_SIZE, DEFAULT_COMPRESSION_THRESHOLD
+from src.worker.concurrency import AdaptiveLimiter, HostLimiters
+from src.worker.metrics import ThroughputMeter, resource_usage
+from src.worker.dns_cache import DNSCache
+from src.worker.result_buffer import ResultBuffer
+from src.utils.profiling import profiler
+from src.utils.urls import normalize_url
+from src.utils.fingerprint import LRUCache, fingerprint, simhash
+from src.coordinator.sharding import ShardRouter
+from src.utils.config import load_config, resolve_path
+
+
+class FetchError(Exception):
+    """Raised when a page is fetched with a non-200 status"""
+    def __init__(self, status_code):
+        super().__init__(f"HTTP error {status_code}")
+        self.status_code = status_code
+
 
 class WorkerClient:
-    def __init__(self, coordinator_host, coordinator_port, user_agent, timeout):
-        self.worker_id = str(uuid.uuid4())
-        self.client = MessageClient(host=coordinator_host, port=coordinator_port)
+    def __init__(self, coordinator_host, coordinator_port, user_agent, timeout,
+                 max_concurrency=8, latency_target=5.0, max_per_host=None, poll_wait=20,
+                 heartbeat_interval=5, worker_id=None, max_frame_size=DEFAULT_MAX_FRAME_SIZE,
+                 compression_threshold=DEFAULT_COMPRESSION_THRESHOLD, dns_cache_ttl=60,
+                 dedup=True, dedup_cache_size=10000, near_duplicates=False, remote_lookup=False,
+                 drain_timeout=30, request_timeout=30, result_spill_path=None,
+                 result_buffer_size=1000, result_batch_size=50):
+        self.worker_id = worker_id or str(uuid.uuid4())
+        # Requests are multiplexed, so the lease long poll, heartbeats and
+        # result submissions from every fetch thread share one connection
+        self.client = MessageClient(host=coordinator_host, port=coordinator_port,
+                                    max_frame_size=max_frame_size,
+                                    compression_threshold=compression_threshold,
+                                    timeout=request_timeout)
+        self.request_timeout = request_timeout
+        # After a reconnect the worker registers again under the same id, so
+        # a restarted coordinator knows it and the tasks it holds
+        self.client.resume_message = self.register_message
+        self.client.on_resume = self.resume
+        self.poll_wait = poll_wait
+        self.heartbeat_interval = heartbeat_interval
+        self.stop_event = threading.Event()
+        # Graceful shutdown: stop leasing, give in-flight tasks drain_timeout
+        # seconds to finish, then hand the rest back to the coordinator
+        self.drain_timeout = drain_timeout
+        self.draining = threading.Event()
+        self.stopped = threading.Event()
+        self.stop_lock = threading.Lock()
+        self.in_flight = {}  # task_id -> task
+        # In-flight tasks the coordinator gave to another worker while we were away
+        self.lost_tasks = set()
+        self.idle = threading.Condition()
         self.user_agent = user_agent
         self.timeout = timeout
         self.running = False
+        # Number of tasks fetched in parallel adapts to latency and errors
+        self.limiter = AdaptiveLimiter(initial=1, max_limit=max_concurrency,
+                                       latency_target=latency_target)
+        self.host_limiters = HostLimiters(max_per_host, latency_target) if max_per_host else None
+        self.throughput = ThroughputMeter()
+        # Shared by all fetch threads; disabled with dns_cache_ttl=0
+        self.dns_cache = DNSCache(ttl=dns_cache_ttl) if dns_cache_ttl else None
+        # Results of recently parsed pages by content hash; None disables dedup
+        self.result_cache = LRUCache(dedup_cache_size) if dedup else None
+        self.near_duplicates = near_duplicates
+        # Asking the coordinator costs a round trip per page on the fetch thread
+        self.remote_lookup = remote_lookup
+        # Version of the tunables last pushed by the coordinator
+        self.settings_version = 0
+        # Results are submitted in batches by a background thread and spilled
+        # to result_spill_path while the coordinator is slow or unreachable.
+        # Without a path each fetch thread submits its own result.
+        self.results = None
+        if result_spill_path:
+            self.results = ResultBuffer(self._submit_batch, result_spill_path,
+                                        max_size=result_buffer_size, batch_size=result_batch_size)
         
     def start(self):
         """Connect to coordinator and start processing"""
         print(f"Starting worker {self.worker_id}")
         
+        if self.dns_cache:
+            self.dns_cache.install()
+        
+        # The fetch and parse libraries are imported on first use; load them
+        # while connecting so the first task does not wait for them
+        threading.Thread(target=self.preload, daemon=True).start()
+        
+        # Also replays results a previous run left in the spill file
+        if self.results:
+            self.results.start()
+        
         # Connect to coordinator
         if not self.client.connect():
             print("Failed to connect to coordinator")
             return False
         
         # Register with coordinator
-        response = self.client.send_message({
-            "action": "register",
-            "worker_id": self.worker_id
-        })
+        response = self.client.send_message(self.register_message())
         
         if response.get("status") != "ok":
             print("Registration failed")
             return False
+        self.apply_settings(response)
                
         print("Successfully registered with coordinator")
         self.running = True
+        self.stop_event.clear()
+        
+        # Heartbeats run on their own timer so slow fetches never delay them
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
         
-        # Start main processing loop
+        # Start main processing loop; returns once the worker is draining
         self._process_tasks()
+        self.stopped.wait()
         
         return True
         
     def _process_tasks(self):
         """Main task processing loop"""
-        while self.running:
+        while self.running and not self.draining.is_set():
             try:
-                # Send heartbeat
-                self.client.send_message({
-                    "action": "heartbeat",
-                    "worker_id": self.worker_id
-                })
+                # Wait for a free slot, then lease as many tasks as we have slots
+                if not self.limiter.acquire(timeout=1):
+                    continue
+                slots = 1
+                while self.limiter.try_acquire():
+                    slots += 1
                 
-                # Request a task
-                response = self.client.send_message({
-                    "action": "get_task",
-                    "worker_id": self.worker_id
-                })
+                try:
+                    # Blocks on the coordinator until work arrives or poll_wait expires
+                    response = self.client.send_message({
+                        "action": "get_task",
+                        "worker_id": self.worker_id,
+                        "max_tasks": slots,
+                        "wait": self.poll_wait
+                    }, timeout=self.poll_wait + self.request_timeout, retry=False)
+                except Exception:
+                    for _ in range(slots):
+                        self.limiter.release()
+                    raise
                 
+                self._check_drain(response)
+                tasks = []
                 if response.get("status") == "ok" and response.get("has_task", False):
-                    task = response.get("task")
+                    tasks = response.get("tasks") or [response.get("task")]
+                
+                for task in tasks:
                     print(f"Received task {task['id']} for URL: {task['url']}")
-                    
-                    try:
-                        # Process the task
-                        html = self.scrape_url(task['url'])
-                        result = self.process_html(html)
-                        
-                        # Submit result back to coordinator
-                        self.client.send_message({
-                            "action": "submit_result",
-                            "worker_id": self.worker_id,
-                            "task_id": task['id'],
-                            "result": result,
-                            "error": None
-                        })
-                        
-                        print(f"Completed task {task['id']}")
-                        
-                    except Exception as e:
-                        # Report error back to coordinator
-                        print(f"Error processing task {task['id']}: {str(e)}")
-                        self.client.send_message({
-                            "action": "submit_result",
-                            "worker_id": self.worker_id,
-                            "task_id": task['id'],
-                            "result": None,
-                            "error": str(e)
-                        })
-                else:
-                    # No task available, wait a bit
-                    time.sleep(2)
+                    with self.idle:
+                        self.in_flight[task['id']] = task
+                    threading.Thread(target=self._run_task, args=(task,), daemon=True).start()
+                
+                # Give back the slots the coordinator did not fill
+                for _ in range(slots - len(tasks)):
+                    self.limiter.release()
                     
             except Exception as e:
+                if self.draining.is_set():
+                    break
                 print(f"Error in worker loop: {str(e)}")
                 time.sleep(5)  # Wait before retry on error
+    
+    def _heartbeat_loop(self):
+        """Send a heartbeat every heartbeat_interval seconds until stopped"""
+        while True:
+            try:
+                response = self.client.send_message(self.heartbeat_message())
+                self._check_drain(response)
+                self.apply_settings(response)
+            except Exception as e:
+                print(f"Error sending heartbeat: {str(e)}")
+            profiler.maybe_dump()
+            if self.stop_event.wait(self.heartbeat_interval):
+                break
+    
+    def register_message(self):
+        """Registration, listing the tasks this worker is still working on"""
+        with self.idle:
+            held = list(self.in_flight)
+        if self.results:
+            held += self.results.task_ids()
+        return {"action": "register", "worker_id": self.worker_id, "held_tasks": held,
+                "settings_version": self.settings_version}
+    
+    def resume(self, response):
+        """Handle the reply to re-registration after a reconnect"""
+        self.apply_settings(response)
+        lost = response.get("lost_tasks") or []
+        if not lost:
+            return
+        print(f"Dropping {len(lost)} tasks the coordinator no longer leases to us")
+        with self.idle:
+            self.lost_tasks.update(task_id for task_id in lost if task_id in self.in_flight)
+        if self.results:
+            self.results.discard(lost)
+    
+    def _check_drain(self, response):
+        """Start a graceful stop when the coordinator asks this worker to drain"""
+        if response.get("drain") and not self.draining.is_set():
+            print("Coordinator requested drain")
+            threading.Thread(target=self.stop, daemon=True).start()
+    
+    def apply_settings(self, response):
+        """Apply tunables the coordinator pushed in a reply, without restarting"""
+        settings = response.get("settings")
+        if settings is None:
+            return
+        for key in ('timeout', 'poll_wait', 'heartbeat_interval'):
+            if key in settings:
+                setattr(self, key, settings[key])
+        if 'request_timeout' in settings:
+            self.request_timeout = self.client.timeout = settings['request_timeout']
+        latency_target = settings.get('latency_target', self.limiter.latency_target)
+        self.limiter.configure(max_limit=settings.get('max_concurrency'), latency_target=latency_target)
+        if 'max_per_host' in settings:
+            max_per_host = settings['max_per_host']
+            if not max_per_host:
+                self.host_limiters = None
+            elif self.host_limiters is None:
+                self.host_limiters = HostLimiters(max_per_host, latency_target)
+            else:
+                self.host_limiters.configure(max_per_host, latency_target)
+        self.settings_version = response.get("settings_version", self.settings_version)
+        print(f"Applied settings version {self.settings_version} from coordinator")
+    
+    def heartbeat_message(self):
+        """Build a heartbeat carrying capacity, throughput and resource usage"""
+        message = {
+            "action": "heartbeat",
+            "worker_id": self.worker_id,
+            "throughput": self.throughput.rate(),
+            "settings_version": self.settings_version
+        }
+        message.update(self.limiter.snapshot())
+        message.update(resource_usage())
+        if self.dns_cache:
+            message.update(self.dns_cache.stats())
+        return message
+    
+    def _run_task(self, task):
+        """Fetch and process one task, holding a concurrency slot"""
+        latency = None
+        overloaded = False
+        try:
+            start = time.monotonic()
+            try:
+                html = self._fetch(task['url'])
+            finally:
+                latency = time.monotonic() - start
+            if self.result_cache is None:
+                result = self.process_html(html, task['url'], task.get('extract_links', False))
+                fields = {}
+            else:
+                result, fields = self.deduplicated_result(task, html)
+            
+            # Submit result back to coordinator
+            message = {
+                "action": "submit_result",
+                "worker_id": self.worker_id,
+                "task_id": task['id'],
+                "result": result,
+                "error": None
+            }
+            message.update(fields)
+            self._submit(message)
+            
+            self.throughput.record()
+            print(f"Completed task {task['id']}")
+            
+        except Exception as e:
+            # Report error back to coordinator
+            print(f"Error processing task {task['id']}: {str(e)}")
+            overloaded = self.is_overload_error(e)
+            try:
+                self._submit({
+                    "action": "submit_result",
+                    "worker_id": self.worker_id,
+                    "task_id": task['id'],
+                    "result": None,
+                    "error": str(e),
+                    # Timeouts and 5xx count against the host's circuit breaker
+                    "host_failure": overloaded
+                })
+            except Exception as send_error:
+                print(f"Error reporting task {task['id']}: {str(send_error)}")
+        finally:
+            self.limiter.release(latency, overloaded)
+            with self.idle:
+                self.in_flight.pop(task['id'], None)
+                self.idle.notify_all()
+    
+    def _submit(self, message):
+        with self.idle:
+            if message['task_id'] in self.lost_tasks:
+                self.lost_tasks.discard(message['task_id'])
+                return  # The coordinator would refuse it
+        if self.results:
+            self.results.put(message)
+        else:
+            self.client.send_message(message)
+    
+    def _submit_batch(self, messages):
+        """Send buffered results in one request, a single attempt so failures spill.
+
+        Returns the ids of tasks whose results the coordinator refused.
+        """
+        response = self.client.request({"action": "submit_results", "worker_id": self.worker_id,
+                                        "results": messages}).result(timeout=self.request_timeout)
+        if response.get("status") != "ok":
+            raise ConnectionError(response.get("message", "Results not accepted"))
+        return response.get("rejected", [])
+    
+    def deduplicated_result(self, task, html):
+        """Reuse the result of a page with the same content, parsing only on a miss.
+
+        Checks the local cache, then the coordinator's fingerprint index if
+        remote_lookup is on. Returns the result and the fingerprint fields
+        to submit with it.
+        """
+        fields = {"fingerprint": fingerprint(html)}
+        if self.near_duplicates:
+            fields["simhash"] = simhash(html)
+        
+        match = self.result_cache.get(fields["fingerprint"])
+        if match is None and self.remote_lookup:
+            match = self.lookup_fingerprint(fields)
+        if match:
+            fields["duplicate_of"] = match[0]
+            return dict(match[1]), fields
+        
+        result = self.process_html(html, task['url'], task.get('extract_links', False))
+        # Links of a duplicate page were already reported with the original
+        cached = {key: value for key, value in result.items() if key != 'outlinks'}
+        self.result_cache.put(fields["fingerprint"], (task['id'], cached))
+        return result, fields
+    
+    def lookup_fingerprint(self, fields):
+        """Ask the coordinator for a page already parsed by any worker"""
+        try:
+            response = self.client.send_message(dict(fields, action="lookup_fingerprint",
+                                                     worker_id=self.worker_id))
+        except Exception as e:
+            print(f"Fingerprint lookup failed: {str(e)}")
+            return None
+        if not response.get("found"):
+            return None
+        match = (response["task_id"], response["result"])
+        self.result_cache.put(fields["fingerprint"], match)
+        return match
+    
+    def _fetch(self, url):
+        """Fetch a URL, holding a per-host slot if per-host limits are enabled"""
+        host_limiters = self.host_limiters  # Can be swapped by apply_settings
+        if host_limiters is None:
+            return self.scrape_url(url)
+        
+        host_limiter = host_limiters.get(urlparse(url).netloc)
+        host_limiter.acquire()
+        latency = None
+        overloaded = False
+        start = time.monotonic()
+        try:
+            html = self.scrape_url(url)
+            latency = time.monotonic() - start
+            return html
+        except Exception as e:
+            latency = time.monotonic() - start
+            overloaded = self.is_overload_error(e)
+            raise
+        finally:
+            host_limiter.release(latency, overloaded)
+    
+    @staticmethod
+    def is_overload_error(error):
+        """Check if an error means the target is overloaded and we should back off"""
+        import requests
+        if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+            return True
+        if isinstance(error, FetchError):
+            return error.status_code >= 500 or error.status_code == 429
+        return False
+        
+    def wait_idle(self, timeout):
+        """Wait up to timeout seconds for in-flight tasks; returns the ids still running"""
+        deadline = time.monotonic() + timeout
+        with self.idle:
+            while self.in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.idle.wait(remaining)
+            return list(self.in_flight)
+    
+    def stop(self, drain_timeout=None):
+        """Stop leasing, let in-flight tasks finish, return the rest and leave"""
+        with self.stop_lock:
+            if self.draining.is_set():
+                leaving = False
+            else:
+                self.draining.set()
+                leaving = True
+        if not leaving:
+            self.stopped.wait()
+            return
+        
+        timeout = self.drain_timeout if drain_timeout is None else drain_timeout
+        if self.client.connected:
+            try:
+                # Ends our long poll at once and stops further leases
+                self.client.send_message({"action": "drain", "worker_id": self.worker_id})
+            except Exception as e:
+                print(f"Error starting drain: {str(e)}")
+        
+        unfinished = self.wait_idle(timeout)
+        if self.results and not self.results.flush(timeout):
+            print(f"{self.results.pending()} results not yet submitted, keeping them in {self.results.spill_path}")
+        if self.client.connected:
+            try:
+                if unfinished:
+                    self.client.send_message({"action": "return_tasks", "worker_id": self.worker_id,
+                                              "task_ids": unfinished})
+                    print(f"Returned {len(unfinished)} unfinished tasks")
+                self.client.send_message({"action": "unregister", "worker_id": self.worker_id})
+            except Exception as e:
+                print(f"Error leaving coordinator: {str(e)}")
         
-    def stop(self):
-        """Stop the worker"""
         self.running = False
+        self.stop_event.set()
+        if self.results:
+            self.results.close()
         self.client.disconnect()
+        if self.dns_cache:
+            self.dns_cache.uninstall()
+        self.stopped.set()
         print("Worker stopped")
         
+    @staticmethod
+    def preload():
+        """Import requests and BeautifulSoup ahead of the first task"""
+        import requests
+        import bs4
+    
+    @profiler.profiled('worker.scrape_url')
     def scrape_url(self, url):
         """Fetch content from URL"""
+        import requests
         headers = {'User-Agent': self.user_agent}
         response = requests.get(url, headers=headers, timeout=self.timeout)
         if response.status_code == 200:
             return response.text
         else:
-            raise Exception(f"HTTP error {response.status_code}")
-            
-    # Replace the current process_html method (around line 105-117) with this:
-
-    def process_html(self, html):
-        """Extract data from HTML content"""
-        import sys
-        # Increase recursion limit for complex pages
-        old_limit = sys.getrecursionlimit()
-        sys.setrecursionlimit(5000)  # Set a higher limit
+            raise FetchError(response.status_code)
     
-        try:
-            # Use html.parser instead of lxml for more stability
-            soup = BeautifulSoup(html, 'html.parser')
-            title = soup.title.string if soup.title else "No title found"
-        
-            # Extract limited data to avoid recursion issues
-            links = len(list(soup.find_all('a', limit=1000)))
-            images = len(list(soup.find_all('img', limit=500)))
-        
-            # Extract more data as needed
-            data = {
-                "title": title,
-                "links": links,
-                "images": images
-            }
-            
-            return data
-        finally:
-            # Restore original recursion limit
-            sys.setrecursionlimit(old_limit)
-
-def load_config():
-    """Load configuration from settings.json file."""
-    try:
-        with open('config/settings.json', 'r') as config_file:
-            return json.load(config_file)
-    except Exception as e:
-        print(f"Error loading configuration: {e}")
-        # Provide default values if config file cannot be loaded
-        return {
-            "timeout": 30,
-            "user_agent": "Mozilla/5.0",
-            "coordinator_host": "localhost",
-            "coordinator_port": 5000
+    @profiler.profiled('worker.process_html')
+    def process_html(self, html, base_url=None, extract_links=False):
+        """Extract data from HTML content, plus new outbound links in crawl mode"""
+        from bs4 import BeautifulSoup
+        # Use html.parser instead of lxml for more stability
+        soup = BeautifulSoup(html, 'html.parser')
+        # .string is a NavigableString that references the whole parse tree;
+        # pickling it for submission walks the tree and can blow the stack
+        title = str(soup.title.string) if soup.title and soup.title.string else "No title found"
+        
+        anchors = soup.find_all('a', limit=1000)
+        links = len(anchors)
+        images = len(list(soup.find_all('img', limit=500)))
+        
+        # Extract more data as needed
+        data = {
+            "title": title,
+            "links": links,
+            "images": images
         }
+        if extract_links:
+            data["outlinks"] = self.extract_links(anchors, base_url)
+        
+        return data
+
+    def extract_links(self, anchors, base_url):
+        """Normalized links from a page, each once.
+
+        Repeats across pages are left to the coordinator's seen set: only it
+        knows whether a link was queued or refused by scope, depth or budget.
+        """
+        outlinks = {}
+        for anchor in anchors:
+            href = anchor.get('href')
+            url = normalize_url(href, base_url) if href else None
+            if url:
+                outlinks[url] = None
+        return list(outlinks)
 
 def main():
-    # Load configuration
     config = load_config()
+    profiler.configure(config.get("profiling"))
+    
+    # With several coordinator shards each worker serves the shard its id hashes to
+    worker_id = str(uuid.uuid4())
+    shards = config.get("shards")
+    if shards:
+        home = ShardRouter(shards).shard_for_worker(worker_id)
+        host, port = home["host"], home["port"]
+    else:
+        host = config["coordinator_host"]
+        port = config["coordinator_port"]
     
     # Create and start worker
+    buffering = config["result_buffer"]
     worker = WorkerClient(
-        coordinator_host=config.get("coordinator_host", "localhost"),
-        coordinator_port=config.get("coordinator_port", 5000),
-        user_agent=config.get("user_agent", "Mozilla/5.0"),
-        timeout=config.get("timeout", 30)
+        coordinator_host=host,
+        coordinator_port=port,
+        worker_id=worker_id,
+        user_agent=config["user_agent"],
+        timeout=config["timeout"],
+        max_concurrency=config["max_concurrency"],
+        latency_target=config["latency_target"],
+        max_per_host=config["max_per_host"],
+        poll_wait=config["poll_wait"],
+        heartbeat_interval=config["heartbeat_interval"],
+        max_frame_size=config["max_frame_size"],
+        compression_threshold=config["compression_threshold"],
+        dns_cache_ttl=config["dns_cache_ttl"],
+        dedup=config["dedup"]["enabled"],
+        dedup_cache_size=config["dedup"]["cache_size"],
+        near_duplicates=config["dedup"]["near_duplicates"],
+        remote_lookup=config["dedup"]["remote_lookup"],
+        drain_timeout=config["drain_timeout"],
+        request_timeout=config["request_timeout"],
+        result_spill_path=resolve_path(buffering["spill_path"]) if buffering["enabled"] else None,
+        result_buffer_size=buffering["max_size"],
+        result_batch_size=buffering["batch_size"]
     )
     
-    # Start the worker and keep running until interrupted
-    if worker.start():
-        try:
-            # Keep main thread alive
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            print("Shutting down worker...")
-            worker.stop()
-    else:
-        print("Failed to start worker")
+    # SIGTERM from a deploy drains the worker the same way Ctrl+C does
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=worker.stop, daemon=True).start())
+    
+    # Blocks until the worker is stopped or the coordinator drains it
+    try:
+        if not worker.start():
+            print("Failed to start worker")
+    except KeyboardInterrupt:
+        print("Shutting down worker...")
+        worker.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import unittest
+from src.utils.config import load_config, validate, ConfigWatcher, DEFAULTS
+from src.coordinator_server import CoordinatorServer
+from src.worker_client import WorkerClient
+
+
+class TestLoadConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'settings.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, settings):
+        with open(self.path, 'w') as f:
+            json.dump(settings, f)
+
+    def test_file_and_environment_override_defaults(self):
+        self.write({"max_concurrency": 4, "dedup": {"cache_size": 5}})
+        config = load_config(self.path, environ={
+            "SCRAPER_POLL_WAIT": "3",
+            "SCRAPER_LATENCY_TARGET": "2",
+            "SCRAPER_USER_AGENT": "test-bot",
+            "SCRAPER_DEDUP__ENABLED": "false"
+        })
+        self.assertEqual(config["max_concurrency"], 4)
+        self.assertEqual((config["poll_wait"], config["latency_target"], config["user_agent"]), (3, 2.0, "test-bot"))
+        self.assertEqual(config["dedup"], dict(DEFAULTS["dedup"], cache_size=5, enabled=False))
+        self.assertEqual(config["worker_timeout"], DEFAULTS["worker_timeout"])
+
+    def test_missing_file_uses_defaults(self):
+        self.assertEqual(load_config(self.path, environ={}), DEFAULTS)
+
+    def test_wrong_type_raises(self):
+        self.write({"max_concurrency": "lots"})
+        with self.assertRaises(ValueError):
+            load_config(self.path, environ={})
+        self.write({})
+        with self.assertRaises(ValueError):
+            load_config(self.path, environ={"SCRAPER_DEDUP__ENABLED": "maybe"})
+
+    def test_durations_take_fractions(self):
+        self.write({"timeout": 2.5, "poll_wait": 0.5, "circuit_breaker": {"reset_timeout": 1.5}})
+        config = load_config(self.path, environ={})
+        self.assertEqual((config["timeout"], config["poll_wait"]), (2.5, 0.5))
+        self.assertEqual(config["circuit_breaker"]["reset_timeout"], 1.5)
+        self.assertEqual(validate('heartbeat_interval', 2), 2.0)
+        with self.assertRaises(ValueError):
+            validate('max_concurrency', 2.5)
+
+    def test_repo_settings_are_valid(self):
+        load_config(environ={})
+
+    def test_watcher_reloads_changed_file(self):
+        self.write({"max_concurrency": 4})
+        watcher = ConfigWatcher(self.path)
+        self.assertIsNone(watcher.poll())
+        self.write({"max_concurrency": 12})
+        os.utime(self.path, ns=(0, watcher.mtime + 1))
+        self.assertEqual(watcher.poll()["max_concurrency"], 12)
+        # A broken edit keeps the old settings
+        with open(self.path, 'w') as f:
+            f.write('{')
+        os.utime(self.path, ns=(0, watcher.mtime + 1))
+        self.assertIsNone(watcher.poll())
+
+
+class TestSettingsPush(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = CoordinatorServer(port=0)
+        self.coordinator.settings = load_config(environ={}).tunables()
+
+    def tearDown(self):
+        self.coordinator.socket.close()
+
+    def test_changes_reach_workers_once(self):
+        coordinator = self.coordinator
+        worker = WorkerClient('localhost', 0, 'test-agent', 30, max_concurrency=8, max_per_host=None)
+        worker.limiter.limit = 6
+        coordinator.register_worker(worker.worker_id, None)
+        self.assertNotIn('settings', coordinator.update_heartbeat(worker.worker_id, worker.heartbeat_message()))
+
+        self.assertEqual(sorted(coordinator.update_settings({"max_concurrency": 2, "max_per_host": 3,
+                                                             "request_timeout": 10})),
+                         ["max_concurrency", "max_per_host", "request_timeout"])
+        response = coordinator.update_heartbeat(worker.worker_id, worker.heartbeat_message())
+        worker.apply_settings(response)
+        self.assertEqual((worker.limiter.max_limit, worker.limiter.current_limit), (2, 2))
+        self.assertEqual((worker.host_limiters.max_per_host, worker.client.timeout), (3, 10))
+        self.assertNotIn('settings', coordinator.update_heartbeat(worker.worker_id, worker.heartbeat_message()))
+
+    def test_coordinator_tunables(self):
+        coordinator = self.coordinator
+        coordinator.update_settings({"worker_timeout": 90, "circuit_breaker": {"failure_threshold": 2}})
+        self.assertEqual((coordinator.liveness.timeout, coordinator.breakers.failure_threshold), (90, 2))
+        self.assertEqual(coordinator.breakers.reset_timeout, DEFAULTS["circuit_breaker"]["reset_timeout"])
+        # Nothing a worker uses changed, so nothing is pushed
+        self.assertEqual(coordinator.settings_version, 0)
+        with self.assertRaises(ValueError):
+            coordinator.update_settings({"coordinator_port": 1})
+        with self.assertRaises(ValueError):
+            coordinator.update_settings({"max_concurrency": "many"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,23 @@
+import os
+import socket
+import tempfile
+import threading
+import time
 import unittest
 from src.coordinator.scheduler import Scheduler
+from src.coordinator_server import CoordinatorServer, MAX_SKIPPED_PER_LEASE
+from src.coordinator.liveness import LivenessTracker
+from src.coordinator.sharding import ConsistentHashRing, ShardRouter, shard_name
+from src.coordinator.crawl import CrawlPolicy
+from src.models.task import Task
+from src.utils.urls import normalize_url
+from src.coordinator.dedup import FingerprintIndex
+from src.coordinator.circuit import CircuitBreakers
+from src.utils.fingerprint import fingerprint, simhash, hamming_distance
+from src.worker_client import WorkerClient
+from src.utils.network import MessageServer
+from benchmarks.stub_server import StubSite
+from concurrent.futures import Future
 from unittest.mock import patch, MagicMock
 
 class TestScheduler(unittest.TestCase):
@@ -24,5 +42,608 @@ class TestScheduler(unittest.TestCase):
         self.assertEqual(result, ['worker1', 'worker2'])
         mock_monitor_workers.assert_called_once()
 
+class TestCoordinatorDispatch(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = CoordinatorServer(port=0)
+
+    def tearDown(self):
+        self.coordinator.socket.close()
+
+    def register(self, worker_id, free_slots):
+        self.coordinator.register_worker(worker_id, None)
+        self.coordinator.update_heartbeat(worker_id, {'free_slots': free_slots, 'in_flight': 0})
+
+    def test_heartbeat_updates_status_and_capacity(self):
+        self.register('w1', 4)
+        self.register('w2', 0)
+        registry = self.coordinator.worker_registry
+        self.assertEqual(registry['w1']['status'], 'available')
+        self.assertEqual(registry['w2']['status'], 'busy')
+        self.assertEqual(self.coordinator.total_free_slots, 4)
+
+    def test_full_lease_when_work_is_plentiful(self):
+        self.register('w1', 4)
+        for i in range(10):
+            self.coordinator.add_task(f'http://example.com/{i}', priority=i)
+        response = self.coordinator.assign_task('w1', 4)
+        self.assertEqual(len(response['tasks']), 4)
+        self.assertEqual([t['priority'] for t in response['tasks']], [9, 8, 7, 6])
+        self.assertEqual(self.coordinator.total_free_slots, 0)
+
+    def test_scarce_work_shared_by_free_slots(self):
+        self.register('idle', 6)
+        self.register('loaded', 2)
+        for i in range(4):
+            self.coordinator.add_task(f'http://example.com/{i}')
+        self.assertEqual(self.coordinator.lease_size('idle', 6), 3)
+        self.assertEqual(self.coordinator.lease_size('loaded', 2), 1)
+
+    def test_empty_queue(self):
+        self.register('w1', 2)
+        self.assertFalse(self.coordinator.assign_task('w1', 2)['has_task'])
+
+    def test_long_poll_wakes_on_new_task(self):
+        self.coordinator.running = True
+        self.register('w1', 1)
+        threading.Timer(0.1, self.coordinator.add_task, args=('http://example.com',)).start()
+
+        start = time.monotonic()
+        response = self.coordinator.assign_task('w1', 1, wait=5)
+        self.assertTrue(response['has_task'])
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_long_poll_times_out(self):
+        self.coordinator.running = True
+        start = time.monotonic()
+        self.assertFalse(self.coordinator.assign_task('w1', 1, wait=0.1)['has_task'])
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_resuming_worker_learns_which_tasks_were_lost(self):
+        self.register('w1', 2)
+        self.coordinator.add_tasks(['http://example.com/1', 'http://example.com/2'])
+        kept, lost = self.coordinator.assign_task('w1', 2)['tasks']
+        self.coordinator.queue.release([lost['id']])
+
+        response = self.coordinator.process_message(
+            {'action': 'register', 'worker_id': 'w1', 'held_tasks': [kept['id'], lost['id']]}, None)
+        self.assertEqual(response, {'status': 'ok', 'lost_tasks': [lost['id']]})
+
+    def test_resuming_worker_releases_leases_it_never_received(self):
+        self.register('w1', 2)
+        self.coordinator.add_tasks(['http://example.com/1', 'http://example.com/2'])
+        kept, unseen = self.coordinator.assign_task('w1', 2)['tasks']
+
+        self.coordinator.process_message(
+            {'action': 'register', 'worker_id': 'w1', 'held_tasks': [kept['id']]}, None)
+        self.assertEqual([task.id for task in self.coordinator.queue.active_tasks()], [kept['id']])
+        self.assertEqual(self.coordinator.queue.pending_count(), 1)
+
+    def test_spilled_results_keep_their_leases_across_reconnect(self):
+        self.register('w1', 2)
+        self.coordinator.add_tasks(['http://example.com/1', 'http://example.com/2'])
+        tasks = self.coordinator.assign_task('w1', 2)['tasks']
+        online = threading.Event()
+
+        def request(message):
+            future = Future()
+            if online.is_set():
+                future.set_result(self.coordinator.process_message(message, None))
+            else:
+                future.set_exception(ConnectionError("coordinator unreachable"))
+            return future
+
+        with tempfile.TemporaryDirectory() as directory:
+            worker = WorkerClient('localhost', 0, 'test-agent', 5, worker_id='w1', dns_cache_ttl=0,
+                                  result_spill_path=os.path.join(directory, 'spill.jsonl'))
+            worker.client = MagicMock()
+            worker.client.request.side_effect = request
+            worker.results.retry_interval = 0.05
+            worker.results.start()
+            for task in tasks:
+                worker._submit({"action": "submit_result", "worker_id": 'w1', "task_id": task['id'],
+                                "result": {"title": "t"}, "error": None})
+            self.assertFalse(worker.results.flush(0.3))
+            self.assertEqual(worker.results.spilled, 2)
+
+            # Reconnect: the spilled results still claim their leases
+            response = self.coordinator.process_message(worker.register_message(), None)
+            self.assertEqual(response['lost_tasks'], [])
+            self.assertEqual(len(self.coordinator.queue.active_tasks()), 2)
+            online.set()
+            self.assertTrue(worker.results.flush(5))
+            worker.results.close()
+        self.assertEqual((worker.results.sent, worker.results.rejected), (2, 0))
+        self.assertEqual(set(self.coordinator.completed_tasks), {task['id'] for task in tasks})
+
+class TestLiveness(unittest.TestCase):
+
+    def test_expired_returns_only_stale_workers(self):
+        tracker = LivenessTracker(timeout=10)
+        tracker.touch('a', now=100)
+        tracker.touch('b', now=105)
+        tracker.touch('a', now=112)
+        self.assertEqual(tracker.expired(now=116), ['b'])
+        self.assertEqual(tracker.expired(now=116), [])
+        self.assertEqual(len(tracker), 1)
+
+    def test_dead_worker_tasks_are_requeued(self):
+        coordinator = CoordinatorServer(port=0, worker_timeout=0)
+        coordinator.register_worker('w1', None)
+        coordinator.add_task('http://example.com')
+        coordinator.assign_task('w1', 1)
+        self.assertEqual(len(coordinator.tasks), 1)
+
+        time.sleep(0.01)
+        self.assertEqual(coordinator.check_workers(), ['w1'])
+        self.assertEqual(coordinator.worker_registry['w1']['status'], 'offline')
+        self.assertEqual(len(coordinator.tasks), 0)
+        self.assertEqual(coordinator.pending_tasks[0].status, 'pending')
+
+        # Any later message brings the worker back
+        coordinator.process_message({'action': 'heartbeat', 'worker_id': 'w1'}, None)
+        self.assertEqual(coordinator.worker_registry['w1']['status'], 'available')
+        coordinator.socket.close()
+
+class TestSharding(unittest.TestCase):
+
+    def test_ring_moves_few_keys_when_growing(self):
+        keys = [f'site{i}.example' for i in range(2000)]
+        ring = ConsistentHashRing(['a', 'b', 'c'])
+        before = {key: ring.get_node(key) for key in keys}
+        ring.add_node('d')
+        moved = [key for key in keys if ring.get_node(key) != before[key]]
+        # Only keys taken over by the new node move, roughly a quarter of them
+        self.assertTrue(all(ring.get_node(key) == 'd' for key in moved))
+        self.assertLess(len(moved), len(keys) * 0.4)
+
+    def test_same_domain_same_shard(self):
+        router = ShardRouter([{'host': 'h', 'port': p} for p in (1, 2, 3)])
+        self.assertEqual(router.shard_for_url('http://Example.com/a'),
+                         router.shard_for_url('https://example.com:8443/b?c=d'))
+
+    def test_foreign_urls_forwarded_to_owner(self):
+        owner = CoordinatorServer(host='127.0.0.1', port=0)
+        owner.start()
+        shards = [{'host': '127.0.0.1', 'port': 1},
+                  {'host': '127.0.0.1', 'port': owner.socket.getsockname()[1]}]
+        local = CoordinatorServer(host='127.0.0.1', port=1, shards=shards, shard_index=0)
+        owner.shards, owner.shard, owner.router = shards, shards[1], ShardRouter(shards)
+        try:
+            urls = [f'http://site{i}.example/' for i in range(50)]
+            task_ids = local.add_tasks(urls)
+            self.assertEqual(len(task_ids), 50)
+            self.assertEqual(len(local.pending_tasks) + len(owner.pending_tasks), 50)
+            self.assertTrue(all(local.router.owns(shards[0], t.url) for t in local.pending_tasks))
+            self.assertTrue(all(owner.router.owns(shards[1], t.url) for t in owner.pending_tasks))
+        finally:
+            local.router.close()
+            local.socket.close()
+            owner.stop()
+
+    def test_job_progress_covers_every_shard(self):
+        owner = CoordinatorServer(host='127.0.0.1', port=0)
+        owner.start()
+        shards = [{'host': '127.0.0.1', 'port': 1},
+                  {'host': '127.0.0.1', 'port': owner.socket.getsockname()[1]}]
+        local = CoordinatorServer(host='127.0.0.1', port=1, shards=shards, shard_index=0)
+        owner.shards, owner.shard, owner.router = shards, shards[1], ShardRouter(shards)
+        try:
+            job_id, _ = local.submit_job([f'http://site{i}.example/' for i in range(50)], name='spread')
+            self.assertLess(local.job_progress(job_id, local=True)['total'], 50)
+            progress = local.job_progress(job_id)
+            self.assertEqual((progress['total'], progress['remaining'], progress['name'], progress['state']),
+                             (50, 50, 'spread', 'running'))
+        finally:
+            local.router.close()
+            owner.router.close()
+            local.socket.close()
+            owner.stop()
+
+    def test_unreachable_shard_does_not_block(self):
+        # Accepts connections but never answers, like a hung coordinator
+        silent = socket.socket()
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(5)
+        shards = [{'host': '127.0.0.1', 'port': 1},
+                  {'host': '127.0.0.1', 'port': silent.getsockname()[1]}]
+        local = CoordinatorServer(host='127.0.0.1', port=0, shards=shards, shard_index=0)
+        local.router = ShardRouter(shards, timeout=0.2, max_retries=0)
+        try:
+            start = time.monotonic()
+            urls = [f'http://site{i}.example/' for i in range(50)]
+            self.assertEqual(len(local.add_tasks(urls)), 50)
+            # Kept here instead of lost
+            self.assertEqual(len(local.pending_tasks), 50)
+            job_id, _ = local.submit_job(['http://other.example/'])
+            self.assertTrue(local.cancel_job(job_id))
+            self.assertLess(time.monotonic() - start, 5)
+        finally:
+            local.router.close()
+            local.socket.close()
+            silent.close()
+
+    def test_dropped_shard_connection_is_replaced(self):
+        owner = CoordinatorServer(host='127.0.0.1', port=0)
+        owner.start()
+        shards = [{'host': '127.0.0.1', 'port': 1},
+                  {'host': '127.0.0.1', 'port': owner.socket.getsockname()[1]}]
+        router = ShardRouter(shards, timeout=2)
+        try:
+            name = shard_name(shards[1])
+            router.broadcast({"action": "job_status", "job_id": 'x'}, exclude=shards[0])
+            dropped = router.clients[name]
+            dropped._fail(dropped.generation, ConnectionError("connection reset"))
+            # The next broadcast reconnects instead of failing with "Not connected"
+            router.broadcast({"action": "job_status", "job_id": 'x'}, exclude=shards[0])
+            self.assertIsNot(router.clients[name], dropped)
+            self.assertTrue(router.clients[name].connected)
+        finally:
+            router.close()
+            owner.stop()
+
+    def test_refused_urls_are_kept_locally(self):
+        class RefusingShard(MessageServer):
+            def process_message(self, message, client):
+                return {"status": "error", "message": "refused"}
+
+        refusing = RefusingShard(host='127.0.0.1', port=0)
+        refusing.start()
+        shards = [{'host': '127.0.0.1', 'port': 1},
+                  {'host': '127.0.0.1', 'port': refusing.socket.getsockname()[1]}]
+        local = CoordinatorServer(host='127.0.0.1', port=0, shards=shards, shard_index=0)
+        local.router = ShardRouter(shards, timeout=2)
+        try:
+            urls = [f'http://site{i}.example/' for i in range(20)]
+            self.assertEqual(len(local.add_tasks(urls)), 20)
+            self.assertEqual(len(local.pending_tasks), 20)
+        finally:
+            local.router.close()
+            local.socket.close()
+            refusing.stop()
+
+class TestCrawl(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = CoordinatorServer(port=0, crawl=CrawlPolicy(enabled=True, max_depth=1, max_pages=3))
+        self.coordinator.register_worker('w1', None)
+
+    def tearDown(self):
+        self.coordinator.socket.close()
+
+    def complete(self, task, outlinks):
+        return self.coordinator.submit_task_result({
+            'task_id': task['id'], 'result': {'title': 't', 'outlinks': outlinks}, 'error': None})
+
+    def test_normalize_url(self):
+        self.assertEqual(normalize_url('../b#frag', 'HTTP://Example.COM:80/a/c'), 'http://example.com/b')
+        self.assertEqual(normalize_url('https://x.org:443'), 'https://x.org/')
+        self.assertEqual(normalize_url('http://x.org:8080/p?q=1'), 'http://x.org:8080/p?q=1')
+        self.assertIsNone(normalize_url('mailto:someone@x.org'))
+        self.assertIsNone(normalize_url('javascript:void(0)', 'http://x.org/'))
+
+    def test_scope(self):
+        parent = 'http://www.example.com/'
+        self.assertTrue(CrawlPolicy(scope='same_host').in_scope(parent, 'http://www.example.com/a'))
+        self.assertFalse(CrawlPolicy(scope='same_host').in_scope(parent, 'http://blog.example.com/a'))
+        self.assertTrue(CrawlPolicy(scope='same_domain').in_scope(parent, 'http://blog.example.com/a'))
+        self.assertTrue(CrawlPolicy(scope=['example.com']).in_scope(parent, 'http://a.example.com/'))
+        self.assertFalse(CrawlPolicy(scope=['example.com']).in_scope(parent, 'http://other.org/'))
+
+    def test_links_enqueued_once_within_scope_and_budget(self):
+        self.coordinator.add_task('http://example.com/', priority=5)
+        seed = self.coordinator.assign_task('w1')['task']
+        self.assertTrue(seed['extract_links'])
+        self.complete(seed, ['http://example.com/a', 'http://example.com/a#top', 'http://example.com/',
+                             'http://other.org/', 'http://example.com/b', 'http://example.com/c',
+                             'http://example.com/d'])
+
+        pending = self.coordinator.pending_tasks
+        # Seed is not requeued, duplicates and other hosts are dropped, budget caps the rest
+        self.assertEqual([t.url for t in pending],
+                         ['http://example.com/a', 'http://example.com/b', 'http://example.com/c'])
+        self.assertTrue(all(t.depth == 1 and t.priority == 5 for t in pending))
+        self.assertNotIn('outlinks', self.coordinator.completed_tasks[seed['id']].result)
+
+        # Pages at max_depth are not expanded
+        child = self.coordinator.assign_task('w1')['task']
+        self.assertFalse(child['extract_links'])
+
+    def test_disabled_policy_keeps_no_state(self):
+        policy = CrawlPolicy()
+        self.assertTrue(policy.mark_seen('http://example.com/'))
+        self.assertTrue(policy.mark_seen('http://example.com/'))
+        self.assertEqual(policy.select_links(Task('http://example.com/'), ['http://example.com/a']), [])
+
+class TestDedup(unittest.TestCase):
+
+    PAGE = "<html><title>Mirror</title><body>" + " ".join(f"word{i}" for i in range(200)) + "</body></html>"
+
+    def test_simhash_close_for_near_duplicates(self):
+        variant = self.PAGE.replace("word7 ", "session123 ")
+        other = "<html>" + " ".join(f"other{i}" for i in range(200)) + "</html>"
+        self.assertNotEqual(fingerprint(self.PAGE), fingerprint(variant))
+        self.assertLessEqual(hamming_distance(simhash(self.PAGE), simhash(variant)), 3)
+        self.assertGreater(hamming_distance(simhash(self.PAGE), simhash(other)), 10)
+
+    def test_index_exact_and_near_lookup(self):
+        index = FingerprintIndex()
+        index.add('fp1', 't1', {'title': 'a'}, simhash=0b1011)
+        self.assertEqual(index.lookup('fp1'), ('t1', {'title': 'a'}))
+        self.assertEqual(index.lookup('fp2', simhash=0b0011), ('t1', {'title': 'a'}))
+        self.assertIsNone(index.lookup('fp2', simhash=0b1111 << 40 | 0b0100))
+        self.assertIsNone(index.lookup('fp2'))
+        self.assertEqual((index.hits, index.lookups), (2, 4))
+
+    def test_index_evicts_oldest(self):
+        index = FingerprintIndex(max_size=2)
+        for i in range(3):
+            index.add(f'fp{i}', f't{i}', {}, simhash=i << 20)
+        self.assertIsNone(index.lookup('fp0'))
+        self.assertIsNotNone(index.lookup('fp2'))
+        self.assertNotIn((1, 0), index.bands)
+
+    def test_duplicate_result_reuses_original(self):
+        coordinator = CoordinatorServer(port=0, fingerprints=FingerprintIndex())
+        try:
+            coordinator.add_tasks(['http://a.example/', 'http://b.example/'])
+            first, second = coordinator.assign_task('w1', 2)['tasks']
+            self.assertFalse(coordinator.lookup_fingerprint('fp')['found'])
+            coordinator.submit_task_result({'task_id': first['id'], 'result': {'title': 'x'},
+                                            'fingerprint': 'fp'})
+            match = coordinator.process_message({'action': 'lookup_fingerprint', 'fingerprint': 'fp'}, None)
+            self.assertEqual((match['task_id'], match['result']), (first['id'], {'title': 'x'}))
+
+            coordinator.submit_task_result({'task_id': second['id'], 'result': match['result'],
+                                            'fingerprint': 'fp', 'duplicate_of': first['id']})
+            self.assertEqual(coordinator.completed_tasks[second['id']].result,
+                             {'title': 'x', 'duplicate_of': first['id']})
+            self.assertEqual((len(coordinator.fingerprints), coordinator.duplicates), (1, 1))
+        finally:
+            coordinator.socket.close()
+
+    def test_no_index_unless_workers_ask(self):
+        coordinator = CoordinatorServer(port=0)
+        try:
+            coordinator.add_tasks(['http://a.example/'])
+            task = coordinator.assign_task('w1', 1)['tasks'][0]
+            coordinator.submit_task_result({'task_id': task['id'], 'result': {'title': 'x'}, 'fingerprint': 'fp'})
+            self.assertIsNone(coordinator.fingerprints)
+            self.assertFalse(coordinator.lookup_fingerprint('fp')['found'])
+            self.assertEqual(coordinator.completed_tasks[task['id']].result, {'title': 'x'})
+        finally:
+            coordinator.socket.close()
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = CoordinatorServer(port=0)
+
+    def tearDown(self):
+        self.coordinator.socket.close()
+
+    def finish(self, task, error=None):
+        self.coordinator.submit_task_result({'task_id': task['id'], 'result': {}, 'error': error})
+
+    def test_progress_counts_update_as_tasks_finish(self):
+        coordinator = self.coordinator
+        job_id, task_ids = coordinator.submit_job([f'http://example.com/{i}' for i in range(3)], name='batch')
+        self.assertEqual(len(task_ids), 3)
+        coordinator.add_task('http://example.com/other')
+
+        tasks = coordinator.assign_task('w1', 4)['tasks']
+        self.assertEqual(sum(t['job_id'] == job_id for t in tasks), 3)
+        job_tasks = [t for t in tasks if t['job_id'] == job_id]
+        self.finish(job_tasks[0])
+        self.finish(job_tasks[1], error='HTTP error 500')
+        progress = coordinator.process_message({'action': 'job_status', 'job_id': job_id}, None)['job']
+        self.assertEqual((progress['total'], progress['completed'], progress['failed'], progress['remaining']),
+                         (3, 1, 1, 1))
+        self.assertEqual((progress['name'], progress['state']), ('batch', 'running'))
+
+        self.finish(job_tasks[2])
+        self.assertEqual(coordinator.job_progress(job_id)['state'], 'done')
+
+    def test_cancel_drops_pending_tasks_at_dispatch(self):
+        coordinator = self.coordinator
+        job_id, _ = coordinator.submit_job([f'http://example.com/{i}' for i in range(1000)], priority=5)
+        coordinator.add_tasks(['http://example.com/keep'], priority=1)
+        in_flight = coordinator.assign_task('w1', 1)['task']
+
+        self.assertEqual(coordinator.process_message({'action': 'cancel_job', 'job_id': job_id}, None),
+                         {'status': 'ok'})
+        # Cancelling does not search the queue; nothing is dropped until dispatch
+        progress = coordinator.job_progress(job_id)
+        self.assertEqual((progress['state'], progress['cancelled']), ('cancelling', 0))
+        # Tasks waiting to be dropped are not reported as pending
+        self.assertEqual((coordinator.queue.pending_count(), coordinator.pending_count()), (1000, 1))
+
+        # A single pass drops a bounded slice under the lock
+        self.assertEqual(coordinator._lease_live('w1', 1), [])
+        self.assertEqual(coordinator.job_progress(job_id)['cancelled'], MAX_SKIPPED_PER_LEASE)
+        # The next lease skips the rest of the cancelled job's tasks
+        response = coordinator.assign_task('w1', 1)
+        self.assertEqual(response['task']['url'], 'http://example.com/keep')
+        self.finish(in_flight)
+        progress = coordinator.job_progress(job_id)
+        self.assertEqual((progress['completed'], progress['cancelled'], progress['state']), (1, 999, 'cancelled'))
+        self.assertEqual(coordinator.queue.active_count(), 1)
+        # Later tasks for a cancelled job are refused
+        self.assertEqual(coordinator.add_tasks(['http://example.com/late'], job_id=job_id), [])
+
+    def test_unknown_job(self):
+        response = self.coordinator.process_message({'action': 'cancel_job', 'job_id': 'nope'}, None)
+        self.assertEqual(response['status'], 'error')
+        self.assertIsNone(self.coordinator.job_progress('nope'))
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = CoordinatorServer(port=0, breakers=CircuitBreakers(failure_threshold=2,
+                                                                               reset_timeout=10))
+
+    def tearDown(self):
+        self.coordinator.socket.close()
+
+    def finish(self, task, error=None, host_failure=None):
+        message = {'task_id': task['id'], 'result': {}, 'error': error}
+        if host_failure is not None:
+            message['host_failure'] = host_failure
+        self.coordinator.submit_task_result(message)
+
+    def test_failing_host_is_parked_and_probed(self):
+        coordinator = self.coordinator
+        coordinator.add_tasks([f'http://down.example/{i}' for i in range(2)], priority=5)
+        for task in coordinator.assign_task('w1', 2)['tasks']:
+            self.finish(task, error='timed out', host_failure=True)
+        self.assertEqual(coordinator.breakers.state('down.example'), 'open')
+
+        coordinator.add_tasks([f'http://down.example/more{i}' for i in range(3)], priority=5)
+        coordinator.add_tasks(['http://up.example/'])
+        # Only the healthy host is dispatched; the rest are parked
+        tasks = coordinator.assign_task('w1', 4)['tasks']
+        self.assertEqual([t['url'] for t in tasks], ['http://up.example/'])
+        self.assertEqual(coordinator.breakers.parked_count, 3)
+        self.assertEqual(coordinator.queue.pending_count(), 0)
+
+        # After the cooldown a single probe goes out; its failure doubles the wait
+        self.assertEqual(coordinator.release_probes(now=time.time() + 11), 1)
+        probe = coordinator.assign_task('w1', 4)['task']
+        self.assertEqual(coordinator.breakers.state('down.example'), 'half_open')
+        self.finish(probe, error='HTTP error 503', host_failure=True)
+        self.assertEqual(coordinator.breakers.circuits['down.example']['timeout'], 20)
+        self.assertEqual(coordinator.release_probes(now=time.time() + 11), 0)
+
+        # A successful probe closes the circuit and requeues everything parked
+        self.assertEqual(coordinator.release_probes(now=time.time() + 21), 1)
+        self.finish(coordinator.assign_task('w1', 1)['task'])
+        self.assertEqual(coordinator.breakers.state('down.example'), 'closed')
+        self.assertEqual(coordinator.breakers.parked_count, 0)
+        self.assertEqual(len(coordinator.assign_task('w1', 4)['tasks']), 1)
+
+    def test_dead_host_backlog_is_parked_a_slice_at_a_time(self):
+        coordinator = self.coordinator
+        coordinator.running = True
+        coordinator.add_tasks([f'http://down.example/{i}' for i in range(2)], priority=5)
+        for task in coordinator.assign_task('w1', 2)['tasks']:
+            self.finish(task, error='timed out', host_failure=True)
+        backlog = MAX_SKIPPED_PER_LEASE * 3
+        coordinator.add_tasks([f'http://down.example/more{i}' for i in range(backlog)], priority=5)
+        coordinator.add_tasks(['http://up.example/'])
+
+        coordinator._lease_live('w1', 10)
+        self.assertLess(coordinator.queue.deferred_count(), MAX_SKIPPED_PER_LEASE + 10)
+        # A long poll keeps going, a slice per turn of the lock, until it finds work
+        tasks = coordinator.assign_task('w1', 1, wait=5)['tasks']
+        self.assertEqual([t['url'] for t in tasks], ['http://up.example/'])
+        self.assertEqual(coordinator.queue.deferred_count(), backlog)
+        self.assertEqual(coordinator.breakers.parked_count, backlog)
+
+    def test_page_errors_do_not_open_the_circuit(self):
+        coordinator = self.coordinator
+        coordinator.add_tasks([f'http://example.com/{i}' for i in range(3)])
+        for task in coordinator.assign_task('w1', 3)['tasks']:
+            self.finish(task, error='HTTP error 404', host_failure=False)
+        self.assertEqual(coordinator.breakers.state('example.com'), 'closed')
+
+    def test_success_resets_failure_count(self):
+        breakers = CircuitBreakers(failure_threshold=2)
+        breakers.record('a.example', True)
+        breakers.record('a.example', False)
+        breakers.record('a.example', True)
+        self.assertEqual(breakers.state('a.example'), 'closed')
+        self.assertEqual(breakers.circuits['a.example']['failures'], 1)
+
+    def test_stop_requeues_parked_tasks(self):
+        coordinator = self.coordinator
+        coordinator.add_tasks([f'http://down.example/{i}' for i in range(3)])
+        for task in coordinator.assign_task('w1', 2)['tasks']:
+            self.finish(task, error='timed out', host_failure=True)
+        coordinator.assign_task('w1', 1)
+        self.assertEqual(coordinator.breakers.parked_count, 1)
+        coordinator.stop()
+        self.assertEqual(coordinator.queue.pending_count(), 1)
+
+class TestDrain(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = CoordinatorServer(host='127.0.0.1', port=0)
+
+    def tearDown(self):
+        self.coordinator.stop()
+
+    def test_drained_worker_gets_no_tasks_and_returns_leases(self):
+        coordinator = self.coordinator
+        coordinator.running = True
+        coordinator.register_worker('w1', None)
+        coordinator.add_tasks([f'http://example.com/{i}' for i in range(3)])
+        leased = coordinator.assign_task('w1', 3)['tasks']
+
+        # A long poll already waiting is woken by the drain
+        threading.Timer(0.1, coordinator.drain_worker, args=('w1',)).start()
+        start = time.monotonic()
+        response = coordinator.assign_task('w1', 1, wait=5)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual((response['has_task'], response['drain']), (False, True))
+        self.assertTrue(coordinator.update_heartbeat('w1', {'free_slots': 2})['drain'])
+        self.assertEqual(coordinator.worker_registry['w1']['status'], 'draining')
+
+        response = coordinator.process_message({'action': 'return_tasks', 'worker_id': 'w1',
+                                                'task_ids': [leased[0]['id']]}, None)
+        self.assertEqual(response['requeued'], 1)
+        self.assertEqual(len(coordinator.pending_tasks), 1)
+
+        coordinator.process_message({'action': 'unregister', 'worker_id': 'w1'}, None)
+        self.assertNotIn('w1', coordinator.worker_registry)
+        self.assertEqual((len(coordinator.pending_tasks), len(coordinator.tasks)), (3, 0))
+        self.assertEqual(coordinator.total_free_slots, 0)
+
+    def test_worker_stop_finishes_or_returns_in_flight_tasks(self):
+        site = StubSite(page_size=500, latency=0.5)
+        site.start()
+        coordinator = self.coordinator
+        coordinator.start()
+        port = coordinator.socket.getsockname()[1]
+        worker = WorkerClient('127.0.0.1', port, 'test-agent', timeout=5, max_concurrency=4,
+                              poll_wait=1, heartbeat_interval=1, dns_cache_ttl=0)
+        try:
+            coordinator.add_tasks(site.urls(2))
+            threading.Thread(target=worker.start, daemon=True).start()
+            deadline = time.monotonic() + 5
+            while coordinator.queue.active_count() < 1 and time.monotonic() < deadline:
+                time.sleep(0.02)
+
+            # Too short to finish the slow page: its lease is handed back at once
+            worker.stop(drain_timeout=0.05)
+            self.assertTrue(worker.stopped.is_set())
+            self.assertNotIn(worker.worker_id, coordinator.worker_registry)
+            self.assertEqual(coordinator.queue.active_count(), 0)
+            self.assertEqual(len(coordinator.pending_tasks) + len(coordinator.completed_tasks), 2)
+        finally:
+            site.stop()
+
+    def test_batched_and_repeated_results(self):
+        coordinator = self.coordinator
+        coordinator.add_tasks(['http://example.com/a', 'http://example.com/b'])
+        leased = coordinator.assign_task('w1', max_tasks=2)['tasks']
+        results = [{'task_id': task['id'], 'result': {}, 'error': None} for task in leased]
+        response = coordinator.process_message({'action': 'submit_results', 'worker_id': 'w1',
+                                                'results': results + [{'task_id': 'unknown'}]}, None)
+        self.assertEqual((response['accepted'], response['rejected']), (2, ['unknown']))
+        self.assertEqual(len(coordinator.completed_tasks), 2)
+        # A replayed result is acknowledged without counting twice
+        self.assertTrue(coordinator.submit_task_result(results[0])['duplicate'])
+        self.assertEqual(len(coordinator.completed_tasks), 2)
+
+    def test_stop_waits_for_leased_results(self):
+        coordinator = self.coordinator
+        coordinator.running = True
+        coordinator.add_task('http://example.com/')
+        task = coordinator.assign_task('w1')['task']
+        threading.Timer(0.2, coordinator.submit_task_result,
+                        args=({'task_id': task['id'], 'result': {}},)).start()
+        coordinator.stop(drain_timeout=5)
+        self.assertIn(task['id'], coordinator.completed_tasks)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
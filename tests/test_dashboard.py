@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from src import dashboard
+from src.dashboard import StateCache, EndpointTimer
+
+
+class TestStateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_state(self, state):
+        with open(self.path, 'w') as f:
+            json.dump(state, f)
+
+    def test_missing_file_returns_empty_state(self):
+        cache = StateCache(self.path)
+        state = cache.get()
+        self.assertEqual(state['stats']['pending'], 0)
+        self.assertEqual(cache.parses, 0)
+
+    def test_parses_once_per_change(self):
+        self.write_state({"stats": {"pending": 1}})
+        cache = StateCache(self.path)
+        for _ in range(5):
+            self.assertEqual(cache.get()['stats']['pending'], 1)
+        self.assertEqual(cache.parses, 1)
+        self.assertEqual(cache.hits, 4)
+
+        self.write_state({"stats": {"pending": 22}})
+        self.assertEqual(cache.get()['stats']['pending'], 22)
+        self.assertEqual(json.loads(cache.get_json())['stats']['pending'], 22)
+        self.assertEqual(cache.parses, 2)
+
+    def test_corrupt_file_keeps_last_good_state(self):
+        self.write_state({"stats": {"pending": 3}})
+        cache = StateCache(self.path)
+        cache.get()
+        with open(self.path, 'w') as f:
+            f.write('{"stats": ')
+        self.assertEqual(cache.get()['stats']['pending'], 3)
+
+
+class TestDashboardEndpoints(unittest.TestCase):
+
+    def test_endpoints_are_timed(self):
+        client = dashboard.app.test_client()
+        self.assertEqual(client.get('/api/state').status_code, 200)
+        self.assertEqual(client.get('/').status_code, 200)
+
+        timings = client.get('/api/timings').get_json()
+        self.assertGreaterEqual(timings['endpoints']['api_state']['count'], 1)
+        self.assertGreaterEqual(timings['endpoints']['dashboard']['count'], 1)
+
+    def test_timer_summary(self):
+        timer = EndpointTimer()
+        for ms in range(1, 101):
+            timer.record('view', ms / 1000)
+        summary = timer.summary()['view']
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['max_ms'], 100)
+        self.assertAlmostEqual(summary['p99_ms'], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import csv
+import os
+import tempfile
+import unittest
+from src.coordinator.export import ResultExporter, flatten
+from src.coordinator_server import CoordinatorServer
+from src.models.task import Task
+from unittest.mock import MagicMock
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def finished_task(i, result=None, error=None):
+    task = Task(f'http://example.com/{i}')
+    task.update_status('failed' if error else 'completed')
+    task.result = result
+    task.error = error
+    return task
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_flatten(self):
+        self.assertEqual(flatten({'title': 'a', 'meta': {'lang': 'en'}, 'tags': ['x']}, 'result.'),
+                         {'result.title': 'a', 'result.meta.lang': 'en', 'result.tags': '["x"]'})
+
+    def test_csv_written_in_chunks(self):
+        path = os.path.join(self.dir.name, 'out', 'results.csv')
+        exporter = ResultExporter(path, chunk_size=2)
+        for i in range(3):
+            exporter.write(finished_task(i, {'title': f'page {i}', 'links': i}))
+        # Two full chunks hit the file, the partial one is still buffered
+        self.assertEqual((exporter.exported, len(exporter.rows)), (2, 1))
+        exporter.write(finished_task(3, error='HTTP error 500'))
+        exporter.write(finished_task(4, {'title': 'late', 'links': 1, 'new_key': 1}))
+        self.assertEqual(exporter.close(), 5)
+
+        rows = self.read_csv(path)
+        self.assertEqual(len(rows), 4)
+        self.assertIn('result.title', rows[0])
+        self.assertEqual((rows[1]['url'], rows[1]['result.links']), ('http://example.com/1', '1'))
+        self.assertEqual((rows[3]['status'], rows[3]['error'], rows[3]['result.title']),
+                         ('failed', 'HTTP error 500', ''))
+        # The new key starts a part file with a column for it
+        self.assertEqual(self.read_csv(os.path.join(self.dir.name, 'out', 'results.1.csv'))[0]['result.new_key'], '1')
+
+    def read_csv(self, path):
+        with open(path, newline='') as f:
+            return list(csv.DictReader(f))
+
+    def test_results_after_a_chunk_of_failures_are_kept(self):
+        path = os.path.join(self.dir.name, 'results.csv')
+        exporter = ResultExporter(path, chunk_size=2)
+        exporter.write_all([finished_task(i, error='timed out') for i in range(2)])
+        exporter.write_all([finished_task(i, {'title': 'ok'}) for i in range(2, 4)])
+        exporter.close()
+        self.assertNotIn('result.title', self.read_csv(path)[0])
+        self.assertEqual([row['result.title'] for row in self.read_csv(os.path.join(self.dir.name, 'results.1.csv'))],
+                         ['ok', 'ok'])
+
+    def test_append_keeps_earlier_runs(self):
+        path = os.path.join(self.dir.name, 'results.csv')
+        ResultExporter(path, append=True).write_all([finished_task(i, {'title': 'a'}) for i in range(2)]).close()
+        ResultExporter(path, append=True).write_all([finished_task(2, {'title': 'b'})]).close()
+        self.assertEqual([row['result.title'] for row in self.read_csv(path)], ['a', 'a', 'b'])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet_row_groups(self):
+        path = os.path.join(self.dir.name, 'results.parquet')
+        exporter = ResultExporter(path, chunk_size=2)
+        for i in range(5):
+            exporter.write(finished_task(i, {'title': f'page {i}', 'links': i}))
+        exporter.close()
+        parquet = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual((parquet.metadata.num_rows, parquet.metadata.num_row_groups), (5, 3))
+        self.assertEqual(parquet.read().column('result.links').to_pylist(), [0, 1, 2, 3, 4])
+
+        # A restarted export starts a new part instead of overwriting this one
+        ResultExporter(path, append=True).write_all([finished_task(5, {'title': 'x', 'links': 5})]).close()
+        self.assertEqual(pyarrow.parquet.ParquetFile(path).metadata.num_rows, 5)
+        later = pyarrow.parquet.ParquetFile(os.path.join(self.dir.name, 'results.1.parquet'))
+        self.assertEqual(later.read().column('result.links').to_pylist(), [5])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet_value_of_another_type(self):
+        path = os.path.join(self.dir.name, 'results.parquet')
+        exporter = ResultExporter(path, chunk_size=1)
+        exporter.write(finished_task(0, {'code': 200}))
+        exporter.write(finished_task(1, {'code': 'n/a'}))
+        exporter.write(finished_task(2, {'code': 404}))
+        self.assertEqual((exporter.close(), exporter.rows), (3, []))
+        self.assertEqual(pyarrow.parquet.ParquetFile(path).read().column('result.code').to_pylist(), [200])
+        later = pyarrow.parquet.ParquetFile(os.path.join(self.dir.name, 'results.1.parquet'))
+        self.assertEqual(later.read().column('result.code').to_pylist(), ['n/a', '404'])
+
+    def test_export_errors_do_not_refuse_results(self):
+        exporter = MagicMock()
+        exporter.write.side_effect = OSError("disk full")
+        coordinator = CoordinatorServer(port=0, exporter=exporter)
+        try:
+            coordinator.add_tasks(['http://example.com/1'])
+            task = coordinator.assign_task('w1', 1)['tasks'][0]
+            response = coordinator.submit_task_result({'task_id': task['id'], 'result': {'title': 't'}})
+            self.assertEqual(response['status'], 'ok')
+            self.assertIn(task['id'], coordinator.completed_tasks)
+        finally:
+            coordinator.socket.close()
+
+    def test_coordinator_export(self):
+        coordinator = CoordinatorServer(port=0)
+        try:
+            coordinator.add_tasks([f'http://example.com/{i}' for i in range(3)])
+            for task in coordinator.assign_task('w1', 3)['tasks']:
+                coordinator.submit_task_result({'task_id': task['id'], 'result': {'title': 't'}})
+            path = os.path.join(self.dir.name, 'results.csv')
+            self.assertEqual(coordinator.export_results(path, chunk_size=2), 3)
+        finally:
+            coordinator.socket.close()
+
+if __name__ == '__main__':
+    unittest.main()
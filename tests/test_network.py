@@ -0,0 +1,252 @@
+import socket
+import threading
+import time
+import unittest
+import zlib
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from src.utils.network import (MessageServer, MessageClient, FrameTooLargeError,
+                               COMPRESSED_FLAG, encode_frame, read_frame, decompress)
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+class TestFraming(unittest.TestCase):
+
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_round_trip_uncompressed(self):
+        self.left.sendall(encode_frame({"action": "heartbeat"}))
+        self.assertEqual(read_frame(self.right), {"action": "heartbeat"})
+
+    def test_large_payload_compressed_above_threshold(self):
+        message = {"result": {"text": "lorem ipsum " * 2000}}
+        frame = encode_frame(message, codec='zlib', threshold=1024)
+        self.assertTrue(int.from_bytes(frame[:4], 'big') & COMPRESSED_FLAG)
+        self.assertLess(len(frame), len(encode_frame(message)) / 10)
+
+        self.left.sendall(frame)
+        self.assertEqual(read_frame(self.right, codec='zlib'), message)
+
+    def test_small_payload_left_uncompressed(self):
+        frame = encode_frame({"status": "ok"}, codec='zlib', threshold=1024)
+        self.assertFalse(int.from_bytes(frame[:4], 'big') & COMPRESSED_FLAG)
+
+    def test_oversized_frame_rejected_before_reading_body(self):
+        self.left.sendall((1 << 30).to_bytes(4, 'big'))
+        with self.assertRaises(FrameTooLargeError):
+            read_frame(self.right, max_frame_size=1024 * 1024)
+
+    def test_compressed_frame_cannot_inflate_past_limit(self):
+        bomb = zlib.compress(b"\0" * (4 * 1024 * 1024))
+        self.left.sendall((len(bomb) | COMPRESSED_FLAG).to_bytes(4, 'big') + bomb)
+        with self.assertRaises(FrameTooLargeError):
+            read_frame(self.right, max_frame_size=1024 * 1024, codec='zlib')
+
+    @unittest.skipIf(lz4 is None, "lz4 is not installed")
+    def test_lz4_frame_cannot_inflate_past_limit(self):
+        bomb = lz4.frame.compress(b"\0" * (4 * 1024 * 1024))
+        with self.assertRaises(FrameTooLargeError):
+            decompress('lz4', bomb, 1024 * 1024)
+        self.assertEqual(decompress('lz4', lz4.frame.compress(b"ok"), 2), b"ok")
+
+
+class EchoServer(MessageServer):
+
+    def process_message(self, message, client):
+        return {"status": "ok", "echo": message}
+
+
+class RecordingServer(EchoServer):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = []
+
+    def process_message(self, message, client):
+        self.seen.append(message)
+        return super().process_message(message, client)
+
+
+class TestNegotiation(unittest.TestCase):
+
+    def setUp(self):
+        self.server = EchoServer(host='127.0.0.1', port=0, max_frame_size=64 * 1024)
+        self.server.start()
+        self.port = self.server.socket.getsockname()[1]
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_codec_negotiated_on_first_message(self):
+        client = MessageClient(host='127.0.0.1', port=self.port, compression_threshold=16)
+        client.connect()
+        response = client.send_message({"action": "register"})
+        self.assertEqual(response["echo"], {"action": "register"})
+        self.assertIsNotNone(client.codec)
+
+        payload = {"action": "submit_result", "result": "x" * 10000}
+        self.assertEqual(client.send_message(payload)["echo"], payload)
+        client.disconnect()
+
+    def test_compression_can_be_disabled(self):
+        client = MessageClient(host='127.0.0.1', port=self.port, compression=False)
+        client.connect()
+        client.send_message({"action": "register"})
+        self.assertIsNone(client.codec)
+        client.disconnect()
+
+    def test_server_rejects_oversized_frame(self):
+        client = MessageClient(host='127.0.0.1', port=self.port, compression=False)
+        client.connect()
+        response = client.send_message({"blob": b"\1" * (128 * 1024)})
+        self.assertEqual(response["status"], "error")
+        client.disconnect()
+
+
+class SlowPollServer(EchoServer):
+
+    def is_blocking(self, message):
+        return message.get("action") == "get_task"
+
+    def process_message(self, message, client):
+        if message.get("action") == "get_task":
+            time.sleep(0.5)
+        return super().process_message(message, client)
+
+
+class TestMultiplexing(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SlowPollServer(host='127.0.0.1', port=0)
+        self.server.start()
+        self.client = MessageClient(host='127.0.0.1', port=self.server.socket.getsockname()[1])
+        self.client.connect()
+        self.client.send_message({"action": "register"})
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.server.stop()
+
+    def test_responses_arrive_out_of_order(self):
+        poll = self.client.request({"action": "get_task"})
+        start = time.monotonic()
+        self.assertEqual(self.client.send_message({"action": "submit_result"})["echo"],
+                         {"action": "submit_result"})
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertFalse(poll.done())
+        self.assertEqual(poll.result(timeout=2)["echo"], {"action": "get_task"})
+
+    def test_concurrent_requests_get_their_own_responses(self):
+        results = {}
+
+        def call(i):
+            results[i] = self.client.send_message({"action": "heartbeat", "n": i})["echo"]["n"]
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {i: i for i in range(20)})
+
+    def test_untagged_requests_still_answered_in_order(self):
+        sock = socket.create_connection(('127.0.0.1', self.server.socket.getsockname()[1]))
+        try:
+            sock.sendall(encode_frame({"action": "get_task"}) + encode_frame({"action": "heartbeat"}))
+            self.assertEqual(read_frame(sock)["echo"], {"action": "get_task"})
+            self.assertEqual(read_frame(sock)["echo"], {"action": "heartbeat"})
+        finally:
+            sock.close()
+
+
+class TestReconnect(unittest.TestCase):
+
+    def setUp(self):
+        self.server = EchoServer(host='127.0.0.1', port=0)
+        self.server.start()
+        self.port = self.server.socket.getsockname()[1]
+        self.client = MessageClient(host='127.0.0.1', port=self.port, timeout=1, backoff_base=0.05)
+        self.client.connect()
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.server.stop()
+
+    def restart_server(self, server_class=RecordingServer):
+        self.server.stop()
+        time.sleep(0.2)
+        self.server = server_class(host='127.0.0.1', port=self.port)
+        self.server.start()
+
+    def test_resumes_after_server_restart(self):
+        self.client.resume_message = lambda: {"action": "register", "worker_id": "w1"}
+        self.client.send_message({"action": "heartbeat"})
+        threading.Thread(target=self.restart_server).start()
+        time.sleep(0.1)
+        self.assertEqual(self.client.send_message({"action": "heartbeat"})["status"], "ok")
+        # The session is re-established before the request is retried
+        self.assertEqual([m["action"] for m in self.server.seen], ["register", "heartbeat"])
+
+    def test_read_timeout_reconnects_and_retries(self):
+        calls = []
+
+        class StallOnce(MessageServer):
+            def process_message(self, message, client):
+                calls.append(message)
+                if len(calls) == 1:
+                    time.sleep(1.5)
+                return {"status": "ok"}
+
+        self.restart_server(StallOnce)
+        start = time.monotonic()
+        self.assertEqual(self.client.send_message({"action": "heartbeat"})["status"], "ok")
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(len(calls), 2)
+
+    def test_resume_reply_is_handed_over(self):
+        replies = []
+        self.client.resume_message = lambda: {"action": "register", "worker_id": "w1"}
+        self.client.on_resume = replies.append
+        self.restart_server()
+        self.client.send_message({"action": "heartbeat"})
+        self.assertEqual([reply["echo"]["action"] for reply in replies], ["register"])
+
+    def test_unsafe_request_is_not_resent(self):
+        calls = []
+
+        class StallPolls(MessageServer):
+            def process_message(self, message, client):
+                calls.append(message)
+                if message["action"] == "get_task":
+                    time.sleep(1.5)
+                return {"status": "ok"}
+
+        self.restart_server(StallPolls)
+        self.client.send_message({"action": "heartbeat"})
+        with self.assertRaises((ConnectionError, FutureTimeoutError)):
+            self.client.send_message({"action": "get_task"}, retry=False)
+        self.assertEqual(self.client.send_message({"action": "heartbeat"})["status"], "ok")
+        self.assertEqual([m["action"] for m in calls], ["heartbeat", "get_task", "heartbeat"])
+
+    def test_gives_up_after_max_retries(self):
+        self.client.max_retries = 2
+        self.server.stop()
+        with self.assertRaises(ConnectionError):
+            self.client.send_message({"action": "heartbeat"})
+
+    def test_no_reconnect_after_disconnect(self):
+        self.client.disconnect()
+        with self.assertRaises(ConnectionError):
+            self.client.send_message({"action": "heartbeat"})
+
+
+if __name__ == '__main__':
+    unittest.main()
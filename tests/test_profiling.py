@@ -0,0 +1,87 @@
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+from src.utils.profiling import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.profiler = Profiler(output_dir=self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_disabled_collects_nothing(self):
+        @self.profiler.profiled('hook')
+        def work():
+            return sum(range(100))
+
+        self.assertEqual(work(), 4950)
+        self.assertEqual(self.profiler.names(), [])
+        self.assertEqual(self.profiler.dump(), [])
+
+    def test_enabled_profiles_and_dumps(self):
+        @self.profiler.profiled('outer')
+        def outer():
+            return inner() + 1
+
+        @self.profiler.profiled('inner')
+        def inner():
+            return sum(range(100))
+
+        self.profiler.enabled = True
+        for _ in range(3):
+            self.assertEqual(outer(), 4951)
+
+        # Nested hooks run inside the outer profile instead of their own
+        self.assertEqual(self.profiler.names(), ['outer'])
+        self.assertIn('3 calls', self.profiler.summary('outer'))
+
+        paths = self.profiler.dump()
+        self.assertEqual(len(paths), 1)
+        self.assertTrue(os.path.exists(paths[0]))
+        pstats.Stats(paths[0])
+        self.assertEqual(self.profiler.names(), [])
+
+    def test_concurrent_calls_run_unprofiled(self):
+        started, release = threading.Event(), threading.Event()
+
+        @self.profiler.profiled('hook')
+        def work(block):
+            if block:
+                started.set()
+                release.wait(5)
+            return 1
+
+        self.profiler.enabled = True
+        results = []
+        thread = threading.Thread(target=lambda: results.append(work(True)))
+        thread.start()
+        self.assertTrue(started.wait(5))
+        # The profiler is busy in the other thread, so this call is not profiled
+        results.append(work(False))
+        release.set()
+        thread.join()
+        self.assertEqual(results, [1, 1])
+        self.assertIn('1 calls', self.profiler.summary('hook'))
+
+    def test_maybe_dump_respects_interval(self):
+        self.profiler.configure({'enabled': True, 'dump_interval': 3600})
+
+        @self.profiler.profiled('hook')
+        def work():
+            return 1
+
+        work()
+        self.assertEqual(self.profiler.maybe_dump(), [])
+        self.profiler.dump_interval = 0
+        self.assertEqual(len(self.profiler.maybe_dump()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
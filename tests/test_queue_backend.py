@@ -0,0 +1,202 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from src.coordinator.queue_backend import MemoryQueueBackend, RedisQueueBackend, create_queue_backend
+from src.coordinator.frontier import TieredQueueBackend
+from src.models.task import Task
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class QueueBackendTests:
+    """Behaviour every queue backend must share"""
+
+    def make_backend(self, lease_timeout=300):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.queue = self.make_backend()
+
+    def test_highest_priority_first_fifo_within_priority(self):
+        tasks = [Task('http://a/1', priority=1), Task('http://a/2', priority=5),
+                 Task('http://a/3', priority=1), Task('http://a/4', priority=5)]
+        self.queue.push(tasks)
+        leased = self.queue.lease('w1', 3)
+        self.assertEqual([t.url for t in leased], ['http://a/2', 'http://a/4', 'http://a/1'])
+        self.assertTrue(all(t.status == 'in_progress' and t.assigned_worker == 'w1' for t in leased))
+        self.assertEqual(self.queue.pending_count(), 1)
+        self.assertEqual(self.queue.active_count(), 3)
+
+    def test_complete_ends_lease_once(self):
+        task = Task('http://a/1')
+        self.queue.push([task])
+        self.queue.lease('w1', 1)
+        self.assertEqual(self.queue.complete(task.id).url, 'http://a/1')
+        self.assertIsNone(self.queue.complete(task.id))
+        self.assertEqual(self.queue.active_count(), 0)
+
+    def test_requeue_worker(self):
+        self.queue.push([Task(f'http://a/{i}') for i in range(4)])
+        self.queue.lease('w1', 2)
+        self.queue.lease('w2', 1)
+        self.assertEqual(self.queue.requeue_worker('w1'), 2)
+        self.assertEqual(self.queue.pending_count(), 3)
+        self.assertEqual([t.assigned_worker for t in self.queue.active_tasks()], ['w2'])
+        self.assertTrue(all(t.status == 'pending' for t in self.queue.pending_tasks()))
+
+    def test_worker_leases(self):
+        self.queue.push([Task(f'http://a/{i}') for i in range(5)])
+        first = self.queue.lease('w1', 3)
+        self.queue.lease('w2', 1)
+        self.queue.complete(first[0].id)
+        self.queue.release([first[1].id])
+        self.assertEqual(self.queue.worker_leases('w1'), {first[2].id})
+        self.assertEqual(len(self.queue.worker_leases('w2')), 1)
+        self.assertEqual(self.queue.worker_leases('w3'), set())
+
+    def test_release_returns_only_named_tasks(self):
+        self.queue.push([Task(f'http://a/{i}') for i in range(3)])
+        leased = self.queue.lease('w1', 3)
+        self.assertEqual(self.queue.release([leased[0].id, leased[2].id, 'unknown']), 2)
+        self.assertEqual(self.queue.release([leased[0].id]), 0)
+        self.assertEqual([t.id for t in self.queue.active_tasks()], [leased[1].id])
+        self.assertEqual(self.queue.pending_count(), 2)
+
+    def test_expired_leases_are_requeued(self):
+        self.queue = self.make_backend(lease_timeout=10)
+        task = Task('http://a/1')
+        self.queue.push([task])
+        self.queue.lease('w1', 1)
+        self.assertEqual(self.queue.expire_leases(), 0)
+        self.assertEqual(self.queue.expire_leases(now=2 ** 40), 1)
+        self.assertEqual(self.queue.pending_tasks()[0].id, task.id)
+        # The late result of the expired lease is rejected
+        self.assertIsNone(self.queue.complete(task.id))
+
+    def test_deferred_tasks_wait_until_due_or_undeferred(self):
+        tasks = [Task(f'http://a/{i}') for i in range(3)]
+        self.queue.push(tasks)
+        leased = self.queue.lease('w1', 3)
+        self.assertEqual(self.queue.defer([leased[0].id, leased[1].id, 'unknown'], until=1000), 2)
+        self.assertEqual((self.queue.deferred_count(), self.queue.active_count()), (2, 1))
+        self.assertEqual(self.queue.pending_count(), 0)
+        # A deferred task is not leased, so its late result is rejected
+        self.assertIsNone(self.queue.complete(leased[0].id))
+
+        self.assertEqual(self.queue.undefer_due(now=999), 0)
+        self.assertEqual(self.queue.undefer([leased[1].id]), 1)
+        self.assertEqual(self.queue.undefer([leased[1].id]), 0)
+        self.assertEqual(self.queue.undefer_due(now=1000), 1)
+        self.assertEqual(self.queue.deferred_count(), 0)
+        self.assertEqual({t.id for t in self.queue.pending_tasks()}, {leased[0].id, leased[1].id})
+
+
+class TestMemoryQueueBackend(QueueBackendTests, unittest.TestCase):
+
+    def make_backend(self, lease_timeout=300):
+        return MemoryQueueBackend(lease_timeout=lease_timeout)
+
+
+class TestTieredQueueBackend(QueueBackendTests, unittest.TestCase):
+
+    def make_backend(self, lease_timeout=300, hot_size=8):
+        self.tmpdir = getattr(self, 'tmpdir', None) or tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, f'frontier-{random.random()}.db')
+        return TieredQueueBackend(self.path, hot_size=hot_size, lease_timeout=lease_timeout)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_order_preserved_across_spill_and_refill(self):
+        rng = random.Random(7)
+        tasks = [Task(f'http://a/{i}', priority=rng.randint(1, 5)) for i in range(200)]
+        for start in range(0, len(tasks), 13):
+            self.queue.push(tasks[start:start + 13])
+        self.assertGreater(self.queue.cold_count, 0)
+        self.assertLessEqual(len(self.queue.heap), self.queue.hot_size)
+        self.assertEqual(self.queue.pending_count(), 200)
+
+        expected = [t.id for t in sorted(tasks, key=lambda t: -t.priority)]
+        leased = []
+        while self.queue.pending_count():
+            batch = self.queue.lease('w1', 3)
+            self.assertLessEqual(len(self.queue.heap), self.queue.hot_size)
+            leased.extend(t.id for t in batch)
+        self.assertEqual(leased, expected)
+
+    def test_pending_survives_restart(self):
+        self.queue.push([Task(f'http://a/{i}', priority=i % 3) for i in range(30)])
+        self.queue.lease('w1', 2)
+        self.queue.close()
+
+        reopened = TieredQueueBackend(self.path, hot_size=8)
+        self.assertEqual(reopened.pending_count(), 30)
+        self.assertEqual(reopened.lease('w1', 1)[0].priority, 2)
+        reopened.close()
+
+    def test_deferred_survive_restart(self):
+        self.queue.push([Task('http://a/1')])
+        task = self.queue.lease('w1', 1)[0]
+        self.queue.defer([task.id], until=1000)
+        self.queue.close()
+
+        reopened = TieredQueueBackend(self.path, hot_size=8)
+        self.assertEqual((reopened.deferred_count(), reopened.pending_count()), (1, 0))
+        self.assertEqual(reopened.undefer_due(now=1000), 1)
+        self.assertEqual(reopened.lease('w1', 1)[0].id, task.id)
+        reopened.close()
+
+    def test_pending_tasks_limit_reads_both_tiers(self):
+        self.queue.push([Task(f'http://a/{i}') for i in range(20)])
+        self.assertEqual([t.url for t in self.queue.pending_tasks(limit=12)],
+                         [f'http://a/{i}' for i in range(12)])
+
+    def test_each_shard_has_its_own_frontier(self):
+        config = {"queue_backend": "tiered", "frontier_path": os.path.join(self.tmpdir, 'frontier.db')}
+        first, second = (create_queue_backend(config, shard_index=index) for index in (0, 1))
+        first.push([Task('http://a/1')])
+        self.assertEqual((first.pending_count(), second.pending_count()), (1, 0))
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'frontier-shard1.db')))
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis not installed")
+class TestRedisQueueBackend(QueueBackendTests, unittest.TestCase):
+
+    def make_backend(self, lease_timeout=300):
+        self.redis = fakeredis.FakeRedis()
+        return RedisQueueBackend(self.redis, lease_timeout=lease_timeout)
+
+    def test_two_coordinators_share_one_queue(self):
+        other = RedisQueueBackend(self.redis)
+        self.queue.push([Task(f'http://a/{i}') for i in range(10)])
+        first = self.queue.lease('w1', 6)
+        second = other.lease('w2', 6)
+        self.assertEqual(len(first), 6)
+        self.assertEqual(len(second), 4)
+        self.assertFalse({t.id for t in first} & {t.id for t in second})
+
+    def test_queue_survives_restart(self):
+        self.queue.push([Task('http://a/1', priority=3)])
+        restarted = RedisQueueBackend(self.redis)
+        self.assertEqual(restarted.lease('w1', 1)[0].priority, 3)
+
+    def test_lease_cut_short_leaves_task_leased(self):
+        self.queue.push([Task('http://a/1')])
+        # A coordinator that dies right after taking the task
+        with patch.object(self.queue, '_load', side_effect=ConnectionError("coordinator died")):
+            with self.assertRaises(ConnectionError):
+                self.queue.lease('w1', 1)
+        self.assertEqual((self.queue.pending_count(), self.queue.active_count()), (0, 1))
+        self.assertEqual(self.queue.expire_leases(now=time.time() + 301), 1)
+        self.assertEqual([task.url for task in self.queue.lease('w2', 1)], ['http://a/1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
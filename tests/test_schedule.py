@@ -0,0 +1,118 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from src.coordinator.schedule import Schedule, parse_cron, next_cron_time
+from src.coordinator_server import CoordinatorServer
+
+
+def at(*args):
+    return datetime(*args).timestamp()
+
+
+class TestCron(unittest.TestCase):
+
+    def test_parse_fields(self):
+        fields = parse_cron("*/15 9-17 * * 1-5")
+        self.assertEqual(fields['minute'], {0, 15, 30, 45})
+        self.assertEqual(fields['hour'], set(range(9, 18)))
+        self.assertEqual(fields['weekday'], {1, 2, 3, 4, 5})
+        self.assertEqual(parse_cron("0 0 * * 7")['weekday'], {0})
+        with self.assertRaises(ValueError):
+            parse_cron("61 * * * *")
+        with self.assertRaises(ValueError):
+            parse_cron("* * *")
+
+    def test_next_time(self):
+        # Friday 2024-03-01 17:50 -> next weekday business-hours slot is Monday 09:00
+        fields = parse_cron("0 9-17 * * 1-5")
+        self.assertEqual(next_cron_time(fields, at(2024, 3, 1, 17, 50)), at(2024, 3, 4, 9, 0))
+        self.assertEqual(next_cron_time(parse_cron("30 2 1 * *"), at(2024, 1, 31, 12, 0)), at(2024, 2, 1, 2, 30))
+        # Strictly after: a run at exactly 09:00 moves to the next day
+        self.assertEqual(next_cron_time(parse_cron("0 9 * * *"), at(2024, 3, 1, 9, 0)), at(2024, 3, 2, 9, 0))
+        # Day of month or weekday, as in cron
+        self.assertEqual(next_cron_time(parse_cron("0 0 13 * 5"), at(2024, 3, 2)), at(2024, 3, 8))
+
+
+class TestSchedule(unittest.TestCase):
+
+    def test_interval_runs_released_when_due(self):
+        schedule = Schedule()
+        schedule.add('http://a.example/', interval=60, start=1000)
+        schedule.add('http://b.example/', interval=10, start=1005)
+        self.assertEqual(schedule.due(now=999), [])
+        self.assertEqual([e['url'] for e in schedule.due(now=1005)], ['http://a.example/', 'http://b.example/'])
+        self.assertEqual(schedule.next_due(), 1015)
+        # Missed runs are skipped rather than released in a burst
+        self.assertEqual(len(schedule.due(now=1100)), 2)
+        self.assertEqual(schedule.next_due(), 1105)
+
+    def test_removed_entries_are_skipped(self):
+        schedule = Schedule()
+        keep = schedule.add('http://a.example/', interval=5, start=0)
+        drop = schedule.add('http://b.example/', interval=5, start=0)
+        self.assertTrue(schedule.remove(drop))
+        self.assertFalse(schedule.remove(drop))
+        self.assertEqual([e['id'] for e in schedule.due(now=1)], [keep])
+        self.assertEqual(len(schedule), 1)
+
+    def test_due_touches_only_due_entries(self):
+        schedule = Schedule()
+        for i in range(10000):
+            schedule.add(f'http://site{i}.example/', interval=3600, start=1000 + i)
+        start = time.perf_counter()
+        released = schedule.due(now=1009)
+        self.assertEqual(len(released), 10)
+        self.assertLess(time.perf_counter() - start, 0.05)
+
+    def test_save_and_load(self):
+        schedule = Schedule()
+        schedule.add('http://a.example/', interval=30, start=500, priority=3)
+        schedule.add('http://b.example/', cron="0 * * * *")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'schedule.json')
+            schedule.save(path)
+            restored = Schedule()
+            self.assertEqual(restored.load(path), 2)
+        self.assertEqual({e['url']: e['next_run'] for e in restored.entries.values()},
+                         {e['url']: e['next_run'] for e in schedule.entries.values()})
+        self.assertEqual([e['priority'] for e in restored.due(now=500)], [3])
+
+    def test_coordinator_queues_due_urls(self):
+        coordinator = CoordinatorServer(port=0)
+        try:
+            coordinator.schedule_task('http://a.example/', interval=60, priority=7)
+            response = coordinator.process_message(
+                {'action': 'schedule', 'url': 'http://b.example/', 'cron': 'not cron'}, None)
+            self.assertEqual(response['status'], 'error')
+
+            self.assertEqual(coordinator.release_due_tasks(), 1)
+            self.assertEqual([(t.url, t.priority) for t in coordinator.pending_tasks], [('http://a.example/', 7)])
+            self.assertEqual(coordinator.release_due_tasks(), 0)
+        finally:
+            coordinator.socket.close()
+
+    def test_coordinator_validates_and_saves_schedules(self):
+        coordinator = CoordinatorServer(port=0)
+        try:
+            for url in (None, '  '):
+                response = coordinator.process_message({'action': 'schedule', 'url': url, 'interval': 60}, None)
+                self.assertEqual(response['status'], 'error')
+            self.assertEqual(len(coordinator.schedule), 0)
+
+            with tempfile.TemporaryDirectory() as directory:
+                coordinator.schedule_path = os.path.join(directory, 'schedule.json')
+                schedule_id = coordinator.schedule_task('http://a.example/', interval=60)
+                coordinator.save_schedule()
+                restored = Schedule()
+                self.assertEqual(restored.load(coordinator.schedule_path), 1)
+                coordinator.unschedule(schedule_id)
+                coordinator.save_schedule()
+                self.assertEqual(Schedule().load(coordinator.schedule_path), 0)
+        finally:
+            coordinator.socket.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
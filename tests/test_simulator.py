@@ -0,0 +1,25 @@
+import unittest
+from benchmarks.simulator import parse_args, run, task_outcome, task_urls
+
+
+class TestCoordinatorCapacity(unittest.TestCase):
+    """Small simulated fleet as a regression test for dispatch performance"""
+
+    def test_simulated_fleet(self):
+        options = parse_args(['--workers', '100', '--tasks', '2000', '--fetch-time', '0.005',
+                              '--jitter', '0.005', '--failure-rate', '0.05', '--poll-wait', '0.5',
+                              '--max-seconds', '60'])
+        report = run(options)
+
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(report['workers'], 100)
+        self.assertEqual(report['completed'], 2000)
+        # Failures follow from the seed and URL alone, so the count is exact
+        expected = sum(task_outcome(url, options)[1] for url in task_urls(options))
+        self.assertEqual(report['failed'], expected)
+        # Generous floors; a dispatch regression shows up as an order of magnitude
+        self.assertLess(report['connect_s'], 5)
+        self.assertGreater(report['tasks_per_sec'], 200)
+
+if __name__ == '__main__':
+    unittest.main()
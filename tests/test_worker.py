@@ -1,21 +1,308 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest.mock import MagicMock, patch
 from src.worker.scraper import Scraper
+from src.worker_client import WorkerClient
+from src.worker.concurrency import AdaptiveLimiter
+from src.worker.dns_cache import DNSCache
+from src.worker.result_buffer import ResultBuffer
+from benchmarks.stub_server import StubSite
 
 class TestScraper(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        # Local synthetic site instead of the live example.com
+        cls.site = StubSite(page_size=1000, links=3, images=2, error_rate=0.0)
+        cls.site.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.site.stop()
+
     def setUp(self):
-        self.scraper = Scraper()
+        self.scraper = Scraper(user_agent="test-agent", timeout=5)
 
     def test_scrape_url(self):
-        url = "http://example.com"
+        url = self.site.base_url + "/page/1"
         result = self.scraper.scrape_url(url)
         self.assertIsNotNone(result)
-        self.assertIn("Example Domain", result)
+        self.assertIn("Synthetic /page/1", result)
 
     def test_process_data(self):
         data = "<html><head><title>Example Domain</title></head><body></body></html>"
         processed_data = self.scraper.process_data(data)
-        self.assertEqual(processed_data, {"title": "Example Domain"})  # Example expected output
+        self.assertEqual(processed_data, {"title": "Example Domain", "links": 0, "images": 0})
+        self.assertIs(type(processed_data["title"]), str)
+
+    def test_outlinks_normalized_and_deduplicated(self):
+        worker = WorkerClient('localhost', 0, "test-agent", timeout=5, dns_cache_ttl=0)
+        html = ('<a href="/a">1</a><a href="/a#x">2</a><a href="HTTP://Other.org:80">3</a>'
+                '<a href="mailto:x@y.z">4</a><a>5</a>')
+        result = worker.process_html(html, 'http://example.com/dir/page', extract_links=True)
+        self.assertEqual(result['links'], 5)
+        self.assertEqual(result['outlinks'], ['http://example.com/a', 'http://other.org/'])
+        # Repeats across pages are the coordinator's to drop; a link from an
+        # earlier page may have been refused or lost with its result
+        again = worker.process_html('<a href="/a">1</a><a href="/b">2</a>', 'http://example.com/', True)
+        self.assertEqual(again['outlinks'], ['http://example.com/a', 'http://example.com/b'])
+        self.assertNotIn('outlinks', worker.process_html(html, 'http://example.com/'))
+
+    def test_results_of_lost_tasks_are_dropped(self):
+        worker = WorkerClient('localhost', 0, "test-agent", timeout=5, dns_cache_ttl=0)
+        worker.client = MagicMock()
+        worker.in_flight = {'t1': {}, 't2': {}}
+        worker.resume({"status": "ok", "lost_tasks": ['t1']})
+        for task_id in ('t1', 't2'):
+            worker._submit({"action": "submit_result", "task_id": task_id, "result": {}, "error": None})
+        self.assertEqual([call.args[0]['task_id'] for call in worker.client.send_message.call_args_list], ['t2'])
+        self.assertEqual(worker.lost_tasks, set())
+
+    def test_duplicate_pages_reuse_result(self):
+        worker = WorkerClient('localhost', 0, "test-agent", timeout=5, dns_cache_ttl=0)
+        worker.client = MagicMock()
+        html = "<html><head><title>Mirror</title></head><body></body></html>"
+
+        # The coordinator's index is only asked when remote_lookup is on
+        result, fields = worker.deduplicated_result({'id': 't1', 'url': 'http://a.example/'}, html)
+        self.assertEqual(result['title'], "Mirror")
+        self.assertNotIn('duplicate_of', fields)
+        worker.client.send_message.assert_not_called()
+
+        worker.remote_lookup = True
+        worker.client.send_message.return_value = {"status": "ok", "found": False}
+        worker.deduplicated_result({'id': 't4', 'url': 'http://d.example/'}, "<p>other</p>")
+
+        # Same body: served from the local cache without parsing or asking the coordinator
+        with patch.object(worker, 'process_html') as process_html:
+            again, fields = worker.deduplicated_result({'id': 't2', 'url': 'http://b.example/'}, html)
+        process_html.assert_not_called()
+        self.assertEqual(worker.client.send_message.call_count, 1)
+        self.assertEqual((again, fields['duplicate_of']), (result, 't1'))
+
+        # Unknown locally but already parsed by another worker
+        worker.client.send_message.return_value = {"status": "ok", "found": True,
+                                                   "task_id": 't0', "result": {"title": "Other"}}
+        remote, fields = worker.deduplicated_result({'id': 't3', 'url': 'http://c.example/'}, "<p>new</p>")
+        self.assertEqual((remote, fields['duplicate_of']), ({"title": "Other"}, 't0'))
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_grows_while_saturated_and_healthy(self):
+        limiter = AdaptiveLimiter(initial=1, max_limit=4, latency_target=1.0)
+        for _ in range(20):
+            while limiter.try_acquire():
+                pass
+            limiter.release(latency=0.1)
+        self.assertEqual(limiter.current_limit, 4)
+
+    def test_does_not_grow_when_underused(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=8, latency_target=1.0)
+        for _ in range(20):
+            self.assertTrue(limiter.try_acquire())
+            limiter.release(latency=0.1)
+        self.assertEqual(limiter.current_limit, 2)
+
+    def test_backs_off_on_overload(self):
+        limiter = AdaptiveLimiter(initial=8, max_limit=8, latency_target=1.0)
+        limiter.try_acquire()
+        limiter.release(latency=0.1, overloaded=True)
+        self.assertEqual(limiter.current_limit, 4)
+
+        # Further failures in the same latency window do not compound
+        limiter.try_acquire()
+        limiter.release(latency=0.1, overloaded=True)
+        self.assertEqual(limiter.current_limit, 4)
+
+    def test_slow_responses_back_off(self):
+        limiter = AdaptiveLimiter(initial=4, max_limit=8, latency_target=1.0)
+        limiter.try_acquire()
+        limiter.release(latency=2.0)
+        self.assertEqual(limiter.current_limit, 2)
+        self.assertEqual(limiter.snapshot(), {'concurrency_limit': 2, 'in_flight': 0, 'free_slots': 2})
+
+    def test_acquire_respects_limit(self):
+        limiter = AdaptiveLimiter(initial=1, max_limit=1)
+        self.assertTrue(limiter.acquire(timeout=0.01))
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        limiter.release()
+        self.assertTrue(limiter.acquire(timeout=0.01))
+
+class TestDNSCache(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def resolver(self, host, port, *args):
+        self.calls.append(host)
+        if host.endswith('.invalid'):
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', port))]
+
+    def test_repeat_lookups_hit_cache(self):
+        cache = DNSCache(ttl=60, resolver=self.resolver)
+        for _ in range(5):
+            cache.getaddrinfo('example.com', 443)
+        self.assertEqual(self.calls, ['example.com'])
+        self.assertEqual(cache.stats()['dns_hits'], 4)
+        self.assertAlmostEqual(cache.stats()['dns_hit_rate'], 0.8)
+
+    def test_failures_are_cached_briefly(self):
+        cache = DNSCache(negative_ttl=60, resolver=self.resolver)
+        for _ in range(3):
+            with self.assertRaises(socket.gaierror):
+                cache.getaddrinfo('missing.invalid', 80)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_entries_expire(self):
+        cache = DNSCache(ttl=0, resolver=self.resolver)
+        cache.getaddrinfo('example.com', 443)
+        cache.getaddrinfo('example.com', 443)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_concurrent_lookups_coalesce(self):
+        def slow_resolver(*args):
+            time.sleep(0.1)
+            return self.resolver(*args)
+
+        cache = DNSCache(resolver=slow_resolver)
+        threads = [threading.Thread(target=cache.getaddrinfo, args=('example.com', 443)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, ['example.com'])
+        # Each lookup is counted once, whether it waited or found the answer
+        stats = cache.stats()
+        self.assertEqual(stats['dns_misses'], 1)
+        self.assertEqual(stats['dns_hits'] + stats['dns_coalesced'], 7)
+        self.assertAlmostEqual(stats['dns_hit_rate'], 7 / 8)
+
+    def test_install_patches_socket(self):
+        cache = DNSCache(resolver=self.resolver)
+        cache.install()
+        try:
+            self.assertEqual(socket.getaddrinfo('example.com', 80)[0][4], ('10.0.0.1', 80))
+        finally:
+            cache.uninstall()
+        self.assertNotEqual(socket.getaddrinfo, cache.getaddrinfo)
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_is_light(self):
+        # Import time itself is checked by benchmarks/startup.py, not here
+        code = "import sys, src.worker_client; print('requests' in sys.modules, 'bs4' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout.split()
+        self.assertEqual(output[-2:], ['False', 'False'])
+
+    def test_deeply_nested_page(self):
+        depth = 5000
+        html = '<title>deep</title>' + '<div>' * depth + '<a href="/x">x</a>' + '</div>' * depth
+        limit = sys.getrecursionlimit()
+        result = WorkerClient('localhost', 0, 'test-agent', 5).process_html(html)
+        self.assertEqual((result['title'], result['links']), ('deep', 1))
+        self.assertEqual(sys.getrecursionlimit(), limit)
+
+class TestResultBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'spill.jsonl')
+        self.delivered = []
+        self.online = threading.Event()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def send_batch(self, batch):
+        if not self.online.is_set():
+            raise ConnectionError("coordinator unreachable")
+        self.delivered.extend(result['task_id'] for result in batch)
+        return [result['task_id'] for result in batch if result.get('refused')]
+
+    def test_outage_spills_then_replays_in_order(self):
+        buffer = ResultBuffer(self.send_batch, self.path, max_size=5, batch_size=3, retry_interval=0.05)
+        buffer.start()
+        for i in range(10):
+            buffer.put({'task_id': i})
+        self.assertFalse(buffer.flush(0.3))
+        self.assertTrue(os.path.exists(self.path))
+
+        self.online.set()
+        self.assertTrue(buffer.flush(5))
+        self.assertEqual(self.delivered, list(range(10)))
+        self.assertFalse(os.path.exists(self.path))
+        buffer.close()
+
+    def test_spill_file_survives_restart(self):
+        buffer = ResultBuffer(self.send_batch, self.path, retry_interval=0.05)
+        buffer.put({'task_id': 'a'})
+        buffer.put({'task_id': 'b'})
+        buffer.close()
+        self.assertEqual(self.delivered, [])
+
+        self.online.set()
+        restarted = ResultBuffer(self.send_batch, self.path, retry_interval=0.05)
+        self.assertEqual(restarted.pending(), 2)
+        restarted.start()
+        self.assertTrue(restarted.flush(5))
+        self.assertEqual(self.delivered, ['a', 'b'])
+        restarted.close()
+
+    def test_torn_line_is_skipped(self):
+        # A crash in the middle of spilling leaves a partial last line
+        with open(self.path, 'w') as f:
+            f.write('{"task_id": "a"}\n{"task_id": "b"}\n{"task_id": ')
+        self.online.set()
+        buffer = ResultBuffer(self.send_batch, self.path, retry_interval=0.05)
+        buffer.put({'task_id': 'c'})
+        buffer.start()
+        self.assertTrue(buffer.flush(5))
+        self.assertEqual(self.delivered, ['a', 'b', 'c'])
+        with open(self.path + '.bad') as f:
+            self.assertEqual(f.read(), '{"task_id": \n')
+        # The flusher is still alive
+        buffer.put({'task_id': 'd'})
+        self.assertTrue(buffer.flush(5))
+        self.assertEqual(self.delivered[-1], 'd')
+        buffer.close()
+
+    def test_spilled_tasks_are_reported_and_refusals_are_not_delivered(self):
+        buffer = ResultBuffer(self.send_batch, self.path, retry_interval=0.05)
+        buffer.put({'task_id': 'a'})
+        buffer.put({'task_id': 'b', 'refused': True})
+        buffer.put({'task_id': 'c'})
+        buffer.close()
+        restarted = ResultBuffer(self.send_batch, self.path, retry_interval=0.05)
+        self.assertEqual(sorted(restarted.task_ids()), ['a', 'b', 'c'])
+        restarted.discard(['c'])
+        self.assertEqual(sorted(restarted.task_ids()), ['a', 'b'])
+
+        self.online.set()
+        restarted.start()
+        self.assertTrue(restarted.flush(5))
+        self.assertEqual(self.delivered, ['a', 'b'])
+        self.assertEqual((restarted.sent, restarted.rejected), (1, 1))
+        self.assertEqual(restarted.task_ids(), [])
+        restarted.close()
+
+    def test_each_buffer_locks_its_own_file(self):
+        first = ResultBuffer(self.send_batch, self.path)
+        second = ResultBuffer(self.send_batch, self.path)
+        self.assertEqual(first.spill_path, self.path)
+        self.assertNotEqual(second.spill_path, self.path)
+        second.close()
+        first.close()
+        reclaimed = ResultBuffer(self.send_batch, self.path)
+        self.assertEqual(reclaimed.spill_path, self.path)
+        reclaimed.close()
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()